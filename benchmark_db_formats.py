@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Сравнение форматов снимков JSON базы simple_app (см. web_serializers)
+Для каждого размера базы и каждого доступного формата измеряется время
+записи снимка заказов (с fsync), время загрузки новым процессом
+(разбор + построение индексов) и размер файла.
+
+Запуск:
+    python benchmark_db_formats.py
+    python benchmark_db_formats.py --sizes 1000,100000 --formats json,msgpack
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, PROJECT_DIR)
+
+import web_serializers
+from web_storage import JsonStore
+
+
+def make_orders(count):
+    """Заказы той же формы, что создает simple_app.create_order"""
+    start = datetime.now() - timedelta(minutes=count)
+    orders = {}
+    for i in range(1, count + 1):
+        orders[str(i)] = {
+            'id': i,
+            'tie_id': i % 6 + 1,
+            'tie_name': 'Классический синий галстук',
+            'price': 15000,
+            'recipient_name': f"Покупатель {i}",
+            'recipient_surname': 'Тестов',
+            'recipient_phone': f"8770{i:07d}",
+            'delivery_address': f"Алматы, ул. Абая {i % 300}, кв. {i % 90}",
+            'user_id': i % 5000,
+            'status': ('pending', 'confirmed', 'completed')[i % 3],
+            'created_at': (start + timedelta(minutes=i)).isoformat()
+        }
+    return orders
+
+
+def empty_db():
+    return {'users': {}, 'orders': {}, 'ties': []}
+
+
+def measure(orders, fmt, work_dir):
+    path = os.path.join(work_dir, f"bench_{fmt}.json")
+    store = JsonStore(path, empty_db, serializer=fmt)
+
+    start = time.perf_counter()
+    store.orders.compact(orders)
+    save_s = time.perf_counter() - start
+    size = os.path.getsize(store.orders.path)
+    store.close()
+
+    # Новый экземпляр - как только что запущенный воркер
+    fresh = JsonStore(path, empty_db, serializer=fmt)
+    start = time.perf_counter()
+    loaded = len(fresh.orders.current())
+    load_s = time.perf_counter() - start
+    fresh.close()
+    assert loaded == len(orders), f"{fmt}: loaded {loaded} of {len(orders)} orders"
+    return save_s, load_s, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Время записи/загрузки и размер снимка по форматам')
+    parser.add_argument('--sizes', default='1000,100000,1000000', help='количества заказов через запятую')
+    parser.add_argument('--formats', default=','.join(web_serializers.available()),
+                        help='форматы через запятую (доступны: ' + ', '.join(web_serializers.available()) + ')')
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    formats = [f for f in args.formats.split(',') if f]
+    missing = [f for f in formats if f not in web_serializers.available()]
+    if missing:
+        print(f"⚠️  Пропускаю форматы без установленных пакетов: {', '.join(missing)}")
+        formats = [f for f in formats if f not in missing]
+
+    work_dir = tempfile.mkdtemp(prefix='t1eup_formats_')
+    print(f"📁 Каталог: {work_dir}")
+    print(f"{'заказов':>10} {'формат':>8} {'запись, с':>10} {'загрузка, с':>12} {'размер, МБ':>11}")
+    try:
+        for count in sizes:
+            orders = make_orders(count)
+            for fmt in formats:
+                save_s, load_s, size = measure(orders, fmt, work_dir)
+                print(f"{count:>10,} {fmt:>8} {save_s:>10.3f} {load_s:>12.3f} {size / 1024 / 1024:>11.2f}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Нагрузочная проверка выдачи номеров заказов в simple_app
+Несколько процессов (как воркеры gunicorn) по несколько потоков
+одновременно создают заказы; в конце проверяется, что все номера
+уникальны и ни один заказ не потерян.
+
+Запуск:
+    python benchmark_orders.py --processes 8 --threads 4 --orders 100
+    WEB_STORAGE_BACKEND=sqlite python benchmark_orders.py
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+import multiprocessing
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def worker(work_dir, threads, orders, queue):
+    """Один процесс: threads потоков по orders заказов в каждом"""
+    os.chdir(work_dir)
+    sys.path.insert(0, PROJECT_DIR)
+    import simple_app
+
+    ids = []
+    ids_lock = threading.Lock()
+
+    def submit(n):
+        local_ids = []
+        for i in range(orders):
+            order = simple_app.create_order(1, f"Бенчмарк {n}-{i}", 'Тест', '87000000000',
+                                            'Алматы', os.getpid())
+            local_ids.append(order['id'])
+        with ids_lock:
+            ids.extend(local_ids)
+
+    pool = [threading.Thread(target=submit, args=(n,)) for n in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    simple_app.store.close()
+    queue.put(ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Проверка уникальности номеров заказов')
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--orders', type=int, default=100, help='заказов на поток')
+    args = parser.parse_args()
+
+    total = args.processes * args.threads * args.orders
+    work_dir = tempfile.mkdtemp(prefix='t1eup_bench_')
+    backend = os.environ.get('WEB_STORAGE_BACKEND', 'json')
+    print(f"🧪 {total} заказов: {args.processes} процессов × {args.threads} потоков × {args.orders}")
+    print(f"📁 Каталог: {work_dir}, хранилище: {backend}")
+
+    queue = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker, args=(work_dir, args.threads, args.orders, queue))
+                 for _ in range(args.processes)]
+    start = time.perf_counter()
+    for p in processes:
+        p.start()
+    ids = []
+    for _ in processes:
+        ids.extend(queue.get())
+    for p in processes:
+        p.join()
+    elapsed = time.perf_counter() - start
+
+    # Открываем базу заново, как это сделал бы новый воркер
+    os.chdir(work_dir)
+    sys.path.insert(0, PROJECT_DIR)
+    import simple_app
+    stored = simple_app.store.count_orders()
+
+    duplicates = len(ids) - len(set(ids))
+    print(f"⏱  {elapsed:.2f} с, {total / elapsed:,.0f} заказов/с")
+    print(f"🔢 Выдано номеров: {len(ids)}, повторов: {duplicates}")
+    print(f"💾 Заказов в базе: {stored}")
+
+    ok = len(ids) == total and duplicates == 0 and stored == total
+    print("✅ Все номера уникальны, заказы не потеряны" if ok else "❌ Обнаружены потерянные или повторные заказы")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
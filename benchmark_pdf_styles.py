@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Сравнение общего реестра стилей pdf_generator с построением стилей на каждый заказ
+Для N заказов собираются таблицы заказов, как в generate_admin_report:
+    per-order - как было раньше: getSampleStyleSheet и ParagraphStyle
+                строятся один раз на отчет, TableStyle таблицы заказа -
+                заново для каждого заказа
+    registry  - стили берутся из pdf_generator.STYLES / TABLE_STYLES
+Для каждого режима измеряется время сборки flowables, пик выделенной
+памяти (tracemalloc) и число созданных стилей; отдельно - время
+doc.build() того же документа в память, чтобы видеть долю экономии.
+
+Запуск:
+    python benchmark_pdf_styles.py
+    python benchmark_pdf_styles.py --orders 1000 --repeat 5
+"""
+
+import os
+import sys
+import gc
+import io
+import time
+import argparse
+import tracemalloc
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, PROJECT_DIR)
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Table, Paragraph, Spacer
+
+import pdf_generator
+
+
+def make_orders(count):
+    """Заказы с теми же полями, что модель Order бота"""
+    start = datetime.now() - timedelta(minutes=count)
+    return [SimpleNamespace(
+        id=i,
+        status='completed' if i % 3 else 'pending_payment',
+        price=15000,
+        created_at=start + timedelta(minutes=i),
+        tie_name='Классический синий галстук',
+        user_telegram_id=100000 + i,
+        recipient_name=f"Покупатель {i}",
+        recipient_surname='Тестов',
+        recipient_phone=f"8770{i:07d}",
+        delivery_address='г. Алматы, ул. Абая, 1'
+    ) for i in range(1, count + 1)]
+
+
+def build_story(orders, per_order):
+    """Таблицы заказов как в generate_admin_report"""
+    story = []
+    if per_order:
+        styles = pdf_generator.build_paragraph_styles()
+    else:
+        styles = pdf_generator.STYLES
+    for order in orders:
+        if per_order:
+            table_style = pdf_generator._order_details_table_style()
+        else:
+            table_style = pdf_generator.TABLE_STYLES['order_details']
+        story.append(Paragraph(f"Order #{order.id} - {order.status}", styles['section']))
+        table = Table([
+            ['Field', 'Information'],
+            ['Order ID', f'#{order.id}'],
+            ['Status', order.status],
+            ['Date', order.created_at.strftime('%d.%m.%Y %H:%M')],
+            ['Name', order.recipient_name],
+            ['Phone', order.recipient_phone],
+            ['Product Name', order.tie_name],
+            ['Price', f'{order.price:,.0f} тг'],
+        ], colWidths=[1.5*inch, 3.5*inch])
+        table.setStyle(table_style)
+        story.append(table)
+        story.append(Spacer(1, 0.2*inch))
+    return story
+
+
+def measure(orders, per_order, repeat):
+    """(лучшее время сборки, мс; пик памяти, КБ; время doc.build, мс)"""
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        build_story(orders, per_order)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+
+    gc.collect()
+    tracemalloc.start()
+    build_story(orders, per_order)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    story = build_story(orders, per_order)
+    start = time.perf_counter()
+    SimpleDocTemplate(io.BytesIO(), pagesize=A4).build(story)
+    render_ms = (time.perf_counter() - start) * 1000
+    return best, peak / 1024, render_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    orders = make_orders(args.orders)
+    print(f"{args.orders} orders, best of {args.repeat}")
+    print(f"{'mode':<10} {'styles':>8} {'story ms':>10} {'peak KB':>10} {'build ms':>10}")
+    results = {}
+    for mode, per_order in (('per-order', True), ('registry', False)):
+        story_ms, peak_kb, render_ms = measure(orders, per_order, args.repeat)
+        created = len(pdf_generator.STYLES) + args.orders if per_order else 0
+        results[mode] = (story_ms, peak_kb)
+        print(f"{mode:<10} {created:>8} {story_ms:>10.1f} {peak_kb:>10.0f} {render_ms:>10.1f}")
+
+    saved_ms = results['per-order'][0] - results['registry'][0]
+    saved_kb = results['per-order'][1] - results['registry'][1]
+    print(f"saved per 1,000 orders: {saved_ms * 1000 / args.orders:.1f} ms, "
+          f"{saved_kb * 1000 / args.orders:.0f} KB peak")
+
+
+if __name__ == '__main__':
+    main()
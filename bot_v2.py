@@ -7,11 +7,17 @@ import os
 import re
 import logging
 import json
+import asyncio
 from datetime import datetime
+from types import SimpleNamespace
+from sqlalchemy import func
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes, ConversationHandler
 from dotenv import load_dotenv
 from bot_translations import get_text
+from image_derivatives import generate_derivatives
+from pdf_service import PdfService, PdfQueueFull
+from pdf_generator import RECENT_ORDERS
 from database import (
     get_or_create_user, update_user_language, get_user_language, 
     Session, Order, User, Tie,
@@ -40,6 +46,36 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# PDF reports are rendered in a process pool so they don't block the event loop.
+# One long-lived worker: the admin report section cache (pdf_generator.ADMIN_REPORT_CACHE)
+# lives in the worker process, so every report has to reach the same one. Reports
+# sharing that cache are serialized by its lock anyway, so a second worker would
+# only add a second, cold cache.
+pdf_service = PdfService(workers=1)
+
+# Order fields used by pdf_generator.render_admin_report
+REPORT_ORDER_FIELDS = (
+    'id', 'status', 'price', 'created_at', 'tie_name', 'user_telegram_id',
+    'recipient_name', 'recipient_surname', 'recipient_phone', 'delivery_address'
+)
+
+def load_admin_report_data(session):
+    """Admin report inputs aggregated by the database, independent of table size
+
+    Returns (status, count, price sum) rows from GROUP BY status, the user
+    count and the RECENT_ORDERS newest orders as plain objects (they are
+    pickled to the PDF pool).
+    """
+    status_rows = session.query(
+        Order.status, func.count(Order.id), func.coalesce(func.sum(Order.price), 0)
+    ).group_by(Order.status).all()
+    total_users = session.query(func.count(User.id)).scalar()
+    recent_orders = [
+        SimpleNamespace(**{field: getattr(o, field) for field in REPORT_ORDER_FIELDS})
+        for o in session.query(Order).order_by(Order.created_at.desc()).limit(RECENT_ORDERS)
+    ]
+    return [tuple(row) for row in status_rows], total_users, recent_orders
+
 # Conversation states
 LANGUAGE_SELECTION = 0
 MAIN_MENU = 1
@@ -2804,6 +2840,9 @@ class TieShopBot:
         os.makedirs("TieUp", exist_ok=True)
         await photo_file.download_to_drive(filename)
         
+        # Resized copies for the web catalog srcset (Pillow runs off the event loop)
+        await asyncio.get_running_loop().run_in_executor(None, generate_derivatives, filename)
+        
         # Create new tie in database
         new_tie_data = context.user_data['new_tie']
         
@@ -2844,6 +2883,9 @@ class TieShopBot:
         os.makedirs("TieUp", exist_ok=True)
         await photo_file.download_to_drive(filename)
         
+        # Resized copies for the web catalog srcset (Pillow runs off the event loop)
+        await asyncio.get_running_loop().run_in_executor(None, generate_derivatives, filename)
+        
         # Update tie in database
         tie_id = context.user_data.get('editing_tie')
         update_tie(tie_id, image_path=filename)
@@ -3132,34 +3174,29 @@ class TieShopBot:
         
         await query.message.reply_text("📊 Генерирую отчет...")
         
-        from database import Session, User, Order
-        from pdf_generator import generate_admin_report
-        
         session = Session()
         try:
-            # Get all data
-            all_orders = session.query(Order).all()
-            all_users = session.query(User).all()
-            
-            # Generate PDF
-            report_path = generate_admin_report(all_orders, all_users)
-            
-            # Send PDF file
-            with open(report_path, 'rb') as pdf_file:
-                await query.message.reply_document(
-                    document=pdf_file,
-                    filename=f"TieShop_Report_{datetime.now().strftime('%Y%m%d')}.pdf",
-                    caption="📊 *Отчет готов!*\n\nВ отчете:\n• Статистика заказов\n• Активные пользователи\n• Финансовые показатели\n• Последние заказы",
-                    parse_mode='Markdown'
-                )
-            
-            # Clean up
-            os.remove(report_path)
+            status_rows, total_users, recent_orders = load_admin_report_data(session)
+        finally:
+            session.close()
+        
+        try:
+            # Generate PDF in memory: nothing is written to disk
+            report = await asyncio.get_running_loop().run_in_executor(
+                None, pdf_service.admin_report, status_rows, total_users, recent_orders)
+            
+            # Send PDF bytes
+            await query.message.reply_document(
+                document=report,
+                filename=f"TieShop_Report_{datetime.now().strftime('%Y%m%d')}.pdf",
+                caption="📊 *Отчет готов!*\n\nВ отчете:\n• Статистика заказов\n• Активные пользователи\n• Финансовые показатели\n• Последние заказы",
+                parse_mode='Markdown'
+            )
             
+        except PdfQueueFull:
+            await query.message.reply_text("⏳ Сейчас генерируется слишком много отчетов, попробуйте через минуту")
         except Exception as e:
             await query.message.reply_text(f"❌ Ошибка генерации отчета: {str(e)}")
-        finally:
-            session.close()
     
     def run(self):
         """Run the bot"""
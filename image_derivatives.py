@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Уменьшенные копии фото галстуков для адаптивной выдачи (srcset)
+Для каждого фото в TieUp/ рядом с оригиналом создаются файлы
+<имя>-<ширина>w.webp и <имя>-<ширина>w.jpg; шаблоны перечисляют их
+в srcset, и телефон скачивает копию под свою ширину экрана.
+Нужен Pillow (ставится вместе с reportlab); без него остаются только оригиналы.
+"""
+
+import os
+import logging
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # необязательная зависимость
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Ширина оригиналов: путь -> (mtime_ns, ширина), чтобы не открывать файл на каждый рендер
+_original_widths = {}
+
+# Ширины копий в пикселях
+IMAGE_WIDTHS = tuple(int(w) for w in os.environ.get('IMAGE_WIDTHS', '320,640,960').split(',') if w.strip())
+# Качество сжатия копий
+IMAGE_QUALITY = int(os.environ.get('IMAGE_QUALITY', 80))
+
+# Расширение -> (формат Pillow, MIME тип); порядок - порядок <source> в шаблоне
+DERIVATIVE_FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpg': ('JPEG', 'image/jpeg')
+}
+
+
+def derivative_name(filename, width, ext):
+    """Имя копии: abc.webp, 320, 'jpg' -> abc-320w.jpg"""
+    return f"{os.path.splitext(os.path.basename(filename))[0]}-{width}w.{ext}"
+
+
+def is_derivative(filename):
+    stem = os.path.splitext(filename)[0]
+    return any(stem.endswith(f"-{w}w") for w in IMAGE_WIDTHS)
+
+
+def generate_derivatives(path):
+    """Создает копии фото всех ширин и форматов; возвращает имена созданных файлов
+
+    Копии не шире оригинала не делаются. Ошибка обработки не мешает
+    сохранению галстука: каталог просто покажет оригинал.
+    """
+    if Image is None:
+        logger.warning("Pillow is not installed, image derivatives are not generated")
+        return []
+    directory = os.path.dirname(path)
+    created = []
+    try:
+        with Image.open(path) as original:
+            image = ImageOps.exif_transpose(original)
+            for width in IMAGE_WIDTHS:
+                if width >= image.width:
+                    continue
+                height = max(1, round(image.height * width / image.width))
+                resized = image.resize((width, height), Image.LANCZOS)
+                for ext, (fmt, _) in DERIVATIVE_FORMATS.items():
+                    target = os.path.join(directory, derivative_name(path, width, ext))
+                    tmp_path = f"{target}.tmp-{os.getpid()}"
+                    frame = resized.convert('RGB') if fmt == 'JPEG' and resized.mode != 'RGB' else resized
+                    frame.save(tmp_path, fmt, quality=IMAGE_QUALITY)
+                    os.replace(tmp_path, target)
+                    created.append(os.path.basename(target))
+    except Exception as e:
+        logger.error(f"Error generating derivatives for {path}: {e}")
+        return created
+    logger.info(f"Generated {len(created)} derivatives for {path}")
+    return created
+
+
+def available_derivatives(path, ext):
+    """[(имя файла, ширина)] уже созданных копий фото в формате ext"""
+    directory = os.path.dirname(path)
+    found = []
+    for width in IMAGE_WIDTHS:
+        name = derivative_name(path, width, ext)
+        if os.path.exists(os.path.join(directory, name)):
+            found.append((name, width))
+    return found
+
+
+def original_width(path):
+    """Ширина оригинала в пикселях с учетом EXIF поворота (None без Pillow или при ошибке)"""
+    if Image is None:
+        return None
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    cached = _original_widths.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    try:
+        with Image.open(path) as original:
+            width = ImageOps.exif_transpose(original).width
+    except Exception as e:
+        logger.error(f"Error reading image size of {path}: {e}")
+        return None
+    _original_widths[path] = (mtime, width)
+    return width
+
+
+def generate_missing(directory):
+    """Создает копии для всех фото каталога, у которых их еще нет (первый запуск)"""
+    count = 0
+    for filename in sorted(os.listdir(directory)):
+        path = os.path.join(directory, filename)
+        if filename.startswith('.') or is_derivative(filename) or not os.path.isfile(path):
+            continue
+        if not any(available_derivatives(path, ext) for ext in DERIVATIVE_FORMATS):
+            count += len(generate_derivatives(path))
+    return count
@@ -1,8 +1,13 @@
 """PDF Report Generator for TieShop Bot - Modern Design"""
 
 
+import io
 import os
+import heapq
+import itertools
+import threading
 from datetime import datetime
+from types import MappingProxyType
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -43,84 +48,349 @@ def register_fonts():
 # Register fonts when module is imported
 register_fonts()
 
-def generate_admin_report(orders, users, output_path='admin_report.pdf'):
-    """Generate modern admin report with beautiful design"""
-    doc = SimpleDocTemplate(
-        output_path, 
-        pagesize=A4,
-        rightMargin=72,
-        leftMargin=72,
-        topMargin=72,
-        bottomMargin=72
-    )
-    story = []
+# Modern color palette
+PRIMARY_COLOR = colors.HexColor('#667eea')  # Modern blue
+SECONDARY_COLOR = colors.HexColor('#764ba2')  # Purple
+SUCCESS_COLOR = colors.HexColor('#4facfe')  # Light blue
+DARK_GRAY = colors.HexColor('#2d3748')
+LIGHT_GRAY = colors.HexColor('#f7fafc')
+BORDER_COLOR = colors.HexColor('#e2e8f0')
+
+def build_paragraph_styles():
+    """Build every ParagraphStyle used by the reports"""
     styles = getSampleStyleSheet()
+    return {
+        'normal': styles['Normal'],
+        
+        # Admin report
+        'report_title': ParagraphStyle(
+            'ModernTitle',
+            parent=styles['Heading1'],
+            fontSize=32,
+            textColor=PRIMARY_COLOR,
+            spaceAfter=20,
+            spaceBefore=0,
+            alignment=TA_CENTER,
+            fontName='Helvetica-Bold'
+        ),
+        'report_subtitle': ParagraphStyle(
+            'ModernSubtitle',
+            parent=styles['Heading2'],
+            fontSize=20,
+            textColor=DARK_GRAY,
+            spaceAfter=15,
+            spaceBefore=25,
+            fontName='Helvetica-Bold'
+        ),
+        'section': ParagraphStyle(
+            'SectionTitle',
+            parent=styles['Heading3'],
+            fontSize=16,
+            textColor=SECONDARY_COLOR,
+            spaceAfter=10,
+            spaceBefore=20,
+            fontName='Helvetica-Bold'
+        ),
+        'info': ParagraphStyle(
+            'InfoText',
+            parent=styles['Normal'],
+            fontSize=12,
+            textColor=colors.HexColor('#4a5568'),
+            spaceAfter=6,
+            fontName='Helvetica-Regular'
+        ),
+        
+        # User activity report
+        'activity_subtitle': ParagraphStyle(
+            'ModernSubtitle',
+            parent=styles['Heading2'],
+            fontSize=18,
+            textColor=DARK_GRAY,
+            spaceAfter=15,
+            spaceBefore=20,
+            fontName='Helvetica-Bold'
+        ),
+        
+        # Web shop order
+        'order_title': ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=24,
+            spaceAfter=30,
+            alignment=1,  # Center alignment
+            textColor=colors.darkblue
+        ),
+        'order_footer': ParagraphStyle(
+            'Footer',
+            parent=styles['Normal'],
+            fontSize=10,
+            alignment=1,
+            textColor=colors.grey
+        ),
+    }
+
+def _summary_table_style(header_color):
+    return TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), header_color),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+        ('GRID', (0, 0), (-1, -1), 1, BORDER_COLOR),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica-Regular'),
+        ('FONTSIZE', (0, 1), (-1, -1), 11),
+        ('PADDING', (0, 0), (-1, -1), 8),
+    ])
+
+def _order_details_table_style():
+    return TableStyle([
+        # Header
+        ('BACKGROUND', (0, 0), (-1, 0), PRIMARY_COLOR),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+        ('TOPPADDING', (0, 0), (-1, 0), 8),
+        
+        # Data rows
+        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica-Regular'),
+        ('FONTSIZE', (0, 1), (-1, -1), 10),
+        ('ALIGN', (0, 1), (0, -1), 'LEFT'),
+        ('ALIGN', (1, 1), (1, -1), 'LEFT'),
+        
+        # Section headers
+        ('FONTNAME', (0, 1), (0, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 1), (0, -1), 11),
+        ('TEXTCOLOR', (0, 1), (0, -1), SECONDARY_COLOR),
+        
+        # Value styling
+        ('FONTNAME', (1, 1), (1, -1), 'Helvetica-Regular'),
+        ('TEXTCOLOR', (1, 1), (1, -1), DARK_GRAY),
+        
+        # Borders and spacing
+        ('BOX', (0, 0), (-1, -1), 1, BORDER_COLOR),
+        ('LINEBELOW', (0, 0), (-1, 0), 2, PRIMARY_COLOR),
+        ('PADDING', (0, 0), (-1, -1), 6),
+    ])
+
+def build_table_styles():
+    """Build every TableStyle used by the reports"""
+    return {
+        # Admin report
+        'metrics': _summary_table_style(PRIMARY_COLOR),
+        'status': _summary_table_style(SECONDARY_COLOR),
+        'order_details': _order_details_table_style(),
+        
+        # User activity report
+        'activity_header': TableStyle([
+            ('BACKGROUND', (0, 0), (0, 0), PRIMARY_COLOR),
+            ('BACKGROUND', (1, 0), (1, 0), SECONDARY_COLOR),
+            ('TEXTCOLOR', (0, 0), (-1, -1), colors.white),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (0, 0), 'Helvetica-Bold'),
+            ('FONTNAME', (1, 0), (1, 0), 'Helvetica'),
+            ('FONTSIZE', (0, 0), (0, 0), 20),
+            ('FONTSIZE', (1, 0), (1, 0), 12),
+            ('FONTSIZE', (0, 1), (-1, 1), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 15),
+            ('TOPPADDING', (0, 0), (-1, -1), 15),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ]),
+        'activity_summary': TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), LIGHT_GRAY),
+            ('TEXTCOLOR', (0, 0), (-1, 0), DARK_GRAY),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('ALIGN', (0, 0), (0, 0), 'CENTER'),
+            ('ALIGN', (1, 0), (1, 0), 'LEFT'),
+            ('ALIGN', (2, 0), (2, 0), 'RIGHT'),
+            ('ALIGN', (3, 0), (3, 0), 'LEFT'),
+            
+            ('FONTNAME', (2, 0), (2, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (2, 0), (2, 0), 14),
+            ('TEXTCOLOR', (2, 0), (2, 0), PRIMARY_COLOR),
+            
+            ('FONTSIZE', (3, 0), (3, 0), 8),
+            ('TEXTCOLOR', (3, 0), (3, 0), colors.HexColor('#718096')),
+            
+            ('BOX', (0, 0), (-1, -1), 1, BORDER_COLOR),
+            ('BACKGROUND', (0, 0), (-1, -1), colors.white),
+            ('PADDING', (0, 0), (-1, -1), 8),
+        ]),
+        'active_users': TableStyle([
+            # Header
+            ('BACKGROUND', (0, 0), (-1, 0), SUCCESS_COLOR),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 11),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('TOPPADDING', (0, 0), (-1, 0), 12),
+            
+            # Data rows
+            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 1), (-1, -1), 10),
+            ('ALIGN', (0, 1), (0, -1), 'CENTER'),
+            ('ALIGN', (1, 1), (1, -1), 'LEFT'),
+            ('ALIGN', (2, 1), (2, -1), 'LEFT'),
+            ('ALIGN', (3, 1), (-1, -1), 'CENTER'),
+            
+            # Value styling
+            ('FONTNAME', (4, 1), (4, -1), 'Helvetica-Bold'),
+            ('TEXTCOLOR', (4, 1), (4, -1), PRIMARY_COLOR),
+            
+            # Borders and spacing
+            ('BOX', (0, 0), (-1, -1), 1, BORDER_COLOR),
+            ('LINEBELOW', (0, 0), (-1, 0), 2, SUCCESS_COLOR),
+            ('PADDING', (0, 0), (-1, -1), 8),
+            
+            # Alternating row colors
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, LIGHT_GRAY]),
+        ]),
+        
+        # Web shop order
+        'order': TableStyle([
+            ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
+            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+            ('BACKGROUND', (0, 4), (-1, 4), colors.darkblue),
+            ('TEXTCOLOR', (0, 4), (-1, 4), colors.whitesmoke),
+            ('BACKGROUND', (0, 9), (-1, 9), colors.darkgreen),
+            ('TEXTCOLOR', (0, 9), (-1, 9), colors.whitesmoke),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ]),
+    }
+
+# Style registry: built once per process and shared by all reports.
+# Table.setStyle() only reads a TableStyle, so one instance serves every table;
+# never modify these objects - derive a new style instead.
+STYLES = MappingProxyType(build_paragraph_styles())
+TABLE_STYLES = MappingProxyType(build_table_styles())
+
+def _open_output(output):
+    """Where SimpleDocTemplate writes: a file path, a writable buffer, or memory for output=None"""
+    return io.BytesIO() if output is None else output
+
+def _close_output(output, target):
+    """Result of a generate_* call: the PDF bytes for output=None, otherwise output itself"""
+    return target.getvalue() if output is None else output
+
+def generate_order_pdf(order, description='', output=None):
+    """Generate order confirmation PDF for the web shop (order is a plain dict)
+
+    output is a file path or any writable binary buffer; without it the PDF
+    is returned as bytes.
+    """
+    target = _open_output(output)
+    doc = SimpleDocTemplate(target, pagesize=A4)
+    story = []
     
-    # Modern color palette
-    primary_color = colors.HexColor('#667eea')  # Modern blue
-    secondary_color = colors.HexColor('#764ba2')  # Purple
-    accent_color = colors.HexColor('#f093fb')  # Pink
-    success_color = colors.HexColor('#4facfe')  # Light blue
-    warning_color = colors.HexColor('#f093fb')  # Pink
-    danger_color = colors.HexColor('#ff6b6b')  # Red
-    dark_gray = colors.HexColor('#2d3748')
-    light_gray = colors.HexColor('#f7fafc')
-    
-    # Modern styles with custom fonts
-    title_style = ParagraphStyle(
-        'ModernTitle',
-        parent=styles['Heading1'],
-        fontSize=32,
-        textColor=primary_color,
-        spaceAfter=20,
-        spaceBefore=0,
-        alignment=TA_CENTER,
-        fontName='Helvetica-Bold'
-    )
-    
-    subtitle_style = ParagraphStyle(
-        'ModernSubtitle',
-        parent=styles['Heading2'],
-        fontSize=20,
-        textColor=dark_gray,
-        spaceAfter=15,
-        spaceBefore=25,
-        fontName='Helvetica-Bold'
-    )
+    # Title
+    story.append(Paragraph("ЗАКАЗ #" + str(order['id']), STYLES['order_title']))
+    story.append(Spacer(1, 20))
+    
+    # Order details
+    order_data = [
+        ['Номер заказа:', str(order['id'])],
+        ['Дата создания:', order['created_at'][:16] if order['created_at'] else 'Неизвестно'],
+        ['Статус:', 'Ожидает оплаты'],
+        ['', ''],
+        ['ПОКУПАТЕЛЬ:', ''],
+        ['Имя:', order['recipient_name']],
+        ['Фамилия:', order.get('recipient_surname', '')],
+        ['Телефон:', order['recipient_phone']],
+        ['Адрес доставки:', order['delivery_address']],
+        ['', ''],
+        ['ТОВАР:', ''],
+        ['Название:', order['tie_name']],
+        ['Описание:', description[:100] + '...' if len(description) > 100 else description],
+        ['Цена:', f"{order['price']:,.0f} ₸"],
+    ]
     
-    section_style = ParagraphStyle(
-        'SectionTitle',
-        parent=styles['Heading3'],
-        fontSize=16,
-        textColor=secondary_color,
-        spaceAfter=10,
-        spaceBefore=20,
-        fontName='Helvetica-Bold'
-    )
+    table = Table(order_data, colWidths=[2*inch, 4*inch])
+    table.setStyle(TABLE_STYLES['order'])
     
-    info_style = ParagraphStyle(
-        'InfoText',
-        parent=styles['Normal'],
-        fontSize=12,
-        textColor=colors.HexColor('#4a5568'),
-        spaceAfter=6,
-        fontName='Helvetica-Regular'
-    )
+    story.append(table)
+    story.append(Spacer(1, 30))
     
-    # Simple header
-    story.append(Paragraph("TieShop Business Report", title_style))
-    story.append(Paragraph(f"Generated: {datetime.now().strftime('%B %d, %Y at %H:%M')}", info_style))
-    story.append(Spacer(1, 0.3*inch))
+    # Footer
+    story.append(Paragraph(f"Документ создан: {datetime.now().strftime('%d.%m.%Y в %H:%M')}", STYLES['order_footer']))
     
-    # Key Metrics Cards
-    story.append(Paragraph("Key Performance Indicators", subtitle_style))
+    # Build PDF
+    doc.build(story)
+    return _close_output(output, target)
+
+class ReportCache:
+    """Rendered report sections, each kept with the key of the data it was built from
+
+    A section is rebuilt only when its key changes; when no key changed at all
+    (and the report minute is the same) the previous PDF bytes are reused.
+    Cached flowables are reused across doc.build() calls, so reports sharing a
+    cache are serialized by its lock.
+    """
     
-    # Calculate metrics
-    total_orders = len(orders)
-    total_users = len(users)
-    completed_orders = sum(1 for o in orders if o.status == 'completed')
-    pending_orders = sum(1 for o in orders if o.status in ['pending_payment', 'pending_admin_review'])
-    total_revenue = sum(o.price for o in orders if o.status == 'completed')
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._sections = {}
+        self._document = None  # (key, pdf bytes)
+    
+    def section(self, name, key, build):
+        """Flowables of section name, rebuilt by build() if key changed"""
+        cached = self._sections.get(name)
+        if cached is not None and cached[0] == key:
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        flowables = build()
+        self._sections[name] = (key, flowables)
+        return flowables
+    
+    def retain(self, names):
+        """Forget sections that are no longer part of the report"""
+        for name in set(self._sections).difference(names):
+            del self._sections[name]
+    
+    def document(self, key):
+        if self._document is not None and self._document[0] == key:
+            return self._document[1]
+        return None
+    
+    def store_document(self, key, data):
+        self._document = (key, data)
+
+# Admin report sections of this process. The cache is per process: each
+# pdf_service pool worker has its own copy, and it is lost when the pool is
+# restarted after a timeout, so the bot renders reports in a single worker
+ADMIN_REPORT_CACHE = ReportCache()
+
+def _write_output(output, data):
+    """Deliver already rendered PDF bytes the same way doc.build() would"""
+    if output is None:
+        return data
+    if isinstance(output, (str, os.PathLike)):
+        with open(output, 'wb') as f:
+            f.write(data)
+    else:
+        output.write(data)
+    return output
+
+def _order_key(order):
+    """Everything an order table shows"""
+    return (order.id, order.status, order.created_at, order.recipient_name, order.recipient_surname,
+            order.recipient_phone, order.delivery_address, order.tie_name, order.price, order.user_telegram_id)
+
+def _kpi_section(metrics):
+    total_orders, total_users, completed_orders, pending_orders, total_revenue = metrics
     avg_order_value = total_revenue / completed_orders if completed_orders > 0 else 0
     
     # Simple metrics table
@@ -136,155 +406,172 @@ def generate_admin_report(orders, users, output_path='admin_report.pdf'):
     ]
     
     metrics_table = Table(metrics_data, colWidths=[3*inch, 2*inch])
-    metrics_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), primary_color),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#e2e8f0')),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica-Regular'),
-        ('FONTSIZE', (0, 1), (-1, -1), 11),
-        ('PADDING', (0, 0), (-1, -1), 8),
-    ]))
+    metrics_table.setStyle(TABLE_STYLES['metrics'])
+    return [Paragraph("Key Performance Indicators", STYLES['report_subtitle']), metrics_table]
+
+def _status_section(status_rows):
+    status_data = [['Status', 'Count', 'Revenue']]
+    for status, count, revenue in status_rows:
+        status_data.append([
+            status.replace('_', ' ').title(),
+            str(count),
+            f"{revenue:,.0f} тг"
+        ])
+    
+    status_table = Table(status_data, colWidths=[2*inch, 1*inch, 1.5*inch])
+    status_table.setStyle(TABLE_STYLES['status'])
+    return [status_table]
+
+def _order_section(order):
+    # Order header
+    order_header = f"Order #{order.id} - {order.status.replace('_', ' ').title()}"
+    
+    # Customer and order details
+    order_details = [
+        ['Field', 'Information'],
+        ['Order ID', f'#{order.id}'],
+        ['Status', order.status.replace('_', ' ').title()],
+        ['Date', order.created_at.strftime('%d.%m.%Y %H:%M')],
+        ['', ''],
+        ['Payer Information', ''],
+        ['Name', order.recipient_name or 'N/A'],
+        ['Surname', order.recipient_surname or 'N/A'],
+        ['Phone', order.recipient_phone or 'N/A'],
+        ['Address', order.delivery_address or 'N/A'],
+        ['', ''],
+        ['Product Information', ''],
+        ['Product Name', order.tie_name or 'N/A'],
+        ['Price', f'{order.price:,.0f} тг' if order.price else 'N/A'],
+        ['', ''],
+        ['Additional Info', ''],
+        ['User ID', str(order.user_telegram_id)],
+        ['Created', order.created_at.strftime('%Y-%m-%d %H:%M:%S')]
+    ]
     
-    story.append(metrics_table)
+    order_table = Table(order_details, colWidths=[1.5*inch, 3.5*inch])
+    order_table.setStyle(TABLE_STYLES['order_details'])
+    return [Paragraph(order_header, STYLES['section']), order_table, Spacer(1, 0.2*inch)]
+
+# Orders shown in detail in the admin report
+RECENT_ORDERS = 15
+PENDING_STATUSES = ('pending_payment', 'pending_admin_review')
+
+def summarize_orders(orders):
+    """(status, count, price sum) rows of an order list - what GROUP BY status returns"""
+    summary = {}
+    for order in orders:
+        count, revenue = summary.get(order.status, (0, 0))
+        summary[order.status] = (count + 1, revenue + (order.price or 0))
+    return [(status, count, revenue) for status, (count, revenue) in summary.items()]
+
+def generate_admin_report(orders, users, output=None, cache=ADMIN_REPORT_CACHE):
+    """Generate modern admin report with beautiful design (output as in generate_order_pdf)
+
+    Takes in-memory order and user lists; for large tables aggregate in the
+    database and call render_admin_report instead.
+    """
+    recent_orders = heapq.nlargest(RECENT_ORDERS, orders, key=lambda x: x.created_at)
+    return render_admin_report(summarize_orders(orders), len(users), recent_orders, output, cache)
+
+def render_admin_report(status_rows, total_users, recent_orders, output=None, cache=ADMIN_REPORT_CACHE):
+    """Render the admin report from pre-aggregated data
+
+    status_rows are (status, order count, price sum) rows as returned by
+    GROUP BY status; recent_orders is any iterable of the newest orders
+    (only the first RECENT_ORDERS are used), so memory does not depend on
+    the number of orders in the database.
+    Sections come from cache (a ReportCache, None to render everything):
+    only sections whose data changed since the previous report are rebuilt.
+    """
+    if cache is None:
+        cache = ReportCache()
+    with cache.lock:
+        return _render_admin_report(status_rows, total_users, recent_orders, output, cache)
+
+def _render_admin_report(status_rows, total_users, recent_orders, output, cache):
+    generated_at = datetime.now().strftime('%B %d, %Y at %H:%M')
+    
+    # Calculate metrics
+    counts = {status: count for status, count, _ in status_rows}
+    total_orders = sum(counts.values())
+    completed_orders = counts.get('completed', 0)
+    pending_orders = sum(counts.get(status, 0) for status in PENDING_STATUSES)
+    total_revenue = sum(revenue for status, _, revenue in status_rows if status == 'completed')
+    metrics = (total_orders, total_users, completed_orders, pending_orders, total_revenue)
+    
+    # Only completed orders count as revenue in the status summary
+    status_rows = tuple((status, count, revenue if status == 'completed' else 0)
+                        for status, count, revenue in status_rows)
+    
+    recent_orders = list(itertools.islice(recent_orders, RECENT_ORDERS))
+    order_keys = [_order_key(order) for order in recent_orders]
+    
+    # Nothing changed since the previous report: reuse its PDF
+    document_key = (generated_at, metrics, status_rows, tuple(order_keys))
+    data = cache.document(document_key)
+    if data is not None:
+        cache.hits += 1
+        return _write_output(output, data)
+    
+    target = io.BytesIO()
+    doc = SimpleDocTemplate(
+        target, 
+        pagesize=A4,
+        rightMargin=72,
+        leftMargin=72,
+        topMargin=72,
+        bottomMargin=72
+    )
+    story = []
+    
+    # Simple header
+    story.append(Paragraph("TieShop Business Report", STYLES['report_title']))
+    story.append(Paragraph(f"Generated: {generated_at}", STYLES['info']))
+    story.append(Spacer(1, 0.3*inch))
     
+    # Key Metrics Cards
+    story.extend(cache.section('kpi', metrics, lambda: _kpi_section(metrics)))
     story.append(Spacer(1, 0.3*inch))
     
     # Add page break before orders section
     story.append(PageBreak())
     
     # Order Management Section
-    story.append(Paragraph("Order Management", subtitle_style))
-    
-    # Simple order status summary
-    status_summary = {}
-    for order in orders:
-        status = order.status
-        if status not in status_summary:
-            status_summary[status] = {'count': 0, 'revenue': 0}
-        status_summary[status]['count'] += 1
-        if order.status == 'completed':
-            status_summary[status]['revenue'] += order.price
-    
-    status_data = [['Status', 'Count', 'Revenue']]
-    for status, data in status_summary.items():
-        status_data.append([
-            status.replace('_', ' ').title(),
-            str(data['count']),
-            f"{data['revenue']:,.0f} тг"
-        ])
-    
-    status_table = Table(status_data, colWidths=[2*inch, 1*inch, 1.5*inch])
-    status_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), secondary_color),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#e2e8f0')),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica-Regular'),
-        ('FONTSIZE', (0, 1), (-1, -1), 11),
-        ('PADDING', (0, 0), (-1, -1), 8),
-    ]))
-    
-    story.append(status_table)
+    story.append(Paragraph("Order Management", STYLES['report_subtitle']))
+    story.extend(cache.section('status', status_rows, lambda: _status_section(status_rows)))
     story.append(Spacer(1, 0.3*inch))
     
     # Detailed orders with full customer info
-    story.append(Paragraph("Detailed Orders Information", section_style))
-    
-    recent_orders = sorted(orders, key=lambda x: x.created_at, reverse=True)[:15]
+    story.append(Paragraph("Detailed Orders Information", STYLES['section']))
     
-    for i, order in enumerate(recent_orders):
-        # Order header
-        order_header = f"Order #{order.id} - {order.status.replace('_', ' ').title()}"
-        story.append(Paragraph(order_header, section_style))
-        
-        # Customer and order details
-        order_details = [
-            ['Field', 'Information'],
-            ['Order ID', f'#{order.id}'],
-            ['Status', order.status.replace('_', ' ').title()],
-            ['Date', order.created_at.strftime('%d.%m.%Y %H:%M')],
-            ['', ''],
-            ['Payer Information', ''],
-            ['Name', order.recipient_name or 'N/A'],
-            ['Surname', order.recipient_surname or 'N/A'],
-            ['Phone', order.recipient_phone or 'N/A'],
-            ['Address', order.delivery_address or 'N/A'],
-            ['', ''],
-            ['Product Information', ''],
-            ['Product Name', order.tie_name or 'N/A'],
-            ['Price', f'{order.price:,.0f} тг' if order.price else 'N/A'],
-            ['', ''],
-            ['Additional Info', ''],
-            ['User ID', str(order.user_telegram_id)],
-            ['Created', order.created_at.strftime('%Y-%m-%d %H:%M:%S')]
-        ]
-        
-        order_table = Table(order_details, colWidths=[1.5*inch, 3.5*inch])
-        order_table.setStyle(TableStyle([
-            # Header
-            ('BACKGROUND', (0, 0), (-1, 0), primary_color),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-            ('TOPPADDING', (0, 0), (-1, 0), 8),
-            
-            # Data rows
-            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica-Regular'),
-            ('FONTSIZE', (0, 1), (-1, -1), 10),
-            ('ALIGN', (0, 1), (0, -1), 'LEFT'),
-            ('ALIGN', (1, 1), (1, -1), 'LEFT'),
-            
-            # Section headers
-            ('FONTNAME', (0, 1), (0, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 1), (0, -1), 11),
-            ('TEXTCOLOR', (0, 1), (0, -1), secondary_color),
-            
-            # Value styling
-            ('FONTNAME', (1, 1), (1, -1), 'Helvetica-Regular'),
-            ('TEXTCOLOR', (1, 1), (1, -1), dark_gray),
-            
-            # Borders and spacing
-            ('BOX', (0, 0), (-1, -1), 1, colors.HexColor('#e2e8f0')),
-            ('LINEBELOW', (0, 0), (-1, 0), 2, primary_color),
-            ('PADDING', (0, 0), (-1, -1), 6),
-        ]))
-        
-        story.append(order_table)
-        story.append(Spacer(1, 0.2*inch))
+    for i, (order, key) in enumerate(zip(recent_orders, order_keys)):
+        story.extend(cache.section(('order', order.id), key, lambda: _order_section(order)))
         
         # Add page break every 3 orders
         if (i + 1) % 3 == 0 and i < len(recent_orders) - 1:
             story.append(PageBreak())
+    cache.retain(['kpi', 'status'] + [('order', order.id) for order in recent_orders])
     
     # Footer
     story.append(Spacer(1, 0.5*inch))
     footer_text = f"""
     <para align="center" fontSize="10" textColor="#718096">
-    Generated by TieShop Analytics System | {datetime.now().strftime('%B %d, %Y at %H:%M')}
+    Generated by TieShop Analytics System | {generated_at}
     </para>
     """
-    story.append(Paragraph(footer_text, styles['Normal']))
+    story.append(Paragraph(footer_text, STYLES['normal']))
     
     # Build PDF
     doc.build(story)
-    return output_path
+    data = target.getvalue()
+    cache.store_document(document_key, data)
+    return _write_output(output, data)
 
-def generate_user_activity_report(user_sessions, output_path='user_activity.pdf'):
-    """Generate modern user activity monitoring report"""
+def generate_user_activity_report(user_sessions, output=None):
+    """Generate modern user activity monitoring report (output as in generate_order_pdf)"""
+    target = _open_output(output)
     doc = SimpleDocTemplate(
-        output_path, 
+        target, 
         pagesize=A4,
         rightMargin=72,
         leftMargin=72,
@@ -292,36 +579,6 @@ def generate_user_activity_report(user_sessions, output_path='user_activity.pdf'
         bottomMargin=72
     )
     story = []
-    styles = getSampleStyleSheet()
-    
-    # Modern color palette
-    primary_color = colors.HexColor('#667eea')
-    secondary_color = colors.HexColor('#764ba2')
-    success_color = colors.HexColor('#4facfe')
-    light_gray = colors.HexColor('#f7fafc')
-    dark_gray = colors.HexColor('#2d3748')
-    
-    # Modern styles
-    title_style = ParagraphStyle(
-        'ModernTitle',
-        parent=styles['Heading1'],
-        fontSize=28,
-        textColor=primary_color,
-        spaceAfter=20,
-        spaceBefore=0,
-        alignment=TA_CENTER,
-        fontName='Helvetica-Bold'
-    )
-    
-    subtitle_style = ParagraphStyle(
-        'ModernSubtitle',
-        parent=styles['Heading2'],
-        fontSize=18,
-        textColor=dark_gray,
-        spaceAfter=15,
-        spaceBefore=20,
-        fontName='Helvetica-Bold'
-    )
     
     # Header
     header_data = [
@@ -330,20 +587,7 @@ def generate_user_activity_report(user_sessions, output_path='user_activity.pdf'
     ]
     
     header_table = Table(header_data, colWidths=[4*inch, 3*inch])
-    header_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, 0), primary_color),
-        ('BACKGROUND', (1, 0), (1, 0), secondary_color),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.white),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (0, 0), 'Helvetica-Bold'),
-        ('FONTNAME', (1, 0), (1, 0), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (0, 0), 20),
-        ('FONTSIZE', (1, 0), (1, 0), 12),
-        ('FONTSIZE', (0, 1), (-1, 1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 15),
-        ('TOPPADDING', (0, 0), (-1, -1), 15),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-    ]))
+    header_table.setStyle(TABLE_STYLES['activity_header'])
     
     story.append(header_table)
     story.append(Spacer(1, 0.3*inch))
@@ -364,27 +608,7 @@ def generate_user_activity_report(user_sessions, output_path='user_activity.pdf'
     
     for row in summary_data:
         summary_table = Table(row, colWidths=[0.5*inch, 1.2*inch, 1.5*inch, 2*inch])
-        summary_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), light_gray),
-            ('TEXTCOLOR', (0, 0), (-1, 0), dark_gray),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('ALIGN', (0, 0), (0, 0), 'CENTER'),
-            ('ALIGN', (1, 0), (1, 0), 'LEFT'),
-            ('ALIGN', (2, 0), (2, 0), 'RIGHT'),
-            ('ALIGN', (3, 0), (3, 0), 'LEFT'),
-            
-            ('FONTNAME', (2, 0), (2, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (2, 0), (2, 0), 14),
-            ('TEXTCOLOR', (2, 0), (2, 0), primary_color),
-            
-            ('FONTSIZE', (3, 0), (3, 0), 8),
-            ('TEXTCOLOR', (3, 0), (3, 0), colors.HexColor('#718096')),
-            
-            ('BOX', (0, 0), (-1, -1), 1, colors.HexColor('#e2e8f0')),
-            ('BACKGROUND', (0, 0), (-1, -1), colors.white),
-            ('PADDING', (0, 0), (-1, -1), 8),
-        ]))
+        summary_table.setStyle(TABLE_STYLES['activity_summary'])
         
         story.append(summary_table)
         story.append(Spacer(1, 0.2*inch))
@@ -392,7 +616,7 @@ def generate_user_activity_report(user_sessions, output_path='user_activity.pdf'
     story.append(Spacer(1, 0.3*inch))
     
     # Active users table
-    story.append(Paragraph("Currently Active Users", subtitle_style))
+    story.append(Paragraph("Currently Active Users", STYLES['activity_subtitle']))
     
     active_data = [['User ID', 'Username', 'Current Action', 'Session Start', 'Duration']]
     for session in active_sessions:
@@ -407,37 +631,7 @@ def generate_user_activity_report(user_sessions, output_path='user_activity.pdf'
     
     if len(active_data) > 1:
         active_table = Table(active_data, colWidths=[1.5*inch, 1.5*inch, 2*inch, 1*inch, 1*inch])
-        active_table.setStyle(TableStyle([
-            # Header
-            ('BACKGROUND', (0, 0), (-1, 0), success_color),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 11),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('TOPPADDING', (0, 0), (-1, 0), 12),
-            
-            # Data rows
-            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 10),
-            ('ALIGN', (0, 1), (0, -1), 'CENTER'),
-            ('ALIGN', (1, 1), (1, -1), 'LEFT'),
-            ('ALIGN', (2, 1), (2, -1), 'LEFT'),
-            ('ALIGN', (3, 1), (-1, -1), 'CENTER'),
-            
-            # Value styling
-            ('FONTNAME', (4, 1), (4, -1), 'Helvetica-Bold'),
-            ('TEXTCOLOR', (4, 1), (4, -1), primary_color),
-            
-            # Borders and spacing
-            ('BOX', (0, 0), (-1, -1), 1, colors.HexColor('#e2e8f0')),
-            ('LINEBELOW', (0, 0), (-1, 0), 2, success_color),
-            ('PADDING', (0, 0), (-1, -1), 8),
-            
-            # Alternating row colors
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, light_gray]),
-        ]))
+        active_table.setStyle(TABLE_STYLES['active_users'])
         story.append(active_table)
     else:
         no_users_text = """
@@ -445,7 +639,7 @@ def generate_user_activity_report(user_sessions, output_path='user_activity.pdf'
         No active users at the moment
         </para>
         """
-        story.append(Paragraph(no_users_text, styles['Normal']))
+        story.append(Paragraph(no_users_text, STYLES['normal']))
     
     # Footer
     story.append(Spacer(1, 0.5*inch))
@@ -454,8 +648,8 @@ def generate_user_activity_report(user_sessions, output_path='user_activity.pdf'
     Generated by TieShop Activity Monitor | {datetime.now().strftime('%B %d, %Y at %H:%M')}
     </para>
     """
-    story.append(Paragraph(footer_text, styles['Normal']))
+    story.append(Paragraph(footer_text, STYLES['normal']))
     
     # Build PDF
     doc.build(story)
-    return output_path
+    return _close_output(output, target)
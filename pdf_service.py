@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Сервис генерации PDF для T1EUP (PDF заказа на сайте, отчет в боте)
+ReportLab держит GIL и занимает процессор на сотни миллисекунд, поэтому
+PDF строятся в отдельном пуле процессов, а веб-воркер и бот только
+отправляют задачу и получают результат: путь к файлу или байты -
+то, что вернула функция pdf_generator.
+
+Очередь ограничена PDF_QUEUE_SIZE задачами на процесс (включая те, что
+уже выполняются): если она заполнена, render() сразу бросает PdfQueueFull,
+а не копит задачи в памяти. Рендер каждой задачи ограничен PDF_TIMEOUT секундами;
+зависший рендер останавливается вместе с пулом, пул создается заново.
+Остальные задачи остановленного пула не ждут своего таймаута: они сразу
+повторяются один раз в новом пуле, а при повторной остановке получают PdfAborted.
+
+Метрики (web_metrics):
+    pdf.queue_depth      - длина очереди в момент постановки задачи
+    pdf.render.<kind>    - время рендера в процессе пула, мс
+    pdf.wait.<kind>      - ожидание в очереди и передача данных, мс
+    pdf.timeout.<kind>, pdf.rejected.<kind>, pdf.aborted.<kind> - число
+                           таймаутов, отказов и задач, прерванных перезапуском пула
+"""
+
+import os
+import time
+import logging
+import threading
+import multiprocessing
+
+import web_metrics
+import pdf_generator
+
+logger = logging.getLogger(__name__)
+
+# Процессов в пуле (в каждом веб-воркере и в боте)
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', 2))
+# Сколько задач может ждать и выполняться одновременно
+PDF_QUEUE_SIZE = int(os.environ.get('PDF_QUEUE_SIZE', 16))
+# Предельное время одной задачи, секунд
+PDF_TIMEOUT = float(os.environ.get('PDF_TIMEOUT', 60))
+
+# Границы корзин для длины очереди (штук, а не мс)
+QUEUE_DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class PdfQueueFull(Exception):
+    """Очередь PDF заполнена - задачу нужно повторить позже"""
+
+
+class PdfTimeout(Exception):
+    """Задача PDF не уложилась в PDF_TIMEOUT"""
+
+
+class PdfAborted(Exception):
+    """Задачу остановил перезапуск пула из-за таймаута другой задачи"""
+
+
+class _Job:
+    """Задача в пуле; ждем ее события, чтобы перезапуск пула мог разбудить ожидающего"""
+
+    __slots__ = ('pool', 'done', 'value', 'error', 'aborted')
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.aborted = False
+
+    def set_result(self, value):
+        self.value = value
+        self.done.set()
+
+    def set_error(self, error):
+        self.error = error
+        self.done.set()
+
+    def abort(self):
+        if not self.done.is_set():
+            self.aborted = True
+            self.done.set()
+
+
+def _render(func, args, kwargs):
+    """Выполняется в процессе пула: результат и время рендера, мс"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def _init_worker():
+    # Шрифты регистрируются при импорте pdf_generator - один раз на процесс пула
+    import pdf_generator  # noqa: F401
+
+
+class PdfService:
+    """Пул процессов для PDF с ограниченной очередью, таймаутами и метриками"""
+
+    def __init__(self, workers=PDF_WORKERS, queue_size=PDF_QUEUE_SIZE, timeout=PDF_TIMEOUT):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._pool = None
+        self._depth = 0
+        self._jobs = set()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(queue_size)
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn, а не fork: в веб-воркере и боте уже работают потоки
+                context = multiprocessing.get_context('spawn')
+                self._pool = context.Pool(self.workers, initializer=_init_worker)
+            return self._pool
+
+    def _restart(self, pool, stuck):
+        """Останавливает пул с зависшей задачей stuck; следующая задача создаст новый
+
+        Остальные задачи этого пула прерываются сразу, а не по своему таймауту.
+        """
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+            aborted = [job for job in self._jobs if job.pool is pool and job is not stuck]
+        pool.terminate()
+        for job in aborted:
+            job.abort()
+
+    def _submit(self, kind, func, args, kwargs, timeout):
+        """Одна попытка выполнить задачу: (результат, время рендера, мс)"""
+        pool = self._get_pool()
+        job = _Job(pool)
+        with self._lock:
+            self._jobs.add(job)
+        try:
+            try:
+                pool.apply_async(_render, (func, args, kwargs), callback=job.set_result,
+                                 error_callback=job.set_error)
+            except ValueError:  # пул уже остановлен другой задачей
+                job.abort()
+            if not job.done.wait(timeout):
+                web_metrics.observe(f"pdf.timeout.{kind}", 0)
+                logger.error(f"PDF job {kind} timed out after {self.timeout}s, restarting the pool")
+                self._restart(pool, job)
+                raise PdfTimeout(f"PDF job {kind} timed out after {self.timeout}s")
+        finally:
+            with self._lock:
+                self._jobs.discard(job)
+        if job.aborted:
+            web_metrics.observe(f"pdf.aborted.{kind}", 0)
+            raise PdfAborted(f"PDF job {kind} was stopped by a pool restart")
+        if job.error is not None:
+            raise job.error
+        return job.value
+
+    def render(self, kind, func, *args, **kwargs):
+        """Выполняет func(*args, **kwargs) в пуле и возвращает ее результат
+
+        func должна быть функцией уровня модуля, а аргументы - простыми
+        данными (dict, list, SimpleNamespace): они передаются через pickle.
+        """
+        if not self._slots.acquire(blocking=False):
+            web_metrics.observe(f"pdf.rejected.{kind}", 0)
+            raise PdfQueueFull(f"PDF queue is full ({self.queue_size} jobs)")
+        with self._lock:
+            self._depth += 1
+            depth = self._depth
+        web_metrics.histogram('pdf.queue_depth', QUEUE_DEPTH_BUCKETS).observe(depth)
+        start = time.perf_counter()
+        try:
+            # PDF_TIMEOUT - на сам рендер: задача ждет, пока пул пройдет очередь перед ней
+            timeout = self.timeout * -(-depth // self.workers)
+            try:
+                result, render_ms = self._submit(kind, func, args, kwargs, timeout)
+            except PdfAborted:
+                # Задача не виновата в таймауте: один раз повторяем ее в новом пуле
+                logger.warning(f"PDF job {kind} was stopped by a pool restart, retrying")
+                result, render_ms = self._submit(kind, func, args, kwargs, timeout)
+            web_metrics.observe(f"pdf.render.{kind}", render_ms)
+            web_metrics.observe(f"pdf.wait.{kind}", (time.perf_counter() - start) * 1000 - render_ms)
+            return result
+        finally:
+            with self._lock:
+                self._depth -= 1
+            self._slots.release()
+
+    def stats(self):
+        return {'workers': self.workers, 'queue_size': self.queue_size, 'depth': self._depth}
+
+    def stop(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    # --- Задачи ---
+
+    def order_pdf(self, order, description, output_path=None):
+        """PDF заказа сайта: путь output_path или байты, если путь не задан"""
+        return self.render('order', pdf_generator.generate_order_pdf, dict(order), description, output_path)
+
+    def admin_report(self, status_rows, total_users, recent_orders):
+        """Отчет администратора бота в байтах (см. pdf_generator.render_admin_report)
+
+        Передаются только итоги GROUP BY status и последние заказы (простые
+        объекты с полями модели), поэтому объем данных не растет с базой.
+        Кэш разделов отчета (pdf_generator.ADMIN_REPORT_CACHE) свой в каждом
+        процессе пула и пропадает при его перезапуске - отчеты попадают в кэш,
+        только если пул из одного процесса (так он создается в боте).
+        """
+        return self.render('admin_report', pdf_generator.render_admin_report,
+                           list(status_rows), total_users, list(recent_orders))
@@ -4,19 +4,28 @@ Simple version of T1EUP Web Application without SQLAlchemy
 For deployment compatibility
 """
 
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, send_from_directory
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, send_from_directory, g, make_response
 import os
-import json
 from datetime import datetime
 import requests
 from dotenv import load_dotenv
 import logging
 import uuid
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
+import click
+import hashlib
+import atexit
+from functools import wraps
+from werkzeug.security import safe_join
+from web_storage import create_store
+from web_locks import LockManager
+from web_cache import PageCache, StaticPages, CACHE_CONTROL, cached_view, file_etag
+from web_api import create_api
+from web_jobs import JobQueue
+from web_assets import AssetPipeline
+from web_sessions import SessionManager, ROLE_ADMIN, ROLE_USER
+from pdf_service import PdfService
+import image_derivatives
+import web_metrics
 
 # Загружаем переменные окружения
 load_dotenv()
@@ -34,15 +43,8 @@ logger = logging.getLogger(__name__)
 # Простая база данных в JSON файле
 DB_FILE = 'simple_db.json'
 
-def load_db():
-    """Загружает данные из JSON файла"""
-    try:
-        if os.path.exists(DB_FILE):
-            with open(DB_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-    except Exception as e:
-        logger.error(f"Error loading database: {e}")
-    
+def default_db():
+    """Начальные данные, если файла базы еще нет"""
     return {
         'users': {},
         'orders': {},
@@ -158,20 +160,156 @@ def load_db():
         ]
     }
 
+# Хранилище: JSON части (simple_db.catalog/users/orders.json с журналами) или SQLite (WEB_STORAGE_BACKEND)
+store = create_store(DB_FILE, default_db)
+
+# Блокировки для операций "прочитать - изменить - записать" (между воркерами gunicorn);
+# после взятия блокировки таблица перечитывается, даже если запрос уже читал ее раньше
+locks = LockManager(DB_FILE, on_acquire=store.refresh)
+
+@app.before_request
+def begin_db_snapshot():
+    """Все чтения запроса видят одну версию базы: каждая часть сверяется с диском один раз"""
+    store.begin_request()
+    g.db_snapshot = True
+
+@app.teardown_request
+def end_db_snapshot(exc):
+    if g.pop('db_snapshot', False):
+        store.end_request()
+
+# Номер телефона администратора: при входе с ним сессия получает роль admin
+ADMIN_PHONE = os.environ.get('ADMIN_PHONE', '87718626629')
+
+# Подписанные сессии (cookie session_token): id пользователя и роль проверяются без чтения базы
+sessions = SessionManager(app.secret_key, os.environ.get('SESSION_REVOCATIONS', 'simple_db.sessions.revoked'))
+
+def admin_required(view):
+    """Админский маршрут: роль берется из подписанной сессии"""
+    @wraps(view)
+    def wrapper(**kwargs):
+        auth = sessions.current()
+        if auth is None:
+            return redirect(url_for('login'))
+        if not auth.is_admin:
+            return "Доступ запрещен", 403
+        return view(**kwargs)
+    return wrapper
+
+# Бит в id пользователя: 53 - самое широкое целое, которое браузер (cookie user_id в JS) читает точно
+USER_ID_BITS = 53
+
+def user_id_for_phone(phone):
+    """Постоянный id пользователя по телефону (hash() строк меняется при каждом запуске процесса)
+
+    Старшие 53 бита sha256: при миллионе пользователей вероятность, что два
+    телефона получат один id (и общий аккаунт), порядка 10^-4.
+    """
+    return int(hashlib.sha256(phone.encode('utf-8')).hexdigest(), 16) >> (256 - USER_ID_BITS)
+
+# Готовые страницы каталога; устаревают, когда меняется версия каталога
+# (ее увеличивают put_tie/delete_tie в админских маршрутах, в том числе в других воркерах)
+# или содержимое TieUp/ (копии фото от build-image-derivatives и бота)
+page_cache = PageCache()
+# Постоянные страницы (вход, пустая форма галстука): готовые байты и gzip копия
+static_pages = StaticPages()
+
+def cached_page(unit):
+    """Отдает страницу из памяти, пока версия части базы unit не изменилась
+
+    Шаблоны каталога не зависят от пользователя (состояние входа
+    обрабатывается в JS), поэтому одна копия страницы подходит всем.
+    """
+    if unit == 'catalog':
+        # srcset в страницах зависит от того, какие копии фото уже созданы
+        return cached_view(page_cache, lambda: (store.version(unit), tie_images_version()), CACHE_CONTROL[unit])
+    return cached_view(page_cache, lambda: store.version(unit), CACHE_CONTROL[unit])
+
+def tie_images_version():
+    """Меняется при создании и удалении файлов в TieUp/ (mtime каталога)"""
+    try:
+        return os.stat(os.path.join(app.root_path, 'TieUp')).st_mtime_ns
+    except OSError:
+        return 0
+
+# JSON API: /api/v1/... и /api/... (текущая версия)
+api = create_api(store, page_cache, sessions)
+app.register_blueprint(api, url_prefix='/api/v1')
+app.register_blueprint(api, url_prefix='/api', name='api_latest')
+
+# CSS/JS с хэшем содержимого в имени (/assets/css/style.<хэш>.css), уже сжатые gzip/brotli;
+# в шаблонах адрес дает asset_url('css/style.css')
+assets = AssetPipeline(app.static_folder)
+assets.init_app(app)
+try:
+    assets.build()
+except OSError as e:
+    logger.error(f"Error building static assets, serving them from /static: {e}")
+
+@app.after_request
+def default_cache_control(response):
+    """Ответы без своей политики кэширования (профиль, заказы, админка) не сохраняются"""
+    if request.endpoint != 'static' and 'Cache-Control' not in response.headers:
+        response.headers['Cache-Control'] = CACHE_CONTROL['private']
+    return response
+
+def load_db():
+    """Возвращает всю базу словарем (только для чтения, изменять через store)"""
+    return store.snapshot()
+
 def save_db(data):
-    """Сохраняет данные в JSON файл"""
+    """Полностью перезаписывает базу (изменения отдельных записей идут через store)"""
     try:
-        with open(DB_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        store.replace(data)
     except Exception as e:
         logger.error(f"Error saving database: {e}")
         raise
 
+@app.cli.command('export-db')
+@click.argument('path', default='simple_db.export.json')
+@click.option('--format', 'fmt', default='pretty', help='pretty, json, orjson или msgpack')
+def export_db(path, fmt):
+    """Выгружает базу одним файлом для отладки: flask --app simple_app export-db dump.json"""
+    store.export(path, fmt)
+    click.echo(f"Database exported into {path}")
+
+@app.cli.command('build-assets')
+def build_assets():
+    """Пересобирает static/build/ (при запуске приложения это делается автоматически)"""
+    manifest = assets.build()
+    click.echo(f"Built {len(manifest)} static assets")
+
+@app.cli.command('build-image-derivatives')
+def build_image_derivatives():
+    """Создает уменьшенные копии для фото в TieUp/, у которых их еще нет"""
+    count = image_derivatives.generate_missing(os.path.join(app.root_path, 'TieUp'))
+    # Кэш страниц в работающих воркерах устаревает сам: меняется mtime TieUp/ (tie_images_version)
+    click.echo(f"Generated {count} image derivatives")
+
+@app.template_global()
+def tie_srcset(image_path, ext):
+    """srcset из уменьшенных копий фото галстука и оригинала ('' если копий нет)
+
+    Оригинал идет последним кандидатом со своей настоящей шириной, чтобы
+    широкие экраны с высокой плотностью пикселей получали полное фото.
+    """
+    filename = image_path.split('/')[-1]
+    path = os.path.join(app.root_path, 'TieUp', filename)
+    derivatives = image_derivatives.available_derivatives(path, ext)
+    if not derivatives:
+        return ''
+    candidates = [f"{url_for('tie_images', filename=name)} {width}w" for name, width in derivatives]
+    width = image_derivatives.original_width(path)
+    if width and width > derivatives[-1][1]:
+        candidates.append(f"{url_for('tie_images', filename=filename)} {width}w")
+    return ', '.join(candidates)
+
+app.jinja_env.globals['image_formats'] = [(ext, mime) for ext, (_, mime) in image_derivatives.DERIVATIVE_FORMATS.items()]
+
 def get_all_active_ties():
     """Возвращает все активные галстуки"""
     try:
-        db = load_db()
-        ties = [tie for tie in db['ties'] if tie.get('active', True)]
+        ties = store.list_ties(active_only=True)
         logger.info(f"Loaded {len(ties)} active ties from database")
         return ties
     except Exception as e:
@@ -180,60 +318,60 @@ def get_all_active_ties():
 
 def create_order(tie_id, recipient_name, recipient_surname, recipient_phone, delivery_address, user_id):
     """Создает новый заказ"""
-    db = load_db()
-    ties = {tie['id']: tie for tie in db['ties']}
-    
-    if tie_id not in ties:
-        return None
-    
-    tie = ties[tie_id]
-    order_id = len(db['orders']) + 1
-    
-    order = {
-        'id': order_id,
-        'tie_id': tie_id,
-        'tie_name': tie['name_ru'],
-        'price': tie['price'],
-        'recipient_name': recipient_name,
-        'recipient_surname': recipient_surname,
-        'recipient_phone': recipient_phone,
-        'delivery_address': delivery_address,
-        'user_id': user_id,
-        'status': 'pending',
-        'created_at': datetime.now().isoformat()
-    }
-    
-    db['orders'][str(order_id)] = order
-    save_db(db)
-    return order
+    with locks.lock('orders'):
+        tie = store.get_tie(tie_id)
+        
+        if not tie:
+            return None
+        
+        order_id = store.next_order_id()
+        
+        order = {
+            'id': order_id,
+            'tie_id': tie_id,
+            'tie_name': tie['name_ru'],
+            'price': tie['price'],
+            'recipient_name': recipient_name,
+            'recipient_surname': recipient_surname,
+            'recipient_phone': recipient_phone,
+            'delivery_address': delivery_address,
+            'user_id': user_id,
+            'status': 'pending',
+            'created_at': datetime.now().isoformat()
+        }
+        
+        return store.put_order(order)
 
 def get_or_create_user(user_id, username, first_name, last_name):
     """Получает или создает пользователя"""
-    db = load_db()
-    
-    if str(user_id) not in db['users']:
-        db['users'][str(user_id)] = {
-            'id': user_id,
-            'username': username,
-            'first_name': first_name,
-            'last_name': last_name,
-            'created_at': datetime.now().isoformat()
-        }
-        save_db(db)
-    
-    return db['users'][str(user_id)]
+    with locks.lock('users'):
+        user = store.get_user(user_id)
+
+        if user is None:
+            user = store.put_user({
+                'id': user_id,
+                'username': username,
+                'first_name': first_name,
+                'last_name': last_name,
+                'created_at': datetime.now().isoformat()
+            })
+
+    return user
 
 def get_user_orders(user_id):
     """Возвращает заказы пользователя"""
     try:
-        db = load_db()
-        return [order for order in db['orders'].values() if order.get('user_id') == user_id]
+        return store.user_orders(user_id)
     except Exception as e:
         logger.error(f"Error loading user orders: {e}")
         return []
 
 def create_order_pdf(order):
-    """Создает PDF с информацией о заказе"""
+    """Создает PDF с информацией о заказе (в пуле процессов pdf_service)
+
+    Ошибка записывается в лог и пробрасывается дальше, чтобы очередь
+    задач сохранила настоящую причину в last_error.
+    """
     try:
         # Создаем уникальное имя файла
         filename = f"order_{order['id']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
@@ -242,84 +380,17 @@ def create_order_pdf(order):
         # Создаем папку если не существует
         os.makedirs(os.path.dirname(filepath), exist_ok=True)
         
-        # Создаем PDF документ
-        doc = SimpleDocTemplate(filepath, pagesize=A4)
-        styles = getSampleStyleSheet()
-        story = []
+        # В заказе нет описания товара - берем его из каталога
+        description = order.get('tie_description') or (store.get_tie(order.get('tie_id')) or {}).get('description_ru', '')
         
-        # Заголовок
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=24,
-            spaceAfter=30,
-            alignment=1,  # Center alignment
-            textColor=colors.darkblue
-        )
-        story.append(Paragraph("ЗАКАЗ #" + str(order['id']), title_style))
-        story.append(Spacer(1, 20))
-        
-        # Информация о заказе
-        order_data = [
-            ['Номер заказа:', str(order['id'])],
-            ['Дата создания:', order['created_at'][:16] if order['created_at'] else 'Неизвестно'],
-            ['Статус:', 'Ожидает оплаты'],
-            ['', ''],
-            ['ПОКУПАТЕЛЬ:', ''],
-            ['Имя:', order['recipient_name']],
-            ['Фамилия:', order.get('recipient_surname', '')],
-            ['Телефон:', order['recipient_phone']],
-            ['Адрес доставки:', order['delivery_address']],
-            ['', ''],
-            ['ТОВАР:', ''],
-            ['Название:', order['tie_name']],
-            ['Описание:', order['tie_description'][:100] + '...' if len(order['tie_description']) > 100 else order['tie_description']],
-            ['Цена:', f"{order['price']:,.0f} ₸"],
-        ]
-        
-        # Создаем таблицу
-        table = Table(order_data, colWidths=[2*inch, 4*inch])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-            ('BACKGROUND', (0, 4), (-1, 4), colors.darkblue),
-            ('TEXTCOLOR', (0, 4), (-1, 4), colors.whitesmoke),
-            ('BACKGROUND', (0, 9), (-1, 9), colors.darkgreen),
-            ('TEXTCOLOR', (0, 9), (-1, 9), colors.whitesmoke),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        
-        story.append(table)
-        story.append(Spacer(1, 30))
-        
-        # Подпись
-        footer_style = ParagraphStyle(
-            'Footer',
-            parent=styles['Normal'],
-            fontSize=10,
-            alignment=1,
-            textColor=colors.grey
-        )
-        story.append(Paragraph(f"Документ создан: {datetime.now().strftime('%d.%m.%Y в %H:%M')}", footer_style))
-        
-        # Собираем PDF
-        doc.build(story)
-        
-        return filepath
+        return pdf_service.order_pdf(order, description, filepath)
     except Exception as e:
         logger.error(f"Error creating PDF: {e}")
-        return None
+        raise
 
-def send_admin_notification(order):
+def send_admin_notification(order, pdf_path=None):
     """Отправляет уведомление админу с PDF"""
     try:
-        # Создаем PDF
-        pdf_path = create_order_pdf(order)
-        
         # Выводим информацию в консоль
         print(f"🛍️ НОВЫЙ ЗАКАЗ #{order['id']}")
         print(f"👤 Покупатель: {order['recipient_name']} {order.get('recipient_surname', '')}")
@@ -339,8 +410,36 @@ def send_admin_notification(order):
         logger.error(f"Error sending admin notification: {e}")
         return False
 
+def process_new_order(order_id):
+    """Фоновая задача после оформления заказа: PDF и уведомление админу
+
+    Исключение - неудачная попытка: очередь повторит задачу позже,
+    а после JOB_MAX_ATTEMPTS попыток перенесет ее в dead.
+    """
+    order = store.get_order(order_id)
+    if order is None:
+        raise LookupError(f"Order #{order_id} not found")
+    pdf_path = create_order_pdf(order)
+    if not send_admin_notification(order, pdf_path):
+        raise RuntimeError(f"Admin notification for order #{order_id} failed")
+
+# PDF строятся в пуле процессов: поток задачи только ждет результат
+pdf_service = PdfService()
+atexit.register(pdf_service.stop)
+
+# Очередь фоновых задач на диске (simple_db.jobs/), пул потоков в каждом воркере
+job_queue = JobQueue(os.environ.get('JOB_QUEUE_DIR', 'simple_db.jobs'))
+job_queue.register('order_created', process_new_order)
+atexit.register(job_queue.stop)
+
+@app.before_request
+def start_job_workers():
+    """Пул исполнителей запускается в каждом воркере при первом запросе"""
+    job_queue.start()
+
 # Маршруты
 @app.route('/')
+@cached_page('catalog')
 def index():
     try:
         logger.info("Loading index page")
@@ -352,17 +451,16 @@ def index():
         return f"Ошибка загрузки главной страницы: {str(e)}", 500
 
 @app.route('/tie/<int:tie_id>')
+@cached_page('catalog')
 def tie_detail(tie_id):
-    db = load_db()
-    tie = next((t for t in db['ties'] if t['id'] == tie_id), None)
+    tie = store.get_tie(tie_id)
     if not tie:
         return "Галстук не найден", 404
     return render_template('tie_detail.html', tie=tie)
 
 @app.route('/order/<int:tie_id>')
 def order_form(tie_id):
-    db = load_db()
-    tie = next((t for t in db['ties'] if t['id'] == tie_id), None)
+    tie = store.get_tie(tie_id)
     if not tie:
         return "Галстук не найден", 404
     return render_template('order_form.html', tie=tie)
@@ -374,9 +472,10 @@ def create_order_page(tie_id):
 
 @app.route('/order/<int:tie_id>', methods=['POST'])
 def create_order_route(tie_id):
-    user_id = request.cookies.get('user_id')
-    if not user_id:
+    auth = sessions.current()
+    if auth is None:
         return jsonify({'success': False, 'error': 'Пользователь не авторизован'})
+    user_id = auth.user_id
     
     recipient_name = request.form.get('recipient_name')
     recipient_surname = request.form.get('recipient_surname')
@@ -386,10 +485,11 @@ def create_order_route(tie_id):
     if not all([recipient_name, recipient_phone, delivery_address]):
         return jsonify({'success': False, 'error': 'Заполните все обязательные поля'})
     
-    order = create_order(tie_id, recipient_name, recipient_surname, recipient_phone, delivery_address, int(user_id))
+    order = create_order(tie_id, recipient_name, recipient_surname, recipient_phone, delivery_address, user_id)
     
     if order:
-        send_admin_notification(order)
+        # PDF и уведомление - после записи заказа, вне запроса
+        job_queue.enqueue('order_created', order_id=order['id'])
         return jsonify({
             'success': True, 
             'order_id': order['id'],
@@ -400,8 +500,7 @@ def create_order_route(tie_id):
 
 @app.route('/order/success/<int:order_id>')
 def order_success(order_id):
-    db = load_db()
-    order = db['orders'].get(str(order_id))
+    order = store.get_order(order_id)
     if not order:
         return "Заказ не найден", 404
     return render_template('order_success.html', order=order)
@@ -409,14 +508,13 @@ def order_success(order_id):
 @app.route('/profile')
 def profile():
     try:
-        user_id = request.cookies.get('user_id')
-        if not user_id:
+        auth = sessions.current()
+        if auth is None:
             return redirect(url_for('login'))
         
         # Получаем информацию о пользователе
-        db = load_db()
-        user = db['users'].get(str(user_id), {})
-        orders = get_user_orders(int(user_id))
+        user = store.get_user(auth.user_id) or {}
+        orders = get_user_orders(auth.user_id)
         
         # Вычисляем общую сумму потраченных денег
         total_spent = sum(order.get('price', 0) for order in orders)
@@ -428,101 +526,8 @@ def profile():
 
 @app.route('/login')
 def login():
-    """Красивая страница входа с валидацией"""
-    return """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Вход - T1EUP</title>
-        <meta charset="utf-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <meta http-equiv="Cache-Control" content="no-cache, no-store, must-revalidate">
-        <meta http-equiv="Pragma" content="no-cache">
-        <meta http-equiv="Expires" content="0">
-        <link rel="stylesheet" href="/static/css/login.css?v=2.1">
-    </head>
-    <body>
-        <div class="login-container">
-            <div class="logo">
-                <h1>T1EUP</h1>
-                <p>Магазин элегантных галстуков</p>
-            </div>
-            
-            <form method="post" action="/login" id="loginForm">
-                <div class="form-group">
-                    <label for="name">Ваше имя</label>
-                    <input type="text" name="name" id="name" required minlength="2" maxlength="50">
-                    <div class="error" id="nameError">Имя должно содержать от 2 до 50 символов</div>
-                </div>
-                <div class="form-group">
-                    <label for="phone">Номер телефона</label>
-                    <input type="tel" name="phone" id="phone" required pattern="[0-9]{10,11}" placeholder="87718626629">
-                    <div class="error" id="phoneError">Введите корректный номер телефона (10-11 цифр)</div>
-                </div>
-                
-                <button type="submit" class="btn">Войти в магазин</button>
-            </form>
-            
-            <div class="features">
-                <h3>Почему выбирают нас?</h3>
-                <ul class="feature-list">
-                    <li>Эксклюзивные дизайны</li>
-                    <li>Качественные материалы</li>
-                    <li>Быстрая доставка</li>
-                    <li>Гарантия качества</li>
-                </ul>
-            </div>
-        </div>
-        
-        <script>
-        document.getElementById('loginForm').addEventListener('submit', function(e) {
-            let isValid = true;
-            
-            // Валидация имени
-            const name = document.getElementById('name').value.trim();
-            const nameError = document.getElementById('nameError');
-            if (name.length < 2 || name.length > 50) {
-                nameError.style.display = 'block';
-                isValid = false;
-            } else {
-                nameError.style.display = 'none';
-            }
-            
-            // Валидация телефона
-            const phone = document.getElementById('phone').value.replace(/\D/g, '');
-            const phoneError = document.getElementById('phoneError');
-            if (phone.length < 10 || phone.length > 11) {
-                phoneError.style.display = 'block';
-                isValid = false;
-            } else {
-                phoneError.style.display = 'none';
-            }
-            
-            if (!isValid) {
-                e.preventDefault();
-            }
-        });
-        
-        // Автоформатирование телефона - исправлено для казахстанских номеров
-        document.getElementById('phone').addEventListener('input', function(e) {
-            let value = e.target.value.replace(/\D/g, '');
-            
-            // Не удаляем 7, если она в начале
-            if (value.startsWith('7') && value.length > 1) {
-                value = value.substring(1);
-            }
-            
-            // Ограничиваем до 11 цифр (для казахстанских номеров)
-            if (value.length > 11) {
-                value = value.substring(0, 11);
-            }
-            
-            e.target.value = value;
-        });
-        </script>
-    </body>
-    </html>
-    """
+    """Красивая страница входа с валидацией (постоянная: рендерится один раз за процесс)"""
+    return static_pages.get('login', lambda: render_template('login.html')).response(CACHE_CONTROL['page'])
 
 @app.route('/login', methods=['POST'])
 def login_post():
@@ -535,45 +540,41 @@ def login_post():
             return "Заполните все поля", 400
         
         # Создаем простого пользователя
-        user_id = abs(hash(phone)) % 1000000  # Простой ID на основе телефона
+        user_id = user_id_for_phone(phone)  # Постоянный ID на основе телефона
         
         # Проверяем, является ли пользователь админом по номеру телефона
-        is_admin = phone == '87718626629'
+        is_admin = phone == ADMIN_PHONE
         
         logger.info(f"Login attempt - name: '{name}', phone: '{phone}', is_admin: {is_admin}")
-        logger.info(f"Phone comparison: '{phone}' == '87718626629' = {phone == '87718626629'}")
-        
-        user = {
-            'id': user_id,
-            'name': name,
-            'phone': phone,
-            'is_admin': is_admin,
-            'created_at': datetime.now().isoformat()
-        }
-        
-        # Сохраняем пользователя
-        db = load_db()
         
-        # Если пользователь уже существует, обновляем его данные
-        if str(user_id) in db['users']:
-            existing_user = db['users'][str(user_id)]
-            logger.info(f"Updating existing user: {existing_user}")
-            # Обновляем номер телефона и админские права
-            existing_user['phone'] = phone
-            existing_user['is_admin'] = is_admin
-            existing_user['name'] = name
-            db['users'][str(user_id)] = existing_user
-        else:
-            db['users'][str(user_id)] = user
-            
-        save_db(db)
-        logger.info(f"Saved user: {db['users'][str(user_id)]}")
-        
-        # Устанавливаем cookie и редиректим на главную страницу
+        with locks.lock('users'):
+            existing_user = store.get_user(user_id)
+            if existing_user is not None:
+                # Если пользователь уже существует, обновляем его данные
+                logger.info(f"Updating existing user: {existing_user}")
+                if existing_user.get('is_admin', False) != is_admin:
+                    # Роль изменилась: старые сессии с прежней ролью больше не действуют
+                    sessions.revoke_user(user_id)
+                # Обновляем имя и админские права
+                user = dict(existing_user)
+                user['is_admin'] = is_admin
+                user['name'] = name
+            else:
+                user = {
+                    'id': user_id,
+                    'name': name,
+                    'phone': phone,
+                    'is_admin': is_admin,
+                    'created_at': datetime.now().isoformat()
+                }
+
+            # Сохраняем пользователя
+            store.put_user(user)
+        logger.info(f"Saved user: {user}")
+        
+        # Выдаем сессию и редиректим на главную страницу
         response = redirect(url_for('index'))
-        response.set_cookie('user_id', str(user_id), max_age=30*24*60*60)  # 30 дней
-        
-        return response
+        return sessions.login(response, user_id, ROLE_ADMIN if is_admin else ROLE_USER)
     except Exception as e:
         logger.error(f"Error in login_post: {e}")
         return f"Ошибка входа: {str(e)}", 500
@@ -581,66 +582,47 @@ def login_post():
 @app.route('/logout')
 def logout():
     """Выход из системы"""
-    response = redirect(url_for('index'))
-    response.set_cookie('user_id', '', expires=0)
-    return response
+    return sessions.logout(redirect(url_for('index')))
 
 @app.route('/admin/force-login')
 def admin_force_login():
-    """Принудительный вход как админ для отладки"""
-    user_id = request.cookies.get('user_id')
-    if not user_id:
+    """Принудительный вход как админ для отладки (только в режиме отладки Flask)"""
+    if not app.debug:
+        return "Страница не найдена.", 404
+    auth = sessions.current()
+    if auth is None:
         return redirect(url_for('login'))
+    user_id = auth.user_id
     
-    db = load_db()
-    user = db['users'].get(str(user_id), {})
-    
-    # Принудительно делаем пользователя админом
-    user['phone'] = '87718626629'
-    user['is_admin'] = True
-    db['users'][str(user_id)] = user
-    save_db(db)
+    with locks.lock('users'):
+        user = dict(store.get_user(user_id) or {'id': user_id})
+
+        # Принудительно делаем пользователя админом
+        user['phone'] = ADMIN_PHONE
+        user['is_admin'] = True
+        store.put_user(user)
     
     logger.info(f"Force admin login for user {user_id}: {user}")
     
-    return f"""
-    <html>
-    <head>
-        <title>Принудительный вход как админ - T1EUP</title>
-        <meta charset="utf-8">
-        <style>
-            body {{ font-family: Arial, sans-serif; max-width: 600px; margin: 50px auto; padding: 20px; text-align: center; }}
-            .success {{ background: #d4edda; color: #155724; padding: 20px; border-radius: 10px; border: 1px solid #c3e6cb; }}
-            .btn {{ padding: 10px 20px; background: #007bff; color: white; text-decoration: none; border-radius: 5px; }}
-        </style>
-    </head>
-    <body>
-        <h2>Принудительный вход как админ</h2>
-        <div class="success">
-            <p>Вы принудительно вошли как администратор!</p>
-            <p>Ваш номер: {user['phone']}</p>
-            <p>Статус: Администратор ✅</p>
-        </div>
-        <br>
-        <a href="/admin" class="btn">Перейти в админ-панель</a>
-    </body>
-    </html>
-    """
+    response = make_response(render_template('admin/message.html', title='Принудительный вход как админ',
+                           heading='Принудительный вход как админ', link_text='Перейти в админ-панель',
+                           rows=[(None, 'Вы принудительно вошли как администратор!'),
+                                 (None, f"Ваш номер: {user['phone']}"),
+                                 (None, 'Статус: Администратор ✅')]))
+    return sessions.login(response, user_id, ROLE_ADMIN)
 
 
 @app.route('/check-user-status', methods=['POST'])
 def check_user_status():
-    """Проверка статуса пользователя"""
-    data = request.get_json()
+    """Проверка статуса пользователя (роль - из подписанной сессии)"""
+    data = request.get_json(silent=True) or {}
     user_id = data.get('id')
     
     if not user_id:
         return jsonify({'success': False, 'error': 'ID пользователя не предоставлен'})
     
-    # Проверяем, является ли пользователь админом по номеру телефона
-    db = load_db()
-    user = db['users'].get(str(user_id), {})
-    is_admin = user.get('is_admin', False)
+    auth = sessions.current()
+    is_admin = auth is not None and auth.is_admin and str(auth.user_id) == str(user_id)
     
     return jsonify({
         'success': True,
@@ -649,275 +631,84 @@ def check_user_status():
 
 @app.route('/TieUp/<path:filename>')
 def tie_images(filename):
-    return send_from_directory('TieUp', filename)
+    """Фото галстуков с ETag по содержимому файла (повторный запрос - 304)"""
+    path = safe_join(os.path.join(app.root_path, 'TieUp'), filename)
+    try:
+        etag = file_etag(path) if path else True
+    except OSError:
+        etag = True
+    response = send_from_directory('TieUp', filename, etag=etag)
+    response.headers['Cache-Control'] = CACHE_CONTROL['images']
+    return response
 
 # Админские маршруты
+# Размеры страницы каталога в админке
+ADMIN_PAGE_SIZES = (20, 50, 100)
+
+def admin_catalog_query():
+    """Параметры страницы /admin: page, limit, status, min_price, max_price, sort, order"""
+    def number(name):
+        value = request.args.get(name, '').strip()
+        return int(value) if value.isdigit() else None
+    
+    limit = number('limit')
+    status = request.args.get('status')
+    sort = request.args.get('sort')
+    return {
+        'page': max(1, number('page') or 1),
+        'limit': limit if limit in ADMIN_PAGE_SIZES else ADMIN_PAGE_SIZES[0],
+        'status': status if status in ('active', 'inactive') else '',
+        'min_price': number('min_price'),
+        'max_price': number('max_price'),
+        'sort': sort if sort in ('position', 'id', 'name', 'price') else 'position',
+        'order': 'desc' if request.args.get('order') == 'desc' else 'asc'
+    }
+
 @app.route('/admin')
 def admin_catalog():
     """Админ-панель - каталог товаров"""
-    user_id = request.cookies.get('user_id')
-    if not user_id:
+    auth = sessions.current()
+    if auth is None:
         return redirect(url_for('login'))
     
-    db = load_db()
-    
-    # Проверяем, является ли пользователь админом
-    user = db['users'].get(str(user_id), {})
+    # Роль из подписанной сессии; пользователь из базы нужен только для приветствия
+    user_id = auth.user_id
+    user = store.get_user(user_id) or {}
     user_phone = user.get('phone', '')
     
-    # Простая проверка админа по номеру телефона
-    logger.info(f"Checking admin access for user_id: {user_id}, phone: '{user_phone}', expected: '87718626629'")
-    logger.info(f"Phone comparison: '{user_phone}' == '87718626629' = {user_phone == '87718626629'}")
-    
-    if user_phone != '87718626629':
-        return f"""
-        <html>
-        <head>
-            <title>Доступ запрещен - T1EUP</title>
-            <meta charset="utf-8">
-            <style>
-                body {{ font-family: Arial, sans-serif; max-width: 600px; margin: 50px auto; padding: 20px; text-align: center; }}
-                .error {{ background: #f8d7da; color: #721c24; padding: 20px; border-radius: 10px; border: 1px solid #f5c6cb; }}
-                .debug {{ background: #e2e3e5; color: #383d41; padding: 15px; border-radius: 5px; margin: 10px 0; font-family: monospace; }}
-                .btn {{ padding: 10px 20px; background: #007bff; color: white; text-decoration: none; border-radius: 5px; }}
-            </style>
-        </head>
-        <body>
-            <h2>Доступ запрещен</h2>
-            <div class="error">
-                <p>Только для администраторов!</p>
-                <p>Ваш номер: '{user_phone}'</p>
-                <p>Админский номер: '87718626629'</p>
-                <p>Длина вашего номера: {len(user_phone)}</p>
-                <p>Длина админского номера: {len('87718626629')}</p>
-            </div>
-            <div class="debug">
-                <p><strong>Отладочная информация:</strong></p>
-                <p>User ID: {user_id}</p>
-                <p>User object: {user}</p>
-                <p>Phone type: {type(user_phone)}</p>
-                <p>Phone repr: {repr(user_phone)}</p>
-            </div>
-            <br>
-            <a href="/" class="btn">На главную</a>
-            <a href="/admin/force-login" class="btn" style="background: #28a745;">Принудительный вход как админ</a>
-        </body>
-        </html>
-        """, 403
-    ties = db['ties']
-    orders = list(db['orders'].values())
-    
-    # Вычисляем статистику
-    total_ties = len(ties)
-    active_ties = len([t for t in ties if t.get('active', True)])
-    avg_price = sum(t.get('price', 0) for t in ties) / total_ties if total_ties > 0 else 0
-    
-    return f"""
-    <html>
-    <head>
-        <title>Админ-панель - T1EUP</title>
-        <meta charset="utf-8">
-        <style>
-            body {{ font-family: Arial, sans-serif; max-width: 1000px; margin: 50px auto; padding: 20px; }}
-            .admin-panel {{ background: #f8f9fa; padding: 20px; border-radius: 10px; }}
-            .stats {{ display: flex; gap: 20px; margin-bottom: 20px; }}
-            .stat-box {{ background: white; padding: 15px; border-radius: 5px; flex: 1; }}
-            .btn {{ padding: 10px 20px; background: #007bff; color: white; text-decoration: none; border-radius: 5px; margin: 5px; }}
-            .btn:hover {{ background: #0056b3; }}
-            .order {{ background: white; padding: 15px; margin: 10px 0; border-radius: 5px; border-left: 4px solid #007bff; }}
-            .success {{ background: #d4edda; color: #155724; padding: 15px; border-radius: 5px; margin-bottom: 20px; }}
-        </style>
-    </head>
-    <body>
-        <h2>Админ-панель T1EUP</h2>
-        <div class="success">
-            <p><strong>Добро пожаловать, {user.get('name', 'Администратор')}!</strong></p>
-            <p>Ваш номер: {user_phone}</p>
-            <p>Статус: Администратор ✅</p>
-        </div>
-        
-        <div class="stats">
-            <div class="stat-box">
-                <h3>Товары</h3>
-                <p>Всего: {total_ties}</p>
-                <p>Активных: {active_ties}</p>
-                <p>Средняя цена: {avg_price:,.0f} ₸</p>
-            </div>
-            <div class="stat-box">
-                <h3>Заказы</h3>
-                <p>Всего: {len(orders)}</p>
-                <p>Ожидают: {len([o for o in orders if o.get('status') == 'pending'])}</p>
-            </div>
-        </div>
-        
-        <h3>Управление товарами:</h3>
-        <div style="margin-bottom: 20px;">
-            <a href="/admin/tie/add" class="btn" style="background: #28a745;">+ Добавить новый галстук</a>
-        </div>
-        
-        <div class="ties-list">
-            {''.join([f'''
-            <div class="order" style="border-left-color: {'#28a745' if tie.get('active', True) else '#dc3545'};">
-                <div style="display: flex; align-items: center; gap: 20px;">
-                    <div style="flex-shrink: 0;">
-                        <img src="/TieUp/{tie['image_path']}" 
-                             style="width: 80px; height: 80px; object-fit: cover; border-radius: 8px; border: 2px solid #ddd;"
-                             alt="{tie['name_ru']}"
-                             onerror="this.src='data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iODAiIGhlaWdodD0iODAiIHZpZXdCb3g9IjAgMCA4MCA4MCIgZmlsbD0ibm9uZSIgeG1sbnM9Imh0dHA6Ly93d3cudzMub3JnLzIwMDAvc3ZnIj4KPHJlY3Qgd2lkdGg9IjgwIiBoZWlnaHQ9IjgwIiBmaWxsPSIjRjVGNUY1Ii8+CjxwYXRoIGQ9Ik0yMCAyMEg2MFY2MEgyMFYyMFoiIHN0cm9rZT0iI0NDQyIgc3Ryb2tlLXdpZHRoPSIyIi8+CjxwYXRoIGQ9Ik0zMCAzMEg1MFY1MEgzMFYzMFoiIGZpbGw9IiNEREQiLz4KPC9zdmc+'; this.alt='Изображение не найдено';">
-                    </div>
-                    <div style="flex-grow: 1;">
-                        <h5>{tie['name_ru']}</h5>
-                        <p><strong>Цена:</strong> {tie['price']:,} ₸</p>
-                        <p><strong>Статус:</strong> {'Активен' if tie.get('active', True) else 'Неактивен'}</p>
-                        <p><strong>ID:</strong> {tie['id']}</p>
-                        <p><strong>Изображение:</strong> {tie['image_path']}</p>
-                    </div>
-                    <div style="flex-shrink: 0; display: flex; flex-direction: column; gap: 5px;">
-                        <a href="/admin/tie/{tie['id']}/edit" class="btn" style="background: #ffc107; color: black; margin: 2px; padding: 8px 12px; font-size: 12px;">Редактировать</a>
-                        <a href="/admin/tie/{tie['id']}/toggle" class="btn" style="background: {'#dc3545' if tie.get('active', True) else '#28a745'}; margin: 2px; padding: 8px 12px; font-size: 12px;">
-                            {'Деактивировать' if tie.get('active', True) else 'Активировать'}
-                        </a>
-                        <a href="/admin/tie/{tie['id']}/delete" class="btn" style="background: #dc3545; margin: 2px; padding: 8px 12px; font-size: 12px;" onclick="return confirm('Удалить галстук?')">Удалить</a>
-                    </div>
-                </div>
-            </div>
-            ''' for tie in ties]) if ties else '<p>Товаров пока нет</p>'}
-        </div>
-        
-        <h3>Последние заказы:</h3>
-        {''.join([f'''
-        <div class="order">
-            <p><strong>Заказ #{order['id']}</strong> - {order['tie_name']}</p>
-            <p>Получатель: {order['recipient_name']} {order['recipient_surname']}</p>
-            <p>Телефон: {order['recipient_phone']}</p>
-            <p>Цена: {order['price']:,} ₸</p>
-            <p>Статус: {order['status']}</p>
-            <p>Дата: {order.get('created_at', 'Неизвестно')[:16]}</p>
-        </div>
-        ''' for order in orders[-5:]]) if orders else '<p>Заказов пока нет</p>'}
-        
-        <br>
-        <a href="/" class="btn">На главную</a>
-        <a href="/logout" class="btn" style="background: #dc3545;">Выйти</a>
-    </body>
-    </html>
-    """
+    if not auth.is_admin:
+        logger.info(f"Admin access denied for user_id: {user_id}, phone: '{user_phone}'")
+        return render_template('admin/forbidden.html', user_id=user_id, user=user, user_phone=user_phone,
+                               admin_phone=ADMIN_PHONE, user_phone_type=type(user_phone),
+                               user_phone_repr=repr(user_phone)), 403
+    query = admin_catalog_query()
+    ties, found = store.query_ties(query['status'], query['min_price'], query['max_price'], query['sort'],
+                                   query['order'] == 'desc', (query['page'] - 1) * query['limit'], query['limit'])
+    pages = max(1, -(-found // query['limit']))
+    total_orders = store.count_orders()
+    pending_orders = store.count_orders_by_status('pending')
+    recent_orders = store.recent_orders(5)
+    
+    # Статистика из счетчиков хранилища, без обхода каталога
+    stats = store.catalog_stats()
+    
+    return render_template('admin/panel.html', user=user, user_phone=user_phone, query=query,
+                           page_sizes=ADMIN_PAGE_SIZES, ties=ties, found=found, pages=pages,
+                           stats=stats, total_orders=total_orders,
+                           pending_orders=pending_orders, recent_orders=recent_orders)
 
 @app.route('/admin/tie/add')
+@admin_required
 def admin_add_tie():
     """Страница добавления нового галстука"""
-    user_id = request.cookies.get('user_id')
-    if not user_id:
-        return redirect(url_for('login'))
-    
-    db = load_db()
-    user = db['users'].get(str(user_id), {})
-    if user.get('phone', '') != '87718626629':
-        return "Доступ запрещен", 403
-    
-    return """
-    <html>
-    <head>
-        <title>Добавить галстук - T1EUP</title>
-        <meta charset="utf-8">
-        <style>
-            body { font-family: Arial, sans-serif; max-width: 800px; margin: 50px auto; padding: 20px; }
-            .form-group { margin-bottom: 15px; }
-            label { display: block; margin-bottom: 5px; font-weight: bold; }
-            input, textarea, select { width: 100%; padding: 10px; border: 1px solid #ddd; border-radius: 5px; }
-            .btn { padding: 12px 20px; background: #007bff; color: white; text-decoration: none; border-radius: 5px; border: none; cursor: pointer; margin: 5px; }
-            .btn:hover { background: #0056b3; }
-            .btn-success { background: #28a745; }
-            .btn-success:hover { background: #218838; }
-            .btn-secondary { background: #6c757d; }
-            .btn-secondary:hover { background: #545b62; }
-        </style>
-    </head>
-    <body>
-        <h2>Добавить новый галстук</h2>
-        
-        <form method="post" action="/admin/tie/add" enctype="multipart/form-data">
-            <div class="form-group">
-                <label>Название:</label>
-                <input type="text" name="name_ru" required>
-            </div>
-            <div class="form-group">
-                <label>Цвет:</label>
-                <input type="text" name="color_ru" required>
-            </div>
-            <div class="form-group">
-                <label>Описание:</label>
-                <textarea name="description_ru" rows="3" required></textarea>
-            </div>
-            <div class="form-group">
-                <label>Материал:</label>
-                <input type="text" name="material_ru" value="100% натуральный материал" required>
-            </div>
-            <div class="form-group">
-                <label>Цена (₸):</label>
-                <input type="number" name="price" min="0" required>
-            </div>
-            <div class="form-group">
-                <label>Изображение:</label>
-                <input type="file" name="image_file" accept="image/*" onchange="previewImage(this)" style="margin-bottom: 10px;">
-                <div id="imagePreview" style="margin-top: 10px; display: none;">
-                    <img id="previewImg" style="max-width: 200px; max-height: 200px; border-radius: 8px; border: 2px solid #ddd;">
-                </div>
-                <p style="font-size: 12px; color: #666; margin-top: 5px;">
-                    Или выберите из существующих:
-                </p>
-                <select name="image_path" style="margin-top: 5px;">
-                    <option value="">Выберите существующее изображение</option>
-                    <option value="tie1.jpg">tie1.jpg</option>
-                    <option value="tie2.jpg">tie2.jpg</option>
-                    <option value="tie3.jpg">tie3.jpg</option>
-                    <option value="tie4.jpg">tie4.jpg</option>
-                    <option value="tie5.jpg">tie5.jpg</option>
-                    <option value="tie6.jpg">tie6.jpg</option>
-                </select>
-            </div>
-            <div class="form-group">
-                <label>Статус:</label>
-                <select name="active">
-                    <option value="true">Активен</option>
-                    <option value="false">Неактивен</option>
-                </select>
-            </div>
-            
-            <button type="submit" class="btn btn-success">Добавить галстук</button>
-            <a href="/admin" class="btn btn-secondary">Отмена</a>
-        </form>
-        
-        <script>
-        function previewImage(input) {{
-            if (input.files && input.files[0]) {{
-                const reader = new FileReader();
-                reader.onload = function(e) {{
-                    const preview = document.getElementById('imagePreview');
-                    const img = document.getElementById('previewImg');
-                    img.src = e.target.result;
-                    preview.style.display = 'block';
-                }}
-                reader.readAsDataURL(input.files[0]);
-            }}
-        }}
-        </script>
-    </body>
-    </html>
-    """
+    # Пустая форма одинакова для всех: рендерится и сжимается один раз за процесс
+    return static_pages.get('admin_add_tie', lambda: render_template('admin/tie_form.html', tie=None)).response(
+        CACHE_CONTROL['account'])
 
 @app.route('/admin/tie/add', methods=['POST'])
+@admin_required
 def admin_add_tie_post():
     """Обработка добавления нового галстука"""
-    user_id = request.cookies.get('user_id')
-    if not user_id:
-        return redirect(url_for('login'))
-    
-    db = load_db()
-    user = db['users'].get(str(user_id), {})
-    if user.get('phone', '') != '87718626629':
-        return "Доступ запрещен", 403
-    
     try:
         # Получаем данные формы
         name_ru = request.form.get('name_ru')
@@ -936,358 +727,172 @@ def admin_add_tie_post():
                 import uuid
                 filename = str(uuid.uuid4()) + '.jpg'
                 file.save(f'TieUp/{filename}')
+                image_derivatives.generate_derivatives(f'TieUp/{filename}')
                 image_path = filename
         
-        # Создаем новый ID
-        new_id = max([tie['id'] for tie in db['ties']], default=0) + 1
-        
-        # Создаем новый галстук
-        new_tie = {
-            'id': new_id,
-            'name_ru': name_ru,
-            'name_kz': name_ru,  # Дублируем русское название
-            'name_en': name_ru,  # Дублируем русское название
-            'color_ru': color_ru,
-            'color_kz': color_ru,  # Дублируем русский цвет
-            'color_en': color_ru,  # Дублируем русский цвет
-            'description_ru': description_ru,
-            'description_kz': description_ru,  # Дублируем русское описание
-            'description_en': description_ru,  # Дублируем русское описание
-            'material_ru': material_ru,
-            'material_kz': material_ru,  # Дублируем русский материал
-            'material_en': material_ru,  # Дублируем русский материал
-            'price': price,
-            'image_path': image_path,
-            'active': active
-        }
+        with locks.lock('ties'):
+            # Создаем новый ID
+            new_id = max([tie['id'] for tie in store.list_ties()], default=0) + 1
+        
+            # Создаем новый галстук
+            new_tie = {
+                'id': new_id,
+                'name_ru': name_ru,
+                'name_kz': name_ru,  # Дублируем русское название
+                'name_en': name_ru,  # Дублируем русское название
+                'color_ru': color_ru,
+                'color_kz': color_ru,  # Дублируем русский цвет
+                'color_en': color_ru,  # Дублируем русский цвет
+                'description_ru': description_ru,
+                'description_kz': description_ru,  # Дублируем русское описание
+                'description_en': description_ru,  # Дублируем русское описание
+                'material_ru': material_ru,
+                'material_kz': material_ru,  # Дублируем русский материал
+                'material_en': material_ru,  # Дублируем русский материал
+                'price': price,
+                'image_path': image_path,
+                'active': active
+            }
         
-        # Добавляем в базу данных
-        db['ties'].append(new_tie)
-        save_db(db)
+            # Добавляем в базу данных
+            store.put_tie(new_tie)
         
-        return f"""
-        <html>
-        <head>
-            <title>Галстук добавлен - T1EUP</title>
-            <meta charset="utf-8">
-            <style>
-                body {{ font-family: Arial, sans-serif; max-width: 600px; margin: 50px auto; padding: 20px; text-align: center; }}
-                .success {{ background: #d4edda; color: #155724; padding: 20px; border-radius: 10px; border: 1px solid #c3e6cb; }}
-                .btn {{ padding: 10px 20px; background: #007bff; color: white; text-decoration: none; border-radius: 5px; }}
-            </style>
-        </head>
-        <body>
-            <h2>Галстук успешно добавлен!</h2>
-            <div class="success">
-                <p><strong>ID:</strong> {new_id}</p>
-                <p><strong>Название:</strong> {name_ru}</p>
-                <p><strong>Цена:</strong> {price:,} ₸</p>
-                <p><strong>Статус:</strong> {'Активен' if active else 'Неактивен'}</p>
-            </div>
-            <br>
-            <a href="/admin" class="btn">Вернуться в админ-панель</a>
-        </body>
-        </html>
-        """
+        return render_template('admin/message.html', title='Галстук добавлен', heading='Галстук успешно добавлен!',
+                               rows=[('ID', new_id), ('Название', name_ru), ('Цена', f"{price:,} ₸"),
+                                     ('Статус', 'Активен' if active else 'Неактивен')])
     except Exception as e:
         logger.error(f"Error adding tie: {e}")
         return f"Ошибка добавления галстука: {str(e)}", 500
 
 @app.route('/admin/tie/<int:tie_id>/edit')
+@admin_required
 def admin_edit_tie(tie_id):
     """Страница редактирования галстука"""
-    user_id = request.cookies.get('user_id')
-    if not user_id:
-        return redirect(url_for('login'))
-    
-    db = load_db()
-    user = db['users'].get(str(user_id), {})
-    if user.get('phone', '') != '87718626629':
-        return "Доступ запрещен", 403
-    
-    tie = next((t for t in db['ties'] if t['id'] == tie_id), None)
+    tie = store.get_tie(tie_id)
     if not tie:
         return "Галстук не найден", 404
     
-    return f"""
-    <html>
-    <head>
-        <title>Редактировать галстук - T1EUP</title>
-        <meta charset="utf-8">
-        <style>
-            body {{ font-family: Arial, sans-serif; max-width: 800px; margin: 50px auto; padding: 20px; }}
-            .form-group {{ margin-bottom: 15px; }}
-            label {{ display: block; margin-bottom: 5px; font-weight: bold; }}
-            input, textarea, select {{ width: 100%; padding: 10px; border: 1px solid #ddd; border-radius: 5px; }}
-            .btn {{ padding: 12px 20px; background: #007bff; color: white; text-decoration: none; border-radius: 5px; border: none; cursor: pointer; margin: 5px; }}
-            .btn:hover {{ background: #0056b3; }}
-            .btn-success {{ background: #28a745; }}
-            .btn-success:hover {{ background: #218838; }}
-            .btn-secondary {{ background: #6c757d; }}
-            .btn-secondary:hover {{ background: #545b62; }}
-        </style>
-    </head>
-    <body>
-        <h2>Редактировать галстук #{tie_id}</h2>
-        
-        <div style="margin-bottom: 20px; text-align: center;">
-            <img src="/TieUp/{tie['image_path']}" 
-                 style="width: 120px; height: 120px; object-fit: cover; border-radius: 8px; border: 2px solid #ddd;"
-                 alt="{tie['name_ru']}"
-                 onerror="this.src='data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMTIwIiBoZWlnaHQ9IjEyMCIgdmlld0JveD0iMCAwIDEyMCAxMjAiIGZpbGw9Im5vbmUiIHhtbG5zPSJodHRwOi8vd3d3LnczLm9yZy8yMDAwL3N2ZyI+CjxyZWN0IHdpZHRoPSIxMjAiIGhlaWdodD0iMTIwIiBmaWxsPSIjRjVGNUY1Ii8+CjxwYXRoIGQ9Ik0zMCAzMEg5MFY5MEgzMFYzMFoiIHN0cm9rZT0iI0NDQyIgc3Ryb2tlLXdpZHRoPSIyIi8+CjxwYXRoIGQ9Ik00NSA0NUg3NVY3NUg0NVY0NVoiIGZpbGw9IiNEREQiLz4KPC9zdmc+'; this.alt='Изображение не найдено';">
-            <p style="margin-top: 10px; color: #666;">Текущее изображение</p>
-        </div>
-        
-        <form method="post" action="/admin/tie/{tie_id}/edit" enctype="multipart/form-data">
-            <div class="form-group">
-                <label>Название:</label>
-                <input type="text" name="name_ru" value="{tie['name_ru']}" required>
-            </div>
-            <div class="form-group">
-                <label>Цвет:</label>
-                <input type="text" name="color_ru" value="{tie['color_ru']}" required>
-            </div>
-            <div class="form-group">
-                <label>Описание:</label>
-                <textarea name="description_ru" rows="3" required>{tie['description_ru']}</textarea>
-            </div>
-            <div class="form-group">
-                <label>Материал:</label>
-                <input type="text" name="material_ru" value="{tie['material_ru']}" required>
-            </div>
-            <div class="form-group">
-                <label>Цена (₸):</label>
-                <input type="number" name="price" value="{tie['price']}" min="0" required>
-            </div>
-            <div class="form-group">
-                <label>Изображение:</label>
-                <input type="file" name="image_file" accept="image/*" onchange="previewImage(this)" style="margin-bottom: 10px;">
-                <div id="imagePreview" style="margin-top: 10px; display: none;">
-                    <img id="previewImg" style="max-width: 200px; max-height: 200px; border-radius: 8px; border: 2px solid #ddd;">
-                </div>
-                <p style="font-size: 12px; color: #666; margin-top: 5px;">
-                    Или выберите из существующих:
-                </p>
-                <select name="image_path" style="margin-top: 5px;">
-                    <option value="">Выберите существующее изображение</option>
-                    <option value="tie1.jpg" {'selected' if tie.get('image_path') == 'tie1.jpg' else ''}>tie1.jpg</option>
-                    <option value="tie2.jpg" {'selected' if tie.get('image_path') == 'tie2.jpg' else ''}>tie2.jpg</option>
-                    <option value="tie3.jpg" {'selected' if tie.get('image_path') == 'tie3.jpg' else ''}>tie3.jpg</option>
-                    <option value="tie4.jpg" {'selected' if tie.get('image_path') == 'tie4.jpg' else ''}>tie4.jpg</option>
-                    <option value="tie5.jpg" {'selected' if tie.get('image_path') == 'tie5.jpg' else ''}>tie5.jpg</option>
-                    <option value="tie6.jpg" {'selected' if tie.get('image_path') == 'tie6.jpg' else ''}>tie6.jpg</option>
-                </select>
-            </div>
-            <div class="form-group">
-                <label>Статус:</label>
-                <select name="active">
-                    <option value="true" {'selected' if tie.get('active', True) else ''}>Активен</option>
-                    <option value="false" {'selected' if not tie.get('active', True) else ''}>Неактивен</option>
-                </select>
-            </div>
-            
-            <button type="submit" class="btn btn-success">Сохранить изменения</button>
-            <a href="/admin" class="btn btn-secondary">Отмена</a>
-        </form>
-        
-        <script>
-        function previewImage(input) {{
-            if (input.files && input.files[0]) {{
-                const reader = new FileReader();
-                reader.onload = function(e) {{
-                    const preview = document.getElementById('imagePreview');
-                    const img = document.getElementById('previewImg');
-                    img.src = e.target.result;
-                    preview.style.display = 'block';
-                }}
-                reader.readAsDataURL(input.files[0]);
-            }}
-        }}
-        </script>
-    </body>
-    </html>
-    """
+    return render_template('admin/tie_form.html', tie=tie)
 
 @app.route('/admin/tie/<int:tie_id>/edit', methods=['POST'])
+@admin_required
 def admin_edit_tie_post(tie_id):
     """Обработка редактирования галстука"""
-    user_id = request.cookies.get('user_id')
-    if not user_id:
-        return redirect(url_for('login'))
-    
-    db = load_db()
-    user = db['users'].get(str(user_id), {})
-    if user.get('phone', '') != '87718626629':
-        return "Доступ запрещен", 403
-    
     try:
-        tie = next((t for t in db['ties'] if t['id'] == tie_id), None)
-        if not tie:
-            return "Галстук не найден", 404
-        
-        # Обновляем данные
-        name_ru = request.form.get('name_ru')
-        color_ru = request.form.get('color_ru')
-        description_ru = request.form.get('description_ru')
-        material_ru = request.form.get('material_ru')
-        
-        tie['name_ru'] = name_ru
-        tie['name_kz'] = name_ru  # Дублируем русское название
-        tie['name_en'] = name_ru  # Дублируем русское название
-        tie['color_ru'] = color_ru
-        tie['color_kz'] = color_ru  # Дублируем русский цвет
-        tie['color_en'] = color_ru  # Дублируем русский цвет
-        tie['description_ru'] = description_ru
-        tie['description_kz'] = description_ru  # Дублируем русское описание
-        tie['description_en'] = description_ru  # Дублируем русское описание
-        tie['material_ru'] = material_ru
-        tie['material_kz'] = material_ru  # Дублируем русский материал
-        tie['material_en'] = material_ru  # Дублируем русский материал
-        tie['price'] = int(request.form.get('price', 0))
-        tie['active'] = request.form.get('active') == 'true'
-        
-        # Обрабатываем изображение
-        if 'image_file' in request.files:
-            file = request.files['image_file']
-            if file and file.filename:
-                # Генерируем уникальное имя файла
-                import uuid
-                filename = str(uuid.uuid4()) + '.jpg'
-                file.save(f'TieUp/{filename}')
-                tie['image_path'] = filename
-        else:
-            # Используем выбранное из списка
-            tie['image_path'] = request.form.get('image_path', tie.get('image_path', ''))
-        
-        save_db(db)
-        
-        return f"""
-        <html>
-        <head>
-            <title>Галстук обновлен - T1EUP</title>
-            <meta charset="utf-8">
-            <style>
-                body {{ font-family: Arial, sans-serif; max-width: 600px; margin: 50px auto; padding: 20px; text-align: center; }}
-                .success {{ background: #d4edda; color: #155724; padding: 20px; border-radius: 10px; border: 1px solid #c3e6cb; }}
-                .btn {{ padding: 10px 20px; background: #007bff; color: white; text-decoration: none; border-radius: 5px; }}
-            </style>
-        </head>
-        <body>
-            <h2>Галстук успешно обновлен!</h2>
-            <div class="success">
-                <p><strong>ID:</strong> {tie_id}</p>
-                <p><strong>Название:</strong> {tie['name_ru']}</p>
-                <p><strong>Цена:</strong> {tie['price']:,} ₸</p>
-                <p><strong>Статус:</strong> {'Активен' if tie['active'] else 'Неактивен'}</p>
-            </div>
-            <br>
-            <a href="/admin" class="btn">Вернуться в админ-панель</a>
-        </body>
-        </html>
-        """
+        with locks.lock('ties'):
+            tie = store.get_tie(tie_id)
+            if not tie:
+                return "Галстук не найден", 404
+            tie = dict(tie)
+        
+            # Обновляем данные
+            name_ru = request.form.get('name_ru')
+            color_ru = request.form.get('color_ru')
+            description_ru = request.form.get('description_ru')
+            material_ru = request.form.get('material_ru')
+        
+            tie['name_ru'] = name_ru
+            tie['name_kz'] = name_ru  # Дублируем русское название
+            tie['name_en'] = name_ru  # Дублируем русское название
+            tie['color_ru'] = color_ru
+            tie['color_kz'] = color_ru  # Дублируем русский цвет
+            tie['color_en'] = color_ru  # Дублируем русский цвет
+            tie['description_ru'] = description_ru
+            tie['description_kz'] = description_ru  # Дублируем русское описание
+            tie['description_en'] = description_ru  # Дублируем русское описание
+            tie['material_ru'] = material_ru
+            tie['material_kz'] = material_ru  # Дублируем русский материал
+            tie['material_en'] = material_ru  # Дублируем русский материал
+            tie['price'] = int(request.form.get('price', 0))
+            tie['active'] = request.form.get('active') == 'true'
+        
+            # Обрабатываем изображение
+            if 'image_file' in request.files:
+                file = request.files['image_file']
+                if file and file.filename:
+                    # Генерируем уникальное имя файла
+                    import uuid
+                    filename = str(uuid.uuid4()) + '.jpg'
+                    file.save(f'TieUp/{filename}')
+                    image_derivatives.generate_derivatives(f'TieUp/{filename}')
+                    tie['image_path'] = filename
+            else:
+                # Используем выбранное из списка
+                tie['image_path'] = request.form.get('image_path', tie.get('image_path', ''))
+        
+            store.put_tie(tie)
+        
+        return render_template('admin/message.html', title='Галстук обновлен', heading='Галстук успешно обновлен!',
+                               rows=[('ID', tie_id), ('Название', tie['name_ru']), ('Цена', f"{tie['price']:,} ₸"),
+                                     ('Статус', 'Активен' if tie['active'] else 'Неактивен')])
     except Exception as e:
         logger.error(f"Error editing tie: {e}")
         return f"Ошибка редактирования галстука: {str(e)}", 500
 
 @app.route('/admin/tie/<int:tie_id>/toggle')
+@admin_required
 def admin_toggle_tie(tie_id):
     """Активация/деактивация галстука"""
-    user_id = request.cookies.get('user_id')
-    if not user_id:
-        return redirect(url_for('login'))
-    
-    db = load_db()
-    user = db['users'].get(str(user_id), {})
-    if user.get('phone', '') != '87718626629':
-        return "Доступ запрещен", 403
-    
     try:
-        tie = next((t for t in db['ties'] if t['id'] == tie_id), None)
-        if not tie:
-            return "Галстук не найден", 404
+        with locks.lock('ties'):
+            tie = store.get_tie(tie_id)
+            if not tie:
+                return "Галстук не найден", 404
         
-        # Переключаем статус
-        tie['active'] = not tie.get('active', True)
-        save_db(db)
+            # Переключаем статус
+            tie = dict(tie, active=not tie.get('active', True))
+            store.put_tie(tie)
         
         status = "активирован" if tie['active'] else "деактивирован"
-        return f"""
-        <html>
-        <head>
-            <title>Галстук {status} - T1EUP</title>
-            <meta charset="utf-8">
-            <style>
-                body {{ font-family: Arial, sans-serif; max-width: 600px; margin: 50px auto; padding: 20px; text-align: center; }}
-                .success {{ background: #d4edda; color: #155724; padding: 20px; border-radius: 10px; border: 1px solid #c3e6cb; }}
-                .btn {{ padding: 10px 20px; background: #007bff; color: white; text-decoration: none; border-radius: 5px; }}
-            </style>
-        </head>
-        <body>
-            <h2>Галстук {status}!</h2>
-            <div class="success">
-                <p><strong>ID:</strong> {tie_id}</p>
-                <p><strong>Название:</strong> {tie['name_ru']}</p>
-                <p><strong>Новый статус:</strong> {'Активен' if tie['active'] else 'Неактивен'}</p>
-            </div>
-            <br>
-            <a href="/admin" class="btn">Вернуться в админ-панель</a>
-        </body>
-        </html>
-        """
+        return render_template('admin/message.html', title=f"Галстук {status}", heading=f"Галстук {status}!",
+                               rows=[('ID', tie_id), ('Название', tie['name_ru']),
+                                     ('Новый статус', 'Активен' if tie['active'] else 'Неактивен')])
     except Exception as e:
         logger.error(f"Error toggling tie: {e}")
         return f"Ошибка изменения статуса: {str(e)}", 500
 
 @app.route('/admin/tie/<int:tie_id>/delete')
+@admin_required
 def admin_delete_tie(tie_id):
     """Удаление галстука"""
-    user_id = request.cookies.get('user_id')
-    if not user_id:
-        return redirect(url_for('login'))
-    
-    db = load_db()
-    user = db['users'].get(str(user_id), {})
-    if user.get('phone', '') != '87718626629':
-        return "Доступ запрещен", 403
-    
     try:
-        tie = next((t for t in db['ties'] if t['id'] == tie_id), None)
-        if not tie:
-            return "Галстук не найден", 404
+        with locks.lock('ties'):
+            tie = store.get_tie(tie_id)
+            if not tie:
+                return "Галстук не найден", 404
         
-        tie_name = tie['name_ru']
+            tie_name = tie['name_ru']
         
-        # Удаляем галстук
-        db['ties'] = [t for t in db['ties'] if t['id'] != tie_id]
-        save_db(db)
+            # Удаляем галстук
+            store.delete_tie(tie_id)
         
-        return f"""
-        <html>
-        <head>
-            <title>Галстук удален - T1EUP</title>
-            <meta charset="utf-8">
-            <style>
-                body {{ font-family: Arial, sans-serif; max-width: 600px; margin: 50px auto; padding: 20px; text-align: center; }}
-                .success {{ background: #d4edda; color: #155724; padding: 20px; border-radius: 10px; border: 1px solid #c3e6cb; }}
-                .btn {{ padding: 10px 20px; background: #007bff; color: white; text-decoration: none; border-radius: 5px; }}
-            </style>
-        </head>
-        <body>
-            <h2>Галстук удален!</h2>
-            <div class="success">
-                <p><strong>ID:</strong> {tie_id}</p>
-                <p><strong>Название:</strong> {tie_name}</p>
-                <p>Галстук был полностью удален из системы.</p>
-            </div>
-            <br>
-            <a href="/admin" class="btn">Вернуться в админ-панель</a>
-        </body>
-        </html>
-        """
+        return render_template('admin/message.html', title='Галстук удален', heading='Галстук удален!',
+                               rows=[('ID', tie_id), ('Название', tie_name),
+                                     (None, 'Галстук был полностью удален из системы.')])
     except Exception as e:
         logger.error(f"Error deleting tie: {e}")
         return f"Ошибка удаления галстука: {str(e)}", 500
 
+@app.route('/admin/metrics')
+@admin_required
+def admin_metrics():
+    """Метрики процесса: время записи в базу, fsync и т.д."""
+    return jsonify({'pid': os.getpid(), 'metrics': web_metrics.snapshot()})
+
+@app.route('/admin/jobs')
+@admin_required
+def admin_jobs():
+    """Очередь фоновых задач: счетчики и задачи, исчерпавшие попытки"""
+    return jsonify({'stats': job_queue.stats(), 'dead': job_queue.dead_jobs(), 'pdf': pdf_service.stats()})
+
+@app.route('/admin/jobs/<job_id>/retry', methods=['POST'])
+@admin_required
+def admin_retry_job(job_id):
+    """Возвращает задачу из dead в очередь"""
+    if not job_queue.retry_dead(job_id):
+        return jsonify({'success': False, 'error': 'Задача не найдена'}), 404
+    return jsonify({'success': True})
+
 @app.route('/admin/login')
 def admin_login():
     """Страница входа в админ-панель"""
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Тестирование хранилищ web_storage (JSON и SQLite)
+Запуск: python -m pytest test_storage.py
+"""
+
+import web_storage
+
+
+def empty_db():
+    return {'users': {}, 'orders': {}, 'ties': []}
+
+
+def make_tie(tie_id, name, price):
+    return {'id': tie_id, 'name_ru': name, 'price': price, 'active': True}
+
+
+def open_stores(tmp_path):
+    return [
+        web_storage.JsonStore(str(tmp_path / 'db.json'), empty_db),
+        web_storage.SqliteStore(str(tmp_path / 'db.sqlite3'), empty_db)
+    ]
+
+
+def test_sort_by_name_with_empty_name(tmp_path):
+    """Пустое название не ломает сортировку, порядок одинаков в обоих движках"""
+    for store in open_stores(tmp_path):
+        for tie in (make_tie(1, 'Синий', 15000), make_tie(2, '', 12000), make_tie(3, 'Алый', 9000)):
+            store.put_tie(tie)
+        ties, total = store.query_ties(sort='name')
+        assert [t['id'] for t in ties] == [2, 3, 1]
+        ties, _ = store.query_ties(sort='name', descending=True, limit=2)
+        assert [t['id'] for t in ties] == [1, 3]
+        assert total == 3
+        store.close()
+
+
+def test_sort_by_price_with_missing_price(tmp_path):
+    """Галстук без цены идет первым, как NULL в ORDER BY SQLite"""
+    store = web_storage.JsonStore(str(tmp_path / 'db.json'), empty_db)
+    store.put_tie(make_tie(1, 'Синий', 15000))
+    store.put_tie({'id': 2, 'name_ru': 'Без цены', 'active': True})
+    store.put_tie(make_tie(3, 'Алый', 9000))
+    ties, _ = store.query_ties(sort='price')
+    assert [t['id'] for t in ties] == [2, 3, 1]
+    ties, _ = store.query_ties(sort='price', descending=True)
+    assert [t['id'] for t in ties] == [1, 3, 2]
+    store.close()
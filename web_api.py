@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+JSON API веб-приложения T1EUP
+- GET /api/v1/ties            - активные галстуки, постранично
+- GET /api/v1/ties/<id>       - один галстук
+- GET /api/v1/me/orders       - заказы текущего пользователя (сессия), новые первыми
+
+Параметры списков: limit (1..100), cursor (из next_cursor предыдущей
+страницы), fields (поля через запятую). Ответы несут ETag, повторный
+запрос с If-None-Match получает 304.
+"""
+
+import json
+import base64
+import binascii
+
+from flask import Blueprint, request, jsonify, url_for
+
+from web_cache import CACHE_CONTROL, cached_view, conditional
+from web_storage import TIE_COLUMNS, ORDER_COLUMNS
+
+API_DEFAULT_LIMIT = 20
+API_MAX_LIMIT = 100
+
+# Вычисляемые поля галстука в дополнение к колонкам базы
+TIE_FIELDS = TIE_COLUMNS + ['image_url']
+ORDER_FIELDS = ORDER_COLUMNS
+
+
+class ApiError(Exception):
+    """Ошибка запроса к API: отдается клиенту как {'success': False, 'error': ...}"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def encode_cursor(last_id):
+    raw = json.dumps({'id': last_id}, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """id последней записи предыдущей страницы или None для первой страницы"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        last_id = json.loads(raw.decode('utf-8'))['id']
+    except (binascii.Error, ValueError, KeyError, TypeError, UnicodeDecodeError):
+        raise ApiError('Некорректный cursor')
+    if not isinstance(last_id, int):
+        raise ApiError('Некорректный cursor')
+    return last_id
+
+
+def parse_limit():
+    raw = request.args.get('limit', str(API_DEFAULT_LIMIT))
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise ApiError('limit должен быть числом')
+    if not 1 <= limit <= API_MAX_LIMIT:
+        raise ApiError(f"limit должен быть от 1 до {API_MAX_LIMIT}")
+    return limit
+
+
+def parse_fields(allowed):
+    """Список запрошенных полей (None - все поля)"""
+    raw = request.args.get('fields')
+    if not raw:
+        return None
+    fields = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ApiError(f"Неизвестные поля: {', '.join(unknown)}")
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+    return fields
+
+
+def select_fields(record, fields):
+    if fields is None:
+        return record
+    return {f: record.get(f) for f in fields}
+
+
+def paginate(records, limit):
+    """Страница из records (уже после курсора) и next_cursor"""
+    page = records[:limit]
+    next_cursor = encode_cursor(page[-1]['id']) if len(records) > limit else None
+    return page, next_cursor
+
+
+def create_api(store, page_cache, sessions):
+    """Blueprint API поверх хранилища store; списки каталога кэшируются в page_cache,
+    пользователь определяется по сессии из sessions (web_sessions.SessionManager)"""
+    api = Blueprint('api', __name__)
+    catalog_cached = cached_view(page_cache, lambda: store.version('catalog'), CACHE_CONTROL['catalog'])
+
+    @api.errorhandler(ApiError)
+    def api_error(error):
+        return jsonify({'success': False, 'error': error.message}), error.status
+
+    def tie_json(tie, fields):
+        tie = dict(tie)
+        if tie.get('image_path'):
+            tie['image_url'] = url_for('tie_images', filename=tie['image_path'].split('/')[-1])
+        else:
+            tie['image_url'] = None
+        return select_fields(tie, fields)
+
+    @api.route('/ties')
+    @catalog_cached
+    def ties():
+        limit = parse_limit()
+        fields = parse_fields(TIE_FIELDS)
+        after = decode_cursor(request.args.get('cursor'))
+        records = sorted((t for t in store.list_ties(active_only=True) if after is None or t['id'] > after),
+                         key=lambda t: t['id'])
+        page, next_cursor = paginate(records, limit)
+        return jsonify({
+            'success': True,
+            'items': [tie_json(t, fields) for t in page],
+            'next_cursor': next_cursor
+        })
+
+    @api.route('/ties/<int:tie_id>')
+    @catalog_cached
+    def tie(tie_id):
+        fields = parse_fields(TIE_FIELDS)
+        tie = store.get_tie(tie_id)
+        if not tie:
+            raise ApiError('Галстук не найден', 404)
+        return jsonify({'success': True, 'item': tie_json(tie, fields)})
+
+    @api.route('/me/orders')
+    def my_orders():
+        auth = sessions.current()
+        if auth is None:
+            raise ApiError('Пользователь не авторизован', 401)
+        limit = parse_limit()
+        fields = parse_fields(ORDER_FIELDS)
+        before = decode_cursor(request.args.get('cursor'))
+        records = [o for o in reversed(store.user_orders(auth.user_id)) if before is None or o['id'] < before]
+        page, next_cursor = paginate(records, limit)
+        response = jsonify({
+            'success': True,
+            'items': [select_fields(o, fields) for o in page],
+            'next_cursor': next_cursor
+        })
+        return conditional(response, CACHE_CONTROL['account'])
+
+    return api
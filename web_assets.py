@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Статические файлы веб-приложения T1EUP с отпечатком содержимого
+При запуске css/ и js/ из static/ копируются в static/build/ под именами
+вида style.<хэш>.css, рядом кладутся сжатые копии .gz и .br (brotli, если
+установлен пакет). Шаблоны получают адрес через asset_url('css/style.css');
+файл по такому адресу никогда не меняется, поэтому отдается с
+Cache-Control: immutable на год и сразу в сжатом виде.
+"""
+
+import os
+import gzip
+import json
+import hashlib
+import logging
+import mimetypes
+
+from flask import request, send_file, url_for, abort
+
+from web_cache import CACHE_CONTROL
+from web_storage import write_atomic
+
+try:
+    import brotli
+except ImportError:  # необязательная зависимость: без нее только gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Какие каталоги static/ проходят через сборку
+ASSET_DIRS = ('css', 'js')
+# Файлы меньше этого размера не сжимаются
+ASSET_MIN_COMPRESS = 256
+
+
+class AssetPipeline:
+    """Сборка static/ в static/build/ и отдача собранных файлов"""
+
+    def __init__(self, static_folder, build_folder=None, directories=ASSET_DIRS):
+        self.static_folder = static_folder
+        self.build_folder = build_folder or os.path.join(static_folder, 'build')
+        self.directories = directories
+        self.manifest = {}
+        self._digests = {}
+
+    def build(self):
+        """Создает файлы с отпечатком и их сжатые копии; возвращает manifest"""
+        manifest = {}
+        digests = {}
+        for directory in self.directories:
+            source_dir = os.path.join(self.static_folder, directory)
+            if not os.path.isdir(source_dir):
+                continue
+            for root, _, files in os.walk(source_dir):
+                for name in sorted(files):
+                    source = os.path.join(root, name)
+                    logical = os.path.relpath(source, self.static_folder).replace(os.sep, '/')
+                    built, digest = self._build_file(source, logical)
+                    manifest[logical] = built
+                    digests[built] = digest
+        os.makedirs(self.build_folder, exist_ok=True)
+        write_atomic(os.path.join(self.build_folder, 'manifest.json'),
+                      json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+        self.manifest = manifest
+        self._digests = digests
+        logger.info(f"Built {len(manifest)} static assets into {self.build_folder}")
+        return manifest
+
+    def _build_file(self, source, logical):
+        with open(source, 'rb') as f:
+            payload = f.read()
+        digest = hashlib.sha256(payload).hexdigest()[:12]
+        stem, ext = os.path.splitext(logical)
+        built = f"{stem}.{digest}{ext}"
+        target = os.path.join(self.build_folder, built)
+        # Имя зависит от содержимого: если файл уже есть, он тот же самый
+        if os.path.exists(target):
+            return built, digest
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if len(payload) >= ASSET_MIN_COMPRESS:
+            write_atomic(target + '.gz', gzip.compress(payload, compresslevel=9, mtime=0))
+            if brotli is not None:
+                write_atomic(target + '.br', brotli.compress(payload, quality=11))
+        write_atomic(target, payload)
+        return built, digest
+
+    def url(self, filename):
+        """Адрес файла с отпечатком (или обычный /static/, если файл не собран)"""
+        built = self.manifest.get(filename)
+        if built is None:
+            return url_for('static', filename=filename)
+        return url_for('assets', filename=built)
+
+    def send(self, filename):
+        """Ответ с собранным файлом: br или gzip по Accept-Encoding, иначе как есть"""
+        digest = self._digests.get(filename)
+        if digest is None:
+            abort(404)
+        path = os.path.join(self.build_folder, filename)
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        encoding = None
+        for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if request.accept_encodings[candidate] and os.path.exists(path + suffix):
+                encoding, path = candidate, path + suffix
+                break
+        response = send_file(path, mimetype=mimetype, etag=f"{digest}-{encoding or 'identity'}")
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = CACHE_CONTROL['assets']
+        return response
+
+    def init_app(self, app, url_path='/assets'):
+        """Маршрут /assets/<файл> и функция asset_url() для шаблонов"""
+        app.add_url_rule(f"{url_path}/<path:filename>", 'assets', self.send)
+        app.add_template_global(self.url, 'asset_url')
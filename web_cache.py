@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Кэш готовых страниц веб-приложения T1EUP
+Страница хранится вместе с версией данных, из которых она построена
+(см. JsonStore.version); если версия изменилась - запись считается
+устаревшей и страница рендерится заново.
+Постоянные страницы (вход, пустая форма админки) рендерятся один раз за
+процесс и хранятся готовыми байтами вместе со сжатой gzip копией.
+Здесь же ETag файлов по хэшу содержимого и политики Cache-Control.
+"""
+
+import os
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import request, make_response, current_app
+
+import web_metrics
+
+# Сколько страниц держать в памяти процесса
+PAGE_CACHE_SIZE = int(os.environ.get('PAGE_CACHE_SIZE', 256))
+
+# Cache-Control по классам маршрутов
+CACHE_CONTROL = {
+    # Страницы каталога: общие для всех, но каждый раз сверяются по ETag (ответ 304)
+    'catalog': 'public, no-cache',
+    # Фото галстуков: новое фото получает новое имя, старое можно долго не перепроверять
+    'images': f"public, max-age={int(os.environ.get('IMAGE_MAX_AGE', 7 * 24 * 3600))}",
+    # CSS/JS с хэшем содержимого в имени (web_assets): по этому адресу файл не изменится никогда
+    'assets': f"public, max-age={365 * 24 * 3600}, immutable",
+    # Постоянные страницы (вход): одинаковы для всех, сверяются по ETag
+    'page': 'public, no-cache',
+    # Данные пользователя в API: только в браузере этого пользователя, со сверкой по ETag
+    'account': 'private, no-cache',
+    # Профиль, заказы, админка: только для этого пользователя и не сохранять
+    'private': 'private, no-store'
+}
+
+
+class CachedPage:
+    """Готовый ответ: тело, статус и заголовки"""
+
+    __slots__ = ('version', 'body', 'status', 'headers', 'etag', 'last_modified')
+
+    def __init__(self, version, body, status, headers, last_modified):
+        self.version = version
+        self.body = body
+        self.status = status
+        self.headers = headers
+        self.etag = content_etag(body)
+        self.last_modified = last_modified
+
+
+class PageCache:
+    """LRU кэш страниц по ключу (endpoint, аргументы) с проверкой версии"""
+
+    def __init__(self, max_entries=PAGE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            page = self._pages.get(key)
+            if page is None:
+                return None
+            if page.version != version:
+                del self._pages[key]
+                return None
+            self._pages.move_to_end(key)
+            return page
+
+    def put(self, key, page):
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._pages[key] = page
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+    def __len__(self):
+        return len(self._pages)
+
+
+class StaticPage:
+    """Постоянная страница: тело закодировано и сжато один раз"""
+
+    __slots__ = ('body', 'gzipped', 'etag', 'mimetype', 'last_modified')
+
+    def __init__(self, body, mimetype='text/html'):
+        self.body = body.encode('utf-8') if isinstance(body, str) else body
+        gzipped = gzip.compress(self.body, compresslevel=9, mtime=0)
+        self.gzipped = gzipped if len(gzipped) < len(self.body) else None
+        self.etag = content_etag(self.body)
+        self.mimetype = mimetype
+        self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+
+    def response(self, cache_control):
+        """Готовый ответ (gzip, если клиент его принимает; 304, если страница у него уже есть)"""
+        use_gzip = self.gzipped is not None and request.accept_encodings['gzip']
+        response = current_app.response_class(self.gzipped if use_gzip else self.body, mimetype=self.mimetype)
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.set_etag(f"{self.etag}-gzip" if use_gzip else self.etag)
+        response.last_modified = self.last_modified
+        response.headers['Cache-Control'] = cache_control
+        return response.make_conditional(request)
+
+
+class StaticPages:
+    """Постоянные страницы процесса по имени; render() вызывается только при первом запросе"""
+
+    def __init__(self):
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def get(self, name, render):
+        page = self._pages.get(name)
+        if page is None:
+            with self._lock:
+                page = self._pages.get(name)
+                if page is None:
+                    with web_metrics.timed(f"page.render.{name}"):
+                        page = self._pages[name] = StaticPage(render())
+        return page
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+
+def cached_view(page_cache, get_version, cache_control):
+    """Декоратор: отдает ответ из page_cache, пока get_version() не изменилась
+
+    Ключ - endpoint, аргументы маршрута и строка запроса. Ответ несет
+    ETag по содержимому и Last-Modified; при совпадении If-None-Match /
+    If-Modified-Since отдается 304 без тела. Кэшируются только ответы 200.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            version = get_version()
+            key = (request.endpoint, tuple(sorted(kwargs.items())), request.query_string)
+            page = page_cache.get(key, version)
+            if page is not None:
+                web_metrics.observe(f"page.cache_hit.{request.endpoint}", 0)
+            else:
+                with web_metrics.timed(f"page.render.{request.endpoint}"):
+                    response = make_response(view(**kwargs))
+                if response.status_code != 200:
+                    return response
+                page = CachedPage(version, response.get_data(), response.status_code, list(response.headers),
+                                  datetime.now(timezone.utc).replace(microsecond=0))
+                page_cache.put(key, page)
+
+            response = current_app.response_class(page.body, status=page.status, headers=page.headers)
+            response.set_etag(page.etag)
+            response.last_modified = page.last_modified
+            response.headers['Cache-Control'] = cache_control
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+
+def conditional(response, cache_control):
+    """ETag по содержимому для некэшируемого ответа (304, если клиент уже его видел)"""
+    response.set_etag(content_etag(response.get_data()))
+    response.headers['Cache-Control'] = cache_control
+    return response.make_conditional(request)
+
+
+def content_etag(payload):
+    """Сильный ETag по содержимому"""
+    return hashlib.sha1(payload).hexdigest()
+
+
+_file_etags = {}
+_file_etags_lock = threading.Lock()
+
+
+def file_etag(path):
+    """ETag файла по хэшу содержимого; файл перечитывается, только если изменился"""
+    st = os.stat(path)
+    file_id = (st.st_ino, st.st_mtime_ns, st.st_size)
+    cached = _file_etags.get(path)
+    if cached is not None and cached[0] == file_id:
+        return cached[1]
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            h.update(chunk)
+    with _file_etags_lock:
+        _file_etags[path] = (file_id, h.hexdigest())
+    return h.hexdigest()
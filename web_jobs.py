@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Фоновые задачи веб-приложения T1EUP (PDF заказа, уведомления)
+Очередь хранится на диске, поэтому задачи переживают перезапуск:
+    <dir>/pending/<время запуска>-<id>.json - ждут выполнения
+    <dir>/running/<токен>-<...>.json        - выполняются процессом с этим токеном
+    <dir>/dead/<id>.json                    - исчерпали попытки
+    <dir>/corrupt/<...>.json                - файлы, которые не удалось прочитать
+Задачу забирает тот процесс (воркер gunicorn), чей rename() из pending
+в running прошел первым. Токен - случайная строка, новая при каждом запуске
+пула: pid после перезапуска может достаться другому процессу.
+Пока задача выполняется, процесс обновляет mtime ее файла (аренда); файлы
+в running, которые никто не обновлял дольше JOB_LEASE секунд, периодически
+возвращаются в pending любым процессом.
+"""
+
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import traceback
+
+import web_metrics
+
+logger = logging.getLogger(__name__)
+
+# Потоков-исполнителей в каждом процессе
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+# Попыток до переноса задачи в dead
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+# Пауза перед повтором: JOB_RETRY_DELAY * 2^(попытка-1) секунд
+JOB_RETRY_DELAY = float(os.environ.get('JOB_RETRY_DELAY', 5))
+# Как часто проверять очередь на задачи из других процессов, секунд
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1))
+# Аренда задачи в running, секунд: без обновления mtime дольше этого задача возвращается в pending
+JOB_LEASE = float(os.environ.get('JOB_LEASE', 60))
+# fsync файлов задач (как DB_FSYNC у базы)
+JOB_FSYNC = os.environ.get('DB_FSYNC', '1') != '0'
+
+
+class JobQueue:
+    """Дисковая очередь задач с пулом потоков, повторами и списком dead"""
+
+    def __init__(self, directory, workers=JOB_WORKERS, max_attempts=JOB_MAX_ATTEMPTS):
+        self.directory = directory
+        self.pending_dir = os.path.join(directory, 'pending')
+        self.running_dir = os.path.join(directory, 'running')
+        self.dead_dir = os.path.join(directory, 'dead')
+        self.corrupt_dir = os.path.join(directory, 'corrupt')
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self._handlers = {}
+        self._threads = []
+        self._pid = None
+        self._token = None
+        self._running = set()
+        self._running_lock = threading.Lock()
+        self._stopping = False
+        self._wakeup = threading.Condition()
+        self._start_lock = threading.Lock()
+        for path in (self.pending_dir, self.running_dir, self.dead_dir, self.corrupt_dir):
+            os.makedirs(path, exist_ok=True)
+
+    def register(self, job_type, handler):
+        """handler(**payload); исключение означает неудачную попытку"""
+        self._handlers[job_type] = handler
+
+    # --- Файлы задач ---
+
+    def _write(self, path, job):
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(job, f, ensure_ascii=False)
+            if JOB_FSYNC:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _pending_name(job):
+        # Имя начинается со времени запуска: сортировка имен = порядок выполнения
+        return f"{int(job['run_at'] * 1000):015d}-{job['id']}.json"
+
+    def enqueue(self, job_type, **payload):
+        """Ставит задачу в очередь; возвращает ее id"""
+        if job_type not in self._handlers:
+            raise ValueError(f"Unknown job type: {job_type}")
+        job = {
+            'id': uuid.uuid4().hex,
+            'type': job_type,
+            'payload': payload,
+            'attempts': 0,
+            'run_at': time.time(),
+            'created_at': time.time(),
+            'last_error': None
+        }
+        with web_metrics.timed('jobs.enqueue'):
+            self._write(os.path.join(self.pending_dir, self._pending_name(job)), job)
+        self.start()
+        with self._wakeup:
+            self._wakeup.notify()
+        return job['id']
+
+    def _claim(self):
+        """Забирает ближайшую готовую задачу (или None)"""
+        now_name = f"{int(time.time() * 1000):015d}"
+        for name in sorted(os.listdir(self.pending_dir)):
+            if not name.endswith('.json'):
+                continue
+            if name[:15] > now_name:
+                break
+            pending_path = os.path.join(self.pending_dir, name)
+            running_path = os.path.join(self.running_dir, f"{self._token}-{name}")
+            try:
+                # rename сохраняет mtime, а файл мог ждать в pending дольше аренды
+                os.utime(pending_path)
+                os.rename(pending_path, running_path)
+            except FileNotFoundError:
+                continue  # забрал другой поток или процесс
+            with self._running_lock:
+                self._running.add(running_path)
+            try:
+                with open(running_path, 'r', encoding='utf-8') as f:
+                    return running_path, json.load(f)
+            except ValueError as e:
+                # Испорченный файл не выполнить: убираем его в corrupt, чтобы он не возвращался
+                # по аренде (в dead его не прочитали бы dead_jobs и retry_dead)
+                logger.error(f"Job file {name} is corrupted, moving it to {self.corrupt_dir}: {e}")
+                try:
+                    os.replace(running_path, os.path.join(self.corrupt_dir, name))
+                finally:
+                    self._release(running_path)
+        return None
+
+    def _release(self, running_path):
+        with self._running_lock:
+            self._running.discard(running_path)
+
+    def _renew_leases(self):
+        """Обновляет mtime файлов задач, которые выполняет этот процесс"""
+        with self._running_lock:
+            paths = list(self._running)
+        for path in paths:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass  # задача уже завершена
+
+    def _recover(self):
+        """Возвращает в pending задачи, чья аренда истекла (процесс умер или завис)"""
+        deadline = time.time() - JOB_LEASE
+        with self._running_lock:
+            own = set(self._running)
+        for name in os.listdir(self.running_dir):
+            path = os.path.join(self.running_dir, name)
+            token, _, pending_name = name.partition('-')
+            if not name.endswith('.json') or not pending_name or path in own:
+                continue
+            try:
+                if os.stat(path).st_mtime >= deadline:
+                    continue
+                os.rename(path, os.path.join(self.pending_dir, pending_name))
+                logger.warning(f"Requeued job {pending_name} abandoned by worker {token}")
+            except FileNotFoundError:
+                pass  # задачу завершили или уже вернули в очередь
+
+    def _maintain(self):
+        """Поток аренды: продлевает свои задачи и возвращает брошенные чужие"""
+        while not self._stopping:
+            try:
+                self._renew_leases()
+                self._recover()
+            except Exception as e:
+                logger.error(f"Error checking job leases: {e}")
+            with self._wakeup:
+                self._wakeup.wait(JOB_LEASE / 3)
+
+    # --- Выполнение ---
+
+    def _run(self, running_path, job):
+        handler = self._handlers.get(job['type'])
+        job['attempts'] += 1
+        try:
+            if handler is None:
+                raise LookupError(f"No handler for job type {job['type']}")
+            with web_metrics.timed(f"jobs.{job['type']}.run"):
+                handler(**job['payload'])
+        except Exception as e:
+            job['last_error'] = f"{type(e).__name__}: {e}"
+            cause = e.__cause__ or e.__context__
+            if cause is not None:
+                job['last_error'] += f" (caused by {type(cause).__name__}: {cause})"
+            if job['attempts'] >= self.max_attempts:
+                job['traceback'] = traceback.format_exc()
+                self._store(running_path, os.path.join(self.dead_dir, f"{job['id']}.json"), job)
+                logger.error(f"Job {job['type']} {job['id']} moved to dead letters after "
+                             f"{job['attempts']} attempts: {job['last_error']}")
+                web_metrics.observe(f"jobs.{job['type']}.dead", 0)
+            else:
+                job['run_at'] = time.time() + JOB_RETRY_DELAY * 2 ** (job['attempts'] - 1)
+                self._store(running_path, os.path.join(self.pending_dir, self._pending_name(job)), job)
+                logger.warning(f"Job {job['type']} {job['id']} failed (attempt {job['attempts']}), "
+                               f"retrying: {job['last_error']}")
+        else:
+            web_metrics.observe(f"jobs.{job['type']}.latency", (time.time() - job['created_at']) * 1000)
+            self._store(running_path, None, job)
+        self._release(running_path)
+
+    def _store(self, running_path, target, job):
+        """Переносит задачу из running в target (None - задача выполнена)
+
+        Ошибка записи не останавливает поток: файл остается в running,
+        перестает продлеваться и вернется в pending по истечении аренды.
+        """
+        try:
+            if target is not None:
+                self._write(target, job)
+            os.remove(running_path)
+        except FileNotFoundError:
+            # Аренда истекла раньше, и задачу уже вернул в очередь другой процесс
+            logger.warning(f"Job {job['type']} {job['id']} was requeued while running")
+        except OSError as e:
+            logger.error(f"Error saving job {job['type']} {job['id']}: {e}")
+
+    def _worker(self):
+        while not self._stopping:
+            try:
+                claimed = self._claim()
+            except Exception as e:
+                logger.error(f"Error reading job queue: {e}")
+                claimed = None
+            if claimed is None:
+                with self._wakeup:
+                    self._wakeup.wait(JOB_POLL_INTERVAL)
+                continue
+            self._run(*claimed)
+
+    def start(self):
+        """Запускает пул потоков (повторно - после fork в новом процессе)"""
+        if self._pid == os.getpid() or not self.workers:
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._token = uuid.uuid4().hex
+            self._running = set()
+            self._stopping = False
+            self._threads = [threading.Thread(target=self._worker, name=f"job-worker-{n}", daemon=True)
+                             for n in range(self.workers)]
+            self._threads.append(threading.Thread(target=self._maintain, name='job-lease', daemon=True))
+            for t in self._threads:
+                t.start()
+            logger.info(f"Started {self.workers} job workers in process {self._pid} (token {self._token})")
+
+    def stop(self, timeout=5):
+        """Останавливает пул; недоделанные задачи останутся в очереди"""
+        self._stopping = True
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+        self._pid = None
+
+    # --- Состояние и dead letters ---
+
+    def stats(self):
+        return {
+            'pending': len(os.listdir(self.pending_dir)),
+            'running': len(os.listdir(self.running_dir)),
+            'dead': len(os.listdir(self.dead_dir)),
+            'corrupt': len(os.listdir(self.corrupt_dir))
+        }
+
+    def dead_jobs(self):
+        jobs = []
+        for name in sorted(os.listdir(self.dead_dir)):
+            if not name.endswith('.json'):
+                continue  # временный файл _write
+            try:
+                with open(os.path.join(self.dead_dir, name), 'r', encoding='utf-8') as f:
+                    jobs.append(json.load(f))
+            except FileNotFoundError:
+                continue  # задачу только что вернули в очередь
+            except ValueError as e:
+                # Один испорченный файл не должен ломать весь список
+                logger.error(f"Skipping corrupted dead job file {name}: {e}")
+        return jobs
+
+    def retry_dead(self, job_id):
+        """Возвращает задачу из dead в очередь с новым счетчиком попыток"""
+        dead_path = os.path.join(self.dead_dir, f"{job_id}.json")
+        if not job_id.isalnum() or not os.path.exists(dead_path):
+            return False
+        with open(dead_path, 'r', encoding='utf-8') as f:
+            job = json.load(f)
+        job.update(attempts=0, run_at=time.time())
+        job.pop('traceback', None)
+        self._write(os.path.join(self.pending_dir, self._pending_name(job)), job)
+        os.remove(dead_path)
+        self.start()
+        with self._wakeup:
+            self._wakeup.notify()
+        return True
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Именованные блокировки для операций "прочитать - изменить - записать"
+Работают между потоками и между процессами (воркерами gunicorn) через flock.
+Время ожидания и удержания каждой блокировки пишется в web_metrics:
+lock.<name>.wait и lock.<name>.hold
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+import web_metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировки только внутри процесса
+    fcntl = None
+
+
+class LockManager:
+    """Набор именованных блокировок; файлы блокировок: <prefix>.<name>.lock
+
+    on_acquire(name) вызывается сразу после взятия блокировки - например,
+    чтобы запрос перечитал таблицу name, а не данные, прочитанные до блокировки.
+    """
+
+    def __init__(self, prefix, on_acquire=None):
+        self.prefix = prefix
+        self.on_acquire = on_acquire
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def _get(self, name):
+        entry = self._locks.get(name)
+        if entry is None:
+            with self._guard:
+                entry = self._locks.get(name)
+                if entry is None:
+                    fd = None
+                    if fcntl is not None:
+                        fd = os.open(f"{self.prefix}.{name}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+                    # flock не различает потоки одного процесса, поэтому нужен и threading.Lock
+                    entry = (threading.Lock(), fd)
+                    self._locks[name] = entry
+        return entry
+
+    @contextmanager
+    def lock(self, name):
+        """Эксклюзивная блокировка name на время блока with"""
+        thread_lock, fd = self._get(name)
+        start = time.perf_counter()
+        with thread_lock:
+            if fd is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            acquired = time.perf_counter()
+            web_metrics.observe(f"lock.{name}.wait", (acquired - start) * 1000)
+            try:
+                if self.on_acquire is not None:
+                    self.on_acquire(name)
+                yield
+            finally:
+                web_metrics.observe(f"lock.{name}.hold", (time.perf_counter() - acquired) * 1000)
+                if fd is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def close(self):
+        with self._guard:
+            for _, fd in self._locks.values():
+                if fd is not None:
+                    os.close(fd)
+            self._locks = {}
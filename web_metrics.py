@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Простые метрики веб-приложения T1EUP
+Гистограммы времени выполнения (в миллисекундах) в памяти процесса
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+
+# Границы корзин гистограммы, мс
+DEFAULT_BUCKETS_MS = (0.1, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Histogram:
+    """Гистограмма длительностей с приближенными перцентилями"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * (len(self.buckets) + 1)
+            self.count = 0
+            self.total = 0.0
+            self.max = 0.0
+
+    def observe(self, value_ms):
+        with self._lock:
+            i = 0
+            while i < len(self.buckets) and value_ms > self.buckets[i]:
+                i += 1
+            self.counts[i] += 1
+            self.count += 1
+            self.total += value_ms
+            if value_ms > self.max:
+                self.max = value_ms
+
+    def percentile(self, q):
+        """Верхняя граница корзины, в которую попадает q-й перцентиль"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self):
+        with self._lock:
+            count, total, max_value = self.count, self.total, self.max
+            buckets = {f"le_{b}": c for b, c in zip(self.buckets, self.counts)}
+            buckets['inf'] = self.counts[-1]
+        return {
+            'count': count,
+            'avg_ms': round(total / count, 3) if count else 0.0,
+            'max_ms': round(max_value, 3),
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'buckets': buckets
+        }
+
+
+_histograms = {}
+_registry_lock = threading.Lock()
+
+
+def histogram(name, buckets=DEFAULT_BUCKETS_MS):
+    """Возвращает гистограмму по имени, создавая ее при первом обращении
+
+    buckets задаются только при создании: для величин не во времени
+    (например, длина очереди) нужны свои границы корзин.
+    """
+    h = _histograms.get(name)
+    if h is None:
+        with _registry_lock:
+            h = _histograms.setdefault(name, Histogram(buckets))
+    return h
+
+
+def observe(name, value_ms):
+    histogram(name).observe(value_ms)
+
+
+@contextmanager
+def timed(name):
+    """Замеряет время выполнения блока и пишет его в гистограмму"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, (time.perf_counter() - start) * 1000)
+
+
+def snapshot():
+    """Все метрики процесса в виде словаря (для /admin/metrics)"""
+    return {name: h.snapshot() for name, h in sorted(_histograms.items())}
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Форматы файлов JSON базы веб-приложения T1EUP
+- json: минифицированный JSON (по умолчанию, для продакшена)
+- pretty: JSON с отступами (экспорт для отладки)
+- orjson: тот же компактный JSON через orjson, если пакет установлен
+- msgpack: двоичный формат, если установлен пакет msgpack
+Формат записи выбирается переменной окружения DB_FORMAT, при чтении
+определяется по содержимому файла, поэтому формат можно менять на ходу.
+"""
+
+import abc
+import json
+import logging
+
+try:
+    import orjson
+except ImportError:  # необязательная зависимость
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # необязательная зависимость
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+# Первые байты JSON документа; все остальное считается msgpack
+_JSON_START = b'{[ \t\r\n'
+
+
+class Serializer(abc.ABC):
+    """Формат снимка: dumps(obj) -> bytes, loads(bytes) -> obj"""
+
+    name = None
+    binary = False
+
+    @abc.abstractmethod
+    def dumps(self, obj):
+        """Объект -> bytes"""
+
+    def loads(self, payload):
+        return load_any(payload)
+
+
+class JsonSerializer(Serializer):
+    name = 'json'
+
+    def dumps(self, obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class PrettyJsonSerializer(Serializer):
+    name = 'pretty'
+
+    def dumps(self, obj):
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+
+
+class OrjsonSerializer(Serializer):
+    name = 'orjson'
+
+    def dumps(self, obj):
+        return orjson.dumps(obj)
+
+
+class MsgpackSerializer(Serializer):
+    name = 'msgpack'
+    binary = True
+
+    def dumps(self, obj):
+        return msgpack.packb(obj, use_bin_type=True)
+
+
+SERIALIZERS = {
+    'json': JsonSerializer(),
+    'pretty': PrettyJsonSerializer(),
+    'orjson': OrjsonSerializer(),
+    'msgpack': MsgpackSerializer()
+}
+
+
+def available():
+    """Имена форматов, которые можно использовать в этом окружении"""
+    names = ['json', 'pretty']
+    if orjson is not None:
+        names.append('orjson')
+    if msgpack is not None:
+        names.append('msgpack')
+    return names
+
+
+def get_serializer(name):
+    """Формат по имени; если нужного пакета нет - компактный JSON"""
+    if name not in SERIALIZERS:
+        raise ValueError(f"Unknown DB_FORMAT: {name}")
+    if name not in available():
+        logger.warning(f"DB_FORMAT={name} requires the {name} package, falling back to json")
+        name = 'json'
+    return SERIALIZERS[name]
+
+
+def load_any(payload):
+    """Разбирает снимок любого из форматов"""
+    if payload[:1] in _JSON_START:
+        if orjson is not None:
+            return orjson.loads(payload)
+        return json.loads(payload.decode('utf-8'))
+    if msgpack is None:
+        raise ValueError("Snapshot is in msgpack format, but the msgpack package is not installed")
+    return msgpack.unpackb(payload, raw=False, strict_map_key=False)
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Сессии веб-приложения T1EUP: подписанные токены с id пользователя и ролью
+Токен лежит в HttpOnly cookie session_token и подписан SECRET_KEY
+(itsdangerous, идет вместе с Flask), поэтому проверка прав - это проверка
+подписи и срока в памяти, без чтения базы. Cookie user_id остается только
+для отображения меню в браузере и не дает никаких прав.
+
+Отзыв сессий (выход, смена роли) пишется строками JSON в общий файл;
+каждый процесс дочитывает его по stat(), как журнал базы.
+"""
+
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+
+from flask import g, request
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+
+import web_metrics
+
+logger = logging.getLogger(__name__)
+
+# Срок жизни сессии, секунд
+SESSION_MAX_AGE = int(os.environ.get('SESSION_MAX_AGE', 30 * 24 * 3600))
+# Сколько проверенных токенов держать в памяти процесса
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', 1024))
+SESSION_COOKIE = 'session_token'
+
+ROLE_ADMIN = 'admin'
+ROLE_USER = 'user'
+
+
+class Session:
+    """Проверенная сессия: id пользователя, роль, id сессии и время выдачи"""
+
+    __slots__ = ('user_id', 'role', 'sid', 'issued_at')
+
+    def __init__(self, user_id, role, sid, issued_at):
+        self.user_id = user_id
+        self.role = role
+        self.sid = sid
+        self.issued_at = issued_at
+
+    @property
+    def is_admin(self):
+        return self.role == ROLE_ADMIN
+
+
+class SessionManager:
+    """Выдача, проверка и отзыв сессий"""
+
+    def __init__(self, secret_key, revocations_path, max_age=SESSION_MAX_AGE, cache_size=SESSION_CACHE_SIZE):
+        self.serializer = URLSafeTimedSerializer(secret_key, salt='t1eup-session')
+        self.revocations_path = revocations_path
+        self.max_age = max_age
+        self.cache_size = cache_size
+        # token -> (Session, когда истекает)
+        self._cache = OrderedDict()
+        # Отозванные сессии и "все сессии пользователя, выданные раньше времени"
+        self._revoked_sids = set()
+        self._revoked_before = {}
+        self._revocations_offset = 0
+        self._lock = threading.Lock()
+
+    # --- Выдача и проверка ---
+
+    def issue(self, user_id, role):
+        """Новый токен для пользователя с ролью role"""
+        payload = {'uid': user_id, 'role': role, 'sid': uuid.uuid4().hex, 'iat': round(time.time(), 3)}
+        return self.serializer.dumps(payload)
+
+    def verify(self, token):
+        """Session для действующего токена, иначе None"""
+        if not token:
+            return None
+        self._read_revocations()
+        with self._lock:
+            cached = self._cache.get(token)
+            if cached is not None:
+                self._cache.move_to_end(token)
+        if cached is not None:
+            session, expires_at = cached
+            if time.time() >= expires_at:
+                return None
+        else:
+            with web_metrics.timed('session.verify'):
+                try:
+                    payload = self.serializer.loads(token, max_age=self.max_age)
+                    session = Session(int(payload['uid']), payload['role'], payload['sid'], float(payload['iat']))
+                except SignatureExpired:
+                    return None
+                except (BadSignature, KeyError, TypeError, ValueError):
+                    logger.warning("Rejected session token with a bad signature")
+                    return None
+            self._remember(token, session)
+        if session.sid in self._revoked_sids or session.issued_at < self._revoked_before.get(session.user_id, 0):
+            return None
+        return session
+
+    def _remember(self, token, session):
+        if not self.cache_size:
+            return
+        with self._lock:
+            self._cache[token] = (session, session.issued_at + self.max_age)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    # --- Отзыв ---
+
+    def revoke(self, session):
+        """Отзывает одну сессию (выход)"""
+        self._append_revocation({'sid': session.sid, 'iat': session.issued_at})
+
+    def revoke_user(self, user_id):
+        """Отзывает все уже выданные сессии пользователя (например, при смене роли)"""
+        now = round(time.time(), 3)
+        self._append_revocation({'uid': user_id, 'before': now, 'iat': now})
+
+    def _append_revocation(self, entry):
+        line = (json.dumps(entry) + '\n').encode('utf-8')
+        fd = os.open(self.revocations_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+        self._read_revocations()
+
+    def _read_revocations(self):
+        """Дочитывает отзывы, дописанные любым процессом после последнего чтения"""
+        try:
+            size = os.stat(self.revocations_path).st_size
+        except FileNotFoundError:
+            return
+        if size == self._revocations_offset:
+            return
+        with self._lock:
+            if size < self._revocations_offset:
+                # Файл очищен вручную: читаем заново
+                self._revoked_sids = set()
+                self._revoked_before = {}
+                self._revocations_offset = 0
+            with open(self.revocations_path, 'rb') as f:
+                f.seek(self._revocations_offset)
+                for raw in f:
+                    if not raw.endswith(b'\n'):
+                        break
+                    self._revocations_offset += len(raw)
+                    try:
+                        entry = json.loads(raw.decode('utf-8'))
+                    except ValueError:
+                        continue
+                    if entry.get('iat', 0) + self.max_age < time.time():
+                        continue  # все затронутые сессии уже истекли
+                    if 'sid' in entry:
+                        self._revoked_sids.add(entry['sid'])
+                    elif 'uid' in entry:
+                        user_id = int(entry['uid'])
+                        self._revoked_before[user_id] = max(self._revoked_before.get(user_id, 0), entry['before'])
+
+    # --- Flask ---
+
+    def current(self):
+        """Сессия текущего запроса (или None); проверяется один раз за запрос"""
+        if 'auth_session' not in g:
+            g.auth_session = self.verify(request.cookies.get(SESSION_COOKIE))
+        return g.auth_session
+
+    def login(self, response, user_id, role):
+        """Выдает токен и ставит cookie сессии (и user_id для меню в браузере)"""
+        response.set_cookie(SESSION_COOKIE, self.issue(user_id, role), max_age=self.max_age,
+                            httponly=True, samesite='Lax', secure=request.is_secure)
+        response.set_cookie('user_id', str(user_id), max_age=self.max_age, samesite='Lax')
+        return response
+
+    def logout(self, response):
+        session = self.current()
+        if session is not None:
+            self.revoke(session)
+        response.delete_cookie(SESSION_COOKIE)
+        response.set_cookie('user_id', '', expires=0)
+        return response
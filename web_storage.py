@@ -0,0 +1,1492 @@
+#!/usr/bin/env python3
+"""
+Хранилище данных веб-приложения T1EUP
+Два движка с одинаковым набором методов:
+- json: резидентная копия базы в памяти + журнал изменений (append-only);
+  каталог, пользователи и заказы - отдельные файлы со своими версиями
+- sqlite: таблицы users/orders/ties с индексами
+Движок выбирается переменной окружения WEB_STORAGE_BACKEND
+"""
+
+import os
+import json
+import gzip
+import atexit
+import itertools
+import logging
+import copy
+import shutil
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировки между процессами недоступны
+    fcntl = None
+
+import web_metrics
+import web_serializers
+
+logger = logging.getLogger(__name__)
+
+# Через сколько записей журнала делать полный снимок базы
+JOURNAL_COMPACT_EVERY = int(os.environ.get('DB_JOURNAL_COMPACT_EVERY', 500))
+
+# Сколько предыдущих снимков хранить рядом с базой (simple_db.json.1, .2, ...)
+SNAPSHOT_BACKUPS = int(os.environ.get('DB_SNAPSHOT_BACKUPS', 3))
+
+# fsync журнала после каждой записи (0 - быстрее, но последние изменения могут потеряться при сбое)
+JOURNAL_FSYNC = os.environ.get('DB_FSYNC', '1') != '0'
+
+# Завершенные заказы прошлых месяцев уходят из основной базы в сжатый архив по месяцам
+ARCHIVE_STATUSES = tuple(s.strip() for s in os.environ.get('DB_ARCHIVE_STATUSES', 'completed,rejected').split(',')
+                         if s.strip())
+# Сколько архивных месяцев держать распакованными в памяти процесса
+ARCHIVE_CACHE_SEGMENTS = int(os.environ.get('DB_ARCHIVE_CACHE_SEGMENTS', 4))
+
+# Формат снимков JSON базы: json (минифицированный), pretty, orjson, msgpack (см. web_serializers)
+DB_FORMAT = os.environ.get('DB_FORMAT', 'json').lower()
+
+# json (по умолчанию) или sqlite
+STORAGE_BACKEND = os.environ.get('WEB_STORAGE_BACKEND', 'json').lower()
+SQLITE_PATH = os.environ.get('WEB_SQLITE_PATH', 'simple_db.sqlite3')
+
+
+def _fsync_dir(path):
+    """fsync каталога, чтобы rename/удаление файла пережили сбой питания"""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_atomic(path, payload):
+    """Атомарно записывает байты в файл: временный файл + fsync + rename"""
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(path)
+
+
+# Поля сортировки каталога в админке (position - порядок витрины)
+TIE_SORTS = {'id': 'id', 'price': 'price', 'name': 'name_ru'}
+
+
+def _tie_matches(tie, status, min_price, max_price):
+    """Фильтр каталога: status - 'active' / 'inactive' / None, цены включительно"""
+    active = tie.get('active', True)
+    if status == 'active' and not active or status == 'inactive' and active:
+        return False
+    price = tie.get('price') or 0
+    if min_price is not None and price < min_price:
+        return False
+    if max_price is not None and price > max_price:
+        return False
+    return True
+
+
+def _tie_sort_key(tie, field):
+    """Ключ сортировки каталога в порядке ORDER BY field, id движка SQLite
+
+    Пустые значения (None, нет поля) идут первыми, как NULL в SQLite; само
+    значение не подменяется, поэтому '' сравнивается только со строками.
+    """
+    value = tie.get(field)
+    # При value = None второй элемент у всех таких галстуков одинаков и не сравнивается
+    return (value is not None, value, tie['id'])
+
+
+def file_id(path):
+    """Идентификатор версии файла: inode, время изменения и размер"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def order_month(order):
+    """Месяц заказа (YYYY-MM) - ключ партиции"""
+    return (order.get('created_at') or '')[:7] or 'unknown'
+
+
+class OrderArchive:
+    """Архив заказов: по одному сжатому сегменту на месяц + общий индекс
+
+    Сегменты: <dir>/orders-YYYY-MM.json.gz, после записи меняются только
+    при досыпании новых заказов того же месяца. index.json хранит для
+    каждого месяца диапазон номеров и счетчики по статусам, а для каждого
+    пользователя - список месяцев с его заказами, чтобы история заказов
+    читала только нужные сегменты.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index_path = os.path.join(directory, 'index.json')
+        self._lock = threading.Lock()
+        self._index = None
+        self._index_id = None
+        self._segments = OrderedDict()
+
+    def _segment_path(self, month):
+        return os.path.join(self.directory, f"orders-{month}.json.gz")
+
+    @staticmethod
+    def _empty_index():
+        return {'segments': {}, 'users': {}, 'max_order_id': 0}
+
+    def index(self):
+        """Индекс архива, сверенный с диском через stat()"""
+        index_id = file_id(self.index_path)
+        if self._index is None or index_id != self._index_id:
+            with self._lock:
+                if index_id is None:
+                    self._index = self._empty_index()
+                else:
+                    with open(self.index_path, 'r', encoding='utf-8') as f:
+                        self._index = json.load(f)
+                self._index_id = index_id
+        return self._index
+
+    def segment(self, month):
+        """Заказы одного месяца (ключ - номер заказа строкой)"""
+        path = self._segment_path(month)
+        seg_id = file_id(path)
+        with self._lock:
+            cached = self._segments.get(month)
+            if cached is not None and cached[0] == seg_id:
+                self._segments.move_to_end(month)
+                return cached[1]
+        if seg_id is None:
+            return {}
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            orders = json.load(f)
+        with self._lock:
+            self._segments[month] = (seg_id, orders)
+            self._segments.move_to_end(month)
+            while len(self._segments) > ARCHIVE_CACHE_SEGMENTS:
+                self._segments.popitem(last=False)
+        return orders
+
+    def months(self):
+        return sorted(self.index()['segments'])
+
+    # --- Чтение ---
+
+    def get_order(self, order_id):
+        for month, info in self.index()['segments'].items():
+            if info['min_id'] <= int(order_id) <= info['max_id']:
+                order = self.segment(month).get(str(order_id))
+                if order is not None:
+                    return order
+        return None
+
+    def user_orders(self, user_id):
+        orders = []
+        for month in sorted(self.index()['users'].get(str(user_id), ())):
+            orders.extend(o for o in self.segment(month).values() if o.get('user_id') == user_id)
+        return orders
+
+    def orders_by_status(self, status):
+        orders = []
+        for month in self.months():
+            if self.index()['segments'][month]['statuses'].get(status):
+                orders.extend(o for o in self.segment(month).values() if o.get('status') == status)
+        return orders
+
+    def iter_orders(self, newest_first=False):
+        """Все архивные заказы по месяцам, не засоряя кэш сегментов"""
+        months = self.months()
+        if newest_first:
+            months.reverse()
+        for month in months:
+            with gzip.open(self._segment_path(month), 'rt', encoding='utf-8') as f:
+                orders = list(json.load(f).values())
+            if newest_first:
+                orders.reverse()
+            yield from orders
+
+    def count(self):
+        return sum(info['count'] for info in self.index()['segments'].values())
+
+    def count_by_status(self, status):
+        return sum(info['statuses'].get(status, 0) for info in self.index()['segments'].values())
+
+    def max_order_id(self):
+        return self.index()['max_order_id']
+
+    # --- Запись (только под exclusive блокировкой базы) ---
+
+    def add(self, orders):
+        """Досыпает заказы в сегменты их месяцев и обновляет индекс"""
+        os.makedirs(self.directory, exist_ok=True)
+        by_month = {}
+        for order in orders:
+            by_month.setdefault(order_month(order), {})[str(order['id'])] = order
+
+        index = json.loads(json.dumps(self.index()))
+        for month, new_orders in sorted(by_month.items()):
+            merged = dict(self.segment(month))
+            merged.update(new_orders)
+            merged = dict(sorted(merged.items(), key=lambda item: int(item[0])))
+            payload = gzip.compress(json.dumps(merged, ensure_ascii=False).encode('utf-8'))
+            write_atomic(self._segment_path(month), payload)
+
+            statuses = {}
+            for order in merged.values():
+                statuses[order.get('status')] = statuses.get(order.get('status'), 0) + 1
+                user_months = index['users'].setdefault(str(order.get('user_id')), [])
+                if month not in user_months:
+                    user_months.append(month)
+            ids = [int(k) for k in merged]
+            index['segments'][month] = {
+                'count': len(merged),
+                'min_id': min(ids),
+                'max_id': max(ids),
+                'statuses': statuses
+            }
+            index['max_order_id'] = max(index['max_order_id'], max(ids))
+
+        write_atomic(self.index_path, json.dumps(index, ensure_ascii=False).encode('utf-8'))
+        logger.info(f"Archived {len(orders)} orders into {len(by_month)} monthly segments")
+
+
+class UnitView:
+    """Данные части и ее индексы, которые видит запрос (только для чтения)"""
+
+    def __init__(self, data, **indexes):
+        self.data = data
+        self.__dict__.update(indexes)
+
+
+class JournalUnit:
+    """Одна независимо загружаемая часть базы: снимок + журнал + версия
+
+    Каждый процесс (воркер gunicorn) держит свою копию части в памяти.
+    Перед чтением она сверяется с диском через stat(): если журнал вырос -
+    дочитываются только новые строки, если снимок переписан другим
+    процессом - часть перечитывается целиком. Остальные части при этом
+    не трогаются.
+
+    Версия части - "<epoch>.<записей журнала>": epoch меняется при каждой
+    записи снимка, а журнал все процессы читают в одном порядке, поэтому
+    версия одинакова во всех воркерах и никогда не повторяется.
+    Каждая запись журнала помечена epoch своего снимка: записи другого
+    снимка (журнал пережил сбой компакции или восстановление из копии)
+    пропускаются.
+
+    Внутри области запроса (begin_scope/end_scope) поток сверяет часть с
+    диском один раз и до конца области читает те же объекты (view). Если
+    в это время часть меняет другой поток, он сначала копирует данные и
+    индексы (копирование при записи), поэтому открытые view не меняются.
+    View вне области (фоновые задачи, бот) не имеют конца, поэтому после
+    выдачи такого view следующая запись тоже копирует данные.
+    """
+
+    table = None
+    # Атрибуты-индексы части, которые попадают в view
+    indexes = ()
+
+    def __init__(self, name, path, default_factory, compact_every=JOURNAL_COMPACT_EVERY, serializer=None):
+        self.name = name
+        self.path = path
+        self.journal_path = path + '.journal'
+        self.lock_path = path + '.lock'
+        self.default_factory = default_factory
+        self.compact_every = compact_every
+        self.serializer = serializer or web_serializers.get_serializer(DB_FORMAT)
+        self._lock = threading.RLock()
+        self._lock_fd = None
+        self._data = None
+        self._epoch = '0'
+        self._snapshot_id = None
+        self._journal_offset = 0
+        self._journal_entries = 0
+        # Области запросов: view этого потока и потоки, читающие текущие объекты
+        self._local = threading.local()
+        self._readers = set()
+        # Выдан view вне области запроса: текущие объекты может читать кто угодно
+        self._shared = False
+
+    # --- Межпроцессная блокировка ---
+
+    @contextmanager
+    def _file_lock(self, exclusive):
+        """flock на <часть>.json.lock: запись в журнал - shared, компакция - exclusive"""
+        if fcntl is None:
+            yield
+            return
+        if self._lock_fd is None:
+            self._lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        with web_metrics.timed(f"lock.journal.{self.name}.wait"):
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    # --- Загрузка и журнал ---
+
+    def current(self):
+        """Данные части в памяти, сверенные с диском (два вызова stat)"""
+        if self._data is None or file_id(self.path) != self._snapshot_id:
+            with self._lock:
+                if self._data is None or file_id(self.path) != self._snapshot_id:
+                    with self._file_lock(exclusive=True):
+                        self._load()
+            return self._data
+        try:
+            journal_size = os.stat(self.journal_path).st_size
+        except FileNotFoundError:
+            journal_size = 0
+        if journal_size != self._journal_offset:
+            with self._lock:
+                self._read_journal_tail()
+        return self._data
+
+    # --- Области запросов ---
+
+    def begin_scope(self):
+        self._local.active = True
+        self._local.view = None
+
+    def end_scope(self):
+        self._local.active = False
+        self._local.view = None
+        with self._lock:
+            self._readers.discard(threading.get_ident())
+
+    def refresh(self):
+        """Следующее чтение в области снова сверится с диском (после взятия блокировки)"""
+        self._local.view = None
+
+    def view(self):
+        """Данные и индексы части для чтения
+
+        Вне области запроса - всегда свежие; в области - сверенные с диском
+        при первом обращении потока и неизменные до конца области.
+        """
+        local = self._local
+        if not getattr(local, 'active', False):
+            with self._lock:
+                self.current()
+                self._shared = True
+                return self._make_view()
+        if local.view is None:
+            with self._lock:
+                self.current()
+                local.view = self._make_view()
+                self._readers.add(threading.get_ident())
+        return local.view
+
+    def _make_view(self):
+        return UnitView(self._data, **{name: getattr(self, name) for name in self.indexes})
+
+    def _detach(self):
+        """Копирование при записи: перед изменением в памяти отделяет данные от чужих view"""
+        me = threading.get_ident()
+        if self._shared or self._readers - {me}:
+            self._data = copy.copy(self._data)
+            self._copy_indexes()
+        self._readers &= {me}
+        self._shared = False
+
+    def _copy_indexes(self):
+        """Отделяет изменяемые индексы части от чужих view (см. _detach)"""
+
+    def version(self):
+        """Версия части, одинаковая во всех процессах"""
+        with self._lock:
+            self.current()
+            return f"{self._epoch}.{self._journal_entries}"
+
+    def _backup_path(self, n):
+        return f"{self.path}.{n}"
+
+    def _read_snapshot(self, path):
+        """Читает снимок любого формата (формат записи мог смениться)"""
+        with open(path, 'rb') as f:
+            snapshot = web_serializers.load_any(f.read())
+        return snapshot.get('epoch', '0'), snapshot[self.table]
+
+    def _load_snapshot(self):
+        """Читает снимок, при повреждении - последний целый из резервных копий"""
+        if not os.path.exists(self.path):
+            # Первый запуск: снимок со значениями по умолчанию сразу на диск,
+            # чтобы у части был свой epoch
+            data = self.default_factory()
+            return self._write_snapshot(data), data
+        try:
+            return self._read_snapshot(self.path)
+        except Exception as e:
+            logger.error(f"Error loading database {self.path}: {e}")
+
+        # Поврежденный файл откладываем в сторону, чтобы следующий снимок его не затер
+        suffix = datetime.now().strftime('%Y%m%d_%H%M%S')
+        corrupt_path = f"{self.path}.corrupt-{suffix}"
+        os.replace(self.path, corrupt_path)
+        logger.error(f"Moved broken database to {corrupt_path}")
+        # Журнал продолжал поврежденный снимок, а не резервную копию: поверх нее его не проигрываем
+        if os.path.exists(self.journal_path):
+            os.replace(self.journal_path, f"{self.journal_path}.corrupt-{suffix}")
+            logger.error(f"Moved journal of the broken database to {self.journal_path}.corrupt-{suffix}")
+
+        for n in range(1, SNAPSHOT_BACKUPS + 1):
+            backup_path = self._backup_path(n)
+            if not os.path.exists(backup_path):
+                continue
+            try:
+                _, data = self._read_snapshot(backup_path)
+            except Exception as e:
+                logger.error(f"Backup {backup_path} is broken too: {e}")
+                continue
+            logger.warning(f"Database recovered from {backup_path}")
+            # Новый epoch: версии, выданные до сбоя, не должны повториться
+            return self._write_snapshot(data), data
+
+        logger.error(f"No readable snapshot of {self.name} found, starting from defaults")
+        data = self.default_factory()
+        return self._write_snapshot(data), data
+
+    def _read_journal_tail(self, loading=False):
+        """Применяет строки журнала, дописанные после последнего чтения
+
+        Незаконченная последняя строка пропускается; при загрузке (под
+        exclusive блокировкой) она отрезается как след сбоя.
+        """
+        try:
+            f = open(self.journal_path, 'rb')
+        except FileNotFoundError:
+            f = None
+        if not loading and file_id(self.path) != self._snapshot_id:
+            # Другой процесс сделал компакцию: открытый журнал может быть уже новым,
+            # и наше смещение к нему не относится - перечитываем часть целиком
+            if f is not None:
+                f.close()
+            with self._file_lock(exclusive=True):
+                self._load()
+            return
+        if f is None:
+            self._journal_offset = 0
+            return
+        skipped = 0
+        with f:
+            f.seek(self._journal_offset)
+            for raw in f:
+                if not raw.endswith(b'\n'):
+                    if loading:
+                        logger.warning(f"Truncating torn write at the end of {self.journal_path}")
+                        f.close()
+                        with open(self.journal_path, 'r+b') as w:
+                            w.truncate(self._journal_offset)
+                    break
+                try:
+                    entry = json.loads(raw.decode('utf-8'))
+                except ValueError:
+                    logger.error(f"Skipping broken journal entry in {self.journal_path}")
+                else:
+                    # Записи без epoch - из журналов до появления меток
+                    if entry.get('epoch', self._epoch) != self._epoch:
+                        skipped += 1
+                    else:
+                        self._detach()
+                        self._apply(entry)
+                        self._journal_entries += 1
+                self._journal_offset += len(raw)
+        if skipped:
+            logger.warning(f"Skipped {skipped} entries of another snapshot in {self.journal_path}")
+
+    def _load(self):
+        """Читает снимок и проигрывает поверх него журнал"""
+        with web_metrics.timed(f"db.load.{self.name}"):
+            self._snapshot_id = None
+            self._epoch, self._data = self._load_snapshot()
+            self._rebuild_indexes()
+            self._snapshot_id = file_id(self.path)
+            self._journal_offset = 0
+            self._journal_entries = 0
+            self._read_journal_tail(loading=True)
+        logger.info(f"Database {self.name} loaded: {len(self._data)} {self.table}, "
+                    f"{self._journal_entries} journal entries")
+
+    def _rebuild_indexes(self):
+        """Строит индексы части заново (после загрузки или полной замены)"""
+
+    def _apply(self, entry):
+        """Применяет одну запись журнала к данным и индексам"""
+        key = str(entry['key'])
+        if entry['op'] == 'put':
+            self._data[key] = entry['value']
+        elif entry['op'] == 'delete':
+            self._data.pop(key, None)
+
+    def write(self, entry):
+        """Дописывает изменение в журнал и применяет его в памяти
+
+        Запись в журнал одним write() с O_APPEND, поэтому строки разных
+        процессов не перемешиваются. Своя запись применяется вместе с
+        чужими при дочитывании хвоста журнала - порядок везде одинаковый.
+        """
+        with self._lock, web_metrics.timed(f"db.write.{self.table}"):
+            while True:
+                self.current()
+                line = (json.dumps(dict(entry, epoch=self._epoch), ensure_ascii=False) + '\n').encode('utf-8')
+                with self._file_lock(exclusive=False):
+                    if file_id(self.path) == self._snapshot_id and self._append(line):
+                        break
+                # Другой процесс успел сделать компакцию (epoch устарел) или журнал
+                # кончается оборванной строкой: ее можно отрезать только когда никто не пишет
+                with self._file_lock(exclusive=True):
+                    if file_id(self.path) == self._snapshot_id:
+                        self._append(line, repair=True)
+                        break
+            self._read_journal_tail()
+            if self._journal_entries >= self.compact_every:
+                self.compact()
+            if getattr(self._local, 'active', False):
+                # Запрос, который пишет, дальше видит свою запись
+                self._local.view = self._make_view()
+                self._readers.add(threading.get_ident())
+
+    def _append(self, line, repair=False):
+        """Дописывает строку в журнал; False, если журнал кончается оборванной строкой
+
+        Иначе новая строка склеилась бы с обрывком и потерялась при чтении.
+        С repair=True (под exclusive блокировкой) обрывок сначала отрезается.
+        """
+        fd = os.open(self.journal_path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            size = os.fstat(fd).st_size
+            if size:
+                os.lseek(fd, size - 1, os.SEEK_SET)
+                if os.read(fd, 1) != b'\n':
+                    if not repair:
+                        return False
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    complete = os.read(fd, size).rfind(b'\n') + 1
+                    logger.warning(f"Truncating torn write at the end of {self.journal_path}")
+                    os.ftruncate(fd, complete)
+            os.write(fd, line)
+            if JOURNAL_FSYNC:
+                with web_metrics.timed('db.journal_fsync'):
+                    os.fsync(fd)
+        finally:
+            os.close(fd)
+        return True
+
+    def _rotate_backups(self):
+        """Сдвигает резервные копии: текущий снимок становится .1, .1 - .2 и т.д."""
+        if not SNAPSHOT_BACKUPS or not os.path.exists(self.path):
+            return
+        for n in range(SNAPSHOT_BACKUPS - 1, 0, -1):
+            if os.path.exists(self._backup_path(n)):
+                os.replace(self._backup_path(n), self._backup_path(n + 1))
+        backup_path = self._backup_path(1)
+        if os.path.exists(backup_path):
+            os.remove(backup_path)
+        try:
+            os.link(self.path, backup_path)
+        except OSError:
+            shutil.copy2(self.path, backup_path)
+
+    def _write_snapshot(self, data):
+        """Атомарная запись снимка с новым epoch, возвращает epoch"""
+        epoch = os.urandom(6).hex()
+        with web_metrics.timed(f"db.snapshot_write.{self.name}"):
+            payload = self.serializer.dumps({'epoch': epoch, self.table: data})
+            tmp_path = f"{self.path}.tmp-{os.getpid()}"
+            with open(tmp_path, 'wb') as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            self._rotate_backups()
+            os.replace(tmp_path, self.path)
+            _fsync_dir(self.path)
+        return epoch
+
+    def _before_compact(self):
+        """Вызывается при компакции под exclusive блокировкой, когда журнал дочитан"""
+
+    def compact(self, data=None):
+        """Записывает полный снимок части и очищает ее журнал
+
+        Без data в снимок попадает текущая часть вместе со всем журналом,
+        с data - часть полностью заменяется переданными данными.
+        """
+        with self._lock, self._file_lock(exclusive=True):
+            if data is None:
+                if self._data is None:
+                    return
+                # Под exclusive блокировкой никто не пишет: дочитываем журнал до конца
+                if file_id(self.path) != self._snapshot_id:
+                    self._load()
+                else:
+                    self._read_journal_tail()
+                self._detach()
+                self._before_compact()
+                data = self._data
+            self._epoch = self._write_snapshot(data)
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+                _fsync_dir(self.journal_path)
+            if data is not self._data:
+                self._data = data
+                self._rebuild_indexes()
+            self._snapshot_id = file_id(self.path)
+            self._journal_offset = 0
+            self._journal_entries = 0
+            logger.info(f"Database {self.name} compacted into {self.path}")
+
+    def close(self):
+        """Сбрасывает журнал в снимок при остановке процесса"""
+        with self._lock:
+            if self._journal_entries:
+                try:
+                    self.compact()
+                except Exception as e:
+                    logger.error(f"Error compacting {self.path} on exit: {e}")
+            if self._lock_fd is not None:
+                os.close(self._lock_fd)
+                self._lock_fd = None
+
+
+class CatalogUnit(JournalUnit):
+    """Каталог галстуков: список в порядке витрины + индекс по id + счетчики"""
+
+    table = 'ties'
+    indexes = ('by_id', 'stats')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.by_id = {}
+        self.stats = {'total': 0, 'active': 0, 'price_sum': 0}
+
+    def _rebuild_indexes(self):
+        self.by_id = {t['id']: t for t in self._data}
+        self.stats = {'total': 0, 'active': 0, 'price_sum': 0}
+        for tie in self._data:
+            self._count(tie, 1)
+
+    def _copy_indexes(self):
+        self.by_id = dict(self.by_id)
+        self.stats = dict(self.stats)
+
+    def _count(self, tie, sign):
+        """Учитывает галстук в счетчиках (sign=1) или убирает из них (sign=-1)"""
+        self.stats['total'] += sign
+        self.stats['active'] += sign if tie.get('active', True) else 0
+        self.stats['price_sum'] += sign * (tie.get('price') or 0)
+
+    def _apply(self, entry):
+        tie_id = entry['key']
+        old = self.by_id.get(tie_id)
+        if old is not None:
+            self._count(old, -1)
+        if entry['op'] == 'put':
+            self._count(entry['value'], 1)
+        ties = [t for t in self._data if t['id'] != tie_id]
+        if entry['op'] == 'put':
+            # Сохраняем порядок каталога при обновлении существующего галстука
+            for i, t in enumerate(self._data):
+                if t['id'] == tie_id:
+                    ties.insert(i, entry['value'])
+                    break
+            else:
+                ties.append(entry['value'])
+            self.by_id[tie_id] = entry['value']
+        else:
+            self.by_id.pop(tie_id, None)
+        self._data = ties
+
+
+class UsersUnit(JournalUnit):
+    """Пользователи: словарь по id строкой"""
+
+    table = 'users'
+
+
+class OrdersUnit(JournalUnit):
+    """Живые заказы + индексы по пользователю и статусу
+
+    При компакции завершенные заказы прошлых месяцев уходят в архив.
+    """
+
+    table = 'orders'
+    indexes = ('by_user', 'by_status', 'max_order_id')
+
+    def __init__(self, name, path, default_factory, archive, compact_every=JOURNAL_COMPACT_EVERY,
+                 serializer=None):
+        super().__init__(name, path, default_factory, compact_every, serializer)
+        self.archive = archive
+        # Вторичные индексы: user_id -> ключи заказов, статус -> ключи заказов
+        self.by_user = {}
+        self.by_status = {}
+        self.max_order_id = 0
+        # Списки индексов, уже скопированные после последнего _detach (их можно менять на месте)
+        self._own_user_keys = set()
+        self._own_status_keys = set()
+
+    def _rebuild_indexes(self):
+        self.by_user = {}
+        self.by_status = {}
+        self.max_order_id = 0
+        self._own_user_keys = set()
+        self._own_status_keys = set()
+        for key, order in self._data.items():
+            self._index_order(key, order)
+
+    def _copy_indexes(self):
+        # Списки заказов копируются по одному при первом изменении (_bucket),
+        # а не все сразу: запись затрагивает один-два списка
+        self.by_user = dict(self.by_user)
+        self.by_status = dict(self.by_status)
+        self._own_user_keys = set()
+        self._own_status_keys = set()
+
+    @staticmethod
+    def _bucket(index, own_keys, value):
+        """Список ключей заказов index[value] для изменения, отделенный от чужих view"""
+        bucket = index.get(value)
+        if bucket is None:
+            bucket = index[value] = {}
+        elif value not in own_keys:
+            bucket = index[value] = dict(bucket)
+        own_keys.add(value)
+        return bucket
+
+    def _index_order(self, key, order):
+        # dict вместо set, чтобы сохранить порядок создания заказов
+        self._bucket(self.by_user, self._own_user_keys, order.get('user_id'))[key] = None
+        self._bucket(self.by_status, self._own_status_keys, order.get('status'))[key] = None
+        if int(key) > self.max_order_id:
+            self.max_order_id = int(key)
+
+    def _unindex_order(self, key, order):
+        if order.get('user_id') in self.by_user:
+            self._bucket(self.by_user, self._own_user_keys, order.get('user_id')).pop(key, None)
+        if order.get('status') in self.by_status:
+            self._bucket(self.by_status, self._own_status_keys, order.get('status')).pop(key, None)
+
+    def _apply(self, entry):
+        key = str(entry['key'])
+        old = self._data.get(key)
+        if old is not None:
+            self._unindex_order(key, old)
+        if entry['op'] == 'put':
+            self._data[key] = entry['value']
+            self._index_order(key, entry['value'])
+        elif entry['op'] == 'delete':
+            self._data.pop(key, None)
+
+    def _before_compact(self):
+        """Переносит завершенные заказы прошлых месяцев в архив
+
+        Если процесс упадет между записью архива и снимка, заказ окажется
+        в обоих местах - при чтении живая копия имеет приоритет, а следующая
+        компакция перезапишет архивную.
+        """
+        current_month = datetime.now().strftime('%Y-%m')
+        closed = [self._data[k] for status in ARCHIVE_STATUSES
+                  for k in self.by_status.get(status, ())
+                  if order_month(self._data[k]) < current_month]
+        if not closed:
+            return
+        with web_metrics.timed('db.archive_orders'):
+            self.archive.add(closed)
+        for order in closed:
+            self._apply({'op': 'delete', 'table': 'orders', 'key': order['id']})
+
+
+class JsonStore:
+    """Хранилище в JSON файлах: каталог, пользователи и заказы - отдельные части
+
+    simple_db.json -> simple_db.catalog.json, simple_db.users.json,
+    simple_db.orders.json, у каждой свой журнал, блокировка и версия.
+    Чтение каталога сверяет с диском и разбирает только файлы каталога,
+    поэтому главная страница не зависит от количества заказов.
+    """
+
+    def __init__(self, path, default_factory, compact_every=JOURNAL_COMPACT_EVERY, serializer=None):
+        self.path = path
+        self.default_factory = default_factory
+        serializer = web_serializers.get_serializer(serializer or DB_FORMAT)
+        base = self.base_path(path)
+        self.seq_path = f"{base}.orders.seq"
+        self.archive = OrderArchive(f"{base}.orders.archive")
+        self.catalog = CatalogUnit('catalog', f"{base}.catalog.json",
+                                   lambda: self.default_factory()['ties'], compact_every, serializer)
+        self.users = UsersUnit('users', f"{base}.users.json",
+                               lambda: self.default_factory()['users'], compact_every, serializer)
+        self.orders = OrdersUnit('orders', f"{base}.orders.json",
+                                 lambda: self.default_factory()['orders'], self.archive, compact_every, serializer)
+        self.units = {'catalog': self.catalog, 'users': self.users, 'orders': self.orders}
+        self._lock = threading.RLock()
+        self._migrate_legacy()
+
+    @staticmethod
+    def base_path(path):
+        return os.path.splitext(path)[0]
+
+    @classmethod
+    def exists(cls, path):
+        """Есть ли на диске база (в старом едином файле или по частям)"""
+        base = cls.base_path(path)
+        return any(os.path.exists(p) for p in (path, f"{base}.catalog.json", f"{base}.orders.json"))
+
+    def _migrate_legacy(self):
+        """Раскладывает базу старого формата (единый simple_db.json) по частям
+
+        Старые файлы переименовываются в *.migrated, поэтому перенос
+        выполняется один раз; остальные процессы ждут его на flock.
+        """
+        legacy_journal = self.path + '.journal'
+        legacy_seq = self.path + '.seq'
+        legacy_archive = self.path + '.archive'
+        legacy = (self.path, legacy_journal, legacy_seq, legacy_archive)
+        if not any(os.path.exists(p) for p in legacy):
+            return
+        lock_fd = os.open(self.path + '.lock', os.O_RDWR | os.O_CREAT, 0o644) if fcntl else None
+        try:
+            if lock_fd is not None:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            if os.path.exists(legacy_seq) and not os.path.exists(self.seq_path):
+                os.replace(legacy_seq, self.seq_path)
+            if os.path.isdir(legacy_archive) and not os.path.exists(self.archive.directory):
+                os.replace(legacy_archive, self.archive.directory)
+            if not (os.path.exists(self.path) or os.path.exists(legacy_journal)):
+                return
+
+            data = self._read_legacy_snapshot()
+            for unit in self.units.values():
+                unit._data = data[unit.table]
+                unit._rebuild_indexes()
+            if os.path.exists(legacy_journal):
+                with open(legacy_journal, 'rb') as f:
+                    for raw in f:
+                        try:
+                            entry = json.loads(raw.decode('utf-8'))
+                        except ValueError:
+                            continue
+                        self.units[self._unit_name(entry['table'])]._apply(entry)
+            for unit in self.units.values():
+                unit.compact(unit._data)
+
+            for p in (self.path, legacy_journal):
+                if os.path.exists(p):
+                    os.replace(p, p + '.migrated')
+            logger.info(f"Migrated {self.path} into separate catalog/users/orders files")
+        finally:
+            if lock_fd is not None:
+                os.close(lock_fd)
+
+    def _read_legacy_snapshot(self):
+        """Старый снимок или его последняя целая резервная копия"""
+        candidates = [self.path] + [f"{self.path}.{n}" for n in range(1, SNAPSHOT_BACKUPS + 1)]
+        for path in candidates:
+            if not os.path.exists(path):
+                continue
+            try:
+                with open(path, 'rb') as f:
+                    return web_serializers.load_any(f.read())
+            except Exception as e:
+                logger.error(f"Error loading legacy database {path}: {e}")
+        return self.default_factory()
+
+    @staticmethod
+    def _unit_name(table):
+        return 'catalog' if table == 'ties' else table
+
+    def version(self, unit):
+        """Версия части базы ('catalog', 'users', 'orders') - для кэшей и ETag"""
+        return self.units[unit].version()
+
+    def compact(self):
+        for unit in self.units.values():
+            unit.compact()
+
+    def full_snapshot(self):
+        """Вся база вместе с архивными заказами (для export и переноса в SQLite)"""
+        return {
+            'users': dict(self.users.view().data),
+            'orders': {str(o['id']): o for o in self.list_orders()},
+            'ties': self.list_ties()
+        }
+
+    def last_order_id(self):
+        """Последний выданный номер заказа: счетчик, живые и архивные заказы"""
+        try:
+            with open(self.seq_path, 'rb') as f:
+                raw = f.read(32).strip()
+        except FileNotFoundError:
+            raw = b''
+        self.orders.current()
+        return max(int(raw) if raw else 0, self.orders.max_order_id, self.archive.max_order_id())
+
+    def export(self, path, serializer='pretty'):
+        """Выгружает всю базу (с архивом) одним файлом, по умолчанию JSON с отступами"""
+        write_atomic(path, web_serializers.get_serializer(serializer).dumps(self.full_snapshot()))
+        logger.info(f"Database exported into {path}")
+
+    def close(self):
+        for unit in self.units.values():
+            unit.close()
+
+    # --- Область запроса ---
+
+    def begin_request(self):
+        """Все чтения потока до end_request видят одну версию каждой части
+
+        Часть сверяется с диском при первом обращении к ней, дальше чтения
+        не делают ни stat, ни разбора файлов.
+        """
+        for unit in self.units.values():
+            unit.begin_scope()
+
+    def end_request(self):
+        for unit in self.units.values():
+            unit.end_scope()
+
+    def refresh(self, table):
+        """Снова сверить часть с диском (после взятия блокировки "прочитать - изменить - записать")"""
+        self.units[self._unit_name(table)].refresh()
+
+    # --- Чтение (без разбора файлов, только stat нужной части) ---
+
+    def snapshot(self):
+        """Резидентные данные целиком (без архивных заказов). Изменять напрямую нельзя"""
+        return {
+            'users': self.users.view().data,
+            'orders': self.orders.view().data,
+            'ties': self.catalog.view().data
+        }
+
+    def get_user(self, user_id):
+        return self.users.view().data.get(str(user_id))
+
+    def get_tie(self, tie_id):
+        return self.catalog.view().by_id.get(tie_id)
+
+    def list_ties(self, active_only=False):
+        ties = self.catalog.view().data
+        if active_only:
+            return [t for t in ties if t.get('active', True)]
+        return list(ties)
+
+    def catalog_stats(self):
+        """Счетчики каталога без обхода галстуков: всего, активных, средняя цена"""
+        stats = dict(self.catalog.view().stats)
+        stats['avg_price'] = stats['price_sum'] / stats['total'] if stats['total'] else 0
+        return stats
+
+    def query_ties(self, status=None, min_price=None, max_price=None, sort='position', descending=False,
+                   offset=0, limit=None):
+        """Страница каталога с фильтрами и сортировкой; возвращает (галстуки, всего найдено)"""
+        ties = [t for t in self.catalog.view().data if _tie_matches(t, status, min_price, max_price)]
+        if sort in TIE_SORTS:
+            ties.sort(key=lambda t: _tie_sort_key(t, TIE_SORTS[sort]))
+        if descending:
+            ties.reverse()
+        end = None if limit is None else offset + limit
+        return ties[offset:end], len(ties)
+
+    # Заказы: живые из памяти + архивные сегменты. Живая копия заказа
+    # важнее архивной (см. OrdersUnit._before_compact)
+
+    @staticmethod
+    def _merge_orders(live, archived):
+        live_ids = {o['id'] for o in live}
+        return [o for o in archived if o['id'] not in live_ids] + live
+
+    def get_order(self, order_id):
+        order = self.orders.view().data.get(str(order_id))
+        if order is None:
+            order = self.archive.get_order(order_id)
+        return order
+
+    def list_orders(self):
+        """Полная история заказов, включая архив"""
+        live = list(self.orders.view().data.values())
+        return self._merge_orders(live, list(self.archive.iter_orders()))
+
+    def count_orders(self):
+        return len(self.orders.view().data) + self.archive.count()
+
+    def recent_orders(self, limit):
+        """Последние limit заказов в порядке создания"""
+        orders = self.orders.view().data
+        recent = list(itertools.islice(reversed(orders.values()), limit))
+        if len(recent) < limit:
+            live_ids = set(orders)
+            archived = (o for o in self.archive.iter_orders(newest_first=True) if str(o['id']) not in live_ids)
+            recent.extend(itertools.islice(archived, limit - len(recent)))
+        recent.reverse()
+        return recent
+
+    def user_orders(self, user_id):
+        view = self.orders.view()
+        live = [view.data[k] for k in view.by_user.get(user_id, ())]
+        return self._merge_orders(live, self.archive.user_orders(user_id))
+
+    def orders_by_status(self, status):
+        view = self.orders.view()
+        live = [view.data[k] for k in view.by_status.get(status, ())]
+        if status not in ARCHIVE_STATUSES:
+            return live
+        return self._merge_orders(live, self.archive.orders_by_status(status))
+
+    def count_orders_by_status(self, status):
+        return len(self.orders.view().by_status.get(status, ())) + self.archive.count_by_status(status)
+
+    # --- Изменения ---
+
+    def next_order_id(self):
+        """Выдает новый номер заказа, уникальный для всех процессов
+
+        Счетчик лежит в simple_db.orders.seq и меняется под exclusive flock.
+        Если файл счетчика потерян, отсчет продолжается от максимального
+        номера заказа в базе, так что номера не повторяются.
+        """
+        with self._lock, web_metrics.timed('db.next_order_id'):
+            if fcntl is None:
+                self.orders.current()
+                return max(self.orders.max_order_id, self.archive.max_order_id()) + 1
+            fd = os.open(self.seq_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                raw = os.read(fd, 32).strip()
+                self.orders.current()
+                order_id = max(int(raw) if raw else 0, self.orders.max_order_id, self.archive.max_order_id()) + 1
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.ftruncate(fd, 0)
+                os.write(fd, str(order_id).encode())
+                if JOURNAL_FSYNC:
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+            return order_id
+
+    def put_user(self, user):
+        self.users.write({'op': 'put', 'table': 'users', 'key': user['id'], 'value': user})
+        return user
+
+    def put_tie(self, tie):
+        self.catalog.write({'op': 'put', 'table': 'ties', 'key': tie['id'], 'value': tie})
+        return tie
+
+    def delete_tie(self, tie_id):
+        self.catalog.write({'op': 'delete', 'table': 'ties', 'key': tie_id})
+
+    def put_order(self, order):
+        self.orders.write({'op': 'put', 'table': 'orders', 'key': order['id'], 'value': order})
+        return order
+
+    def replace(self, data):
+        """Полная замена данных (старый интерфейс save_db), часть за частью"""
+        for unit in self.units.values():
+            unit.compact(data[unit.table])
+
+
+# Колонки таблиц SQLite в порядке, совпадающем с полями JSON базы. Они нужны
+# для фильтров, сортировки и индексов; сама запись целиком (со всеми полями
+# и их типами) лежит в колонке data, поэтому оба движка возвращают одно и то же
+USER_COLUMNS = ['id', 'name', 'phone', 'is_admin', 'username', 'first_name', 'last_name', 'created_at']
+ORDER_COLUMNS = ['id', 'tie_id', 'tie_name', 'price', 'recipient_name', 'recipient_surname',
+                 'recipient_phone', 'delivery_address', 'user_id', 'status', 'created_at']
+TIE_COLUMNS = ['id', 'name_ru', 'name_kz', 'name_en', 'color_ru', 'color_kz', 'color_en',
+               'description_ru', 'description_kz', 'description_en',
+               'material_ru', 'material_kz', 'material_en', 'price', 'image_path', 'active']
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    name VARCHAR(100),
+    phone VARCHAR(50),
+    is_admin BOOLEAN,
+    username VARCHAR(100),
+    first_name VARCHAR(100),
+    last_name VARCHAR(100),
+    created_at DATETIME,
+    data TEXT
+);
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY,
+    tie_id INTEGER,
+    tie_name VARCHAR(200),
+    price NUMERIC,
+    recipient_name VARCHAR(100),
+    recipient_surname VARCHAR(100),
+    recipient_phone VARCHAR(50),
+    delivery_address TEXT,
+    user_id INTEGER,
+    status VARCHAR(50),
+    created_at DATETIME,
+    data TEXT
+);
+CREATE TABLE IF NOT EXISTS ties (
+    id INTEGER PRIMARY KEY,
+    name_ru VARCHAR(200) NOT NULL,
+    name_kz VARCHAR(200),
+    name_en VARCHAR(200),
+    color_ru VARCHAR(100),
+    color_kz VARCHAR(100),
+    color_en VARCHAR(100),
+    description_ru TEXT,
+    description_kz TEXT,
+    description_en TEXT,
+    material_ru VARCHAR(100),
+    material_kz VARCHAR(100),
+    material_en VARCHAR(100),
+    price NUMERIC NOT NULL,
+    image_path VARCHAR(500),
+    active BOOLEAN,
+    position INTEGER,
+    data TEXT
+);
+CREATE TABLE IF NOT EXISTS sequences (
+    name VARCHAR(50) PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_orders_user_id ON orders (user_id);
+CREATE INDEX IF NOT EXISTS ix_orders_status ON orders (status);
+CREATE INDEX IF NOT EXISTS ix_ties_active ON ties (active);
+CREATE INDEX IF NOT EXISTS ix_ties_price ON ties (price);
+"""
+
+# Колонки, добавленные после первой версии схемы: (таблица, колонка, тип)
+SQLITE_ADDED_COLUMNS = [
+    ('users', 'data', 'TEXT'),
+    ('orders', 'data', 'TEXT'),
+    ('ties', 'data', 'TEXT'),
+    ('ties', 'position', 'INTEGER')
+]
+
+
+def _number(value):
+    """15000.0 -> 15000: колонки FLOAT старой схемы возвращают целые цены дробными"""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+class SqliteStore:
+    """Хранилище в SQLite с тем же набором методов, что и JsonStore"""
+
+    def __init__(self, path, default_factory, seed_path=None):
+        self.path = path
+        self.default_factory = default_factory
+        self.seed_path = seed_path
+        self._local = threading.local()
+        self._init_db()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        """Создает схему и при первом запуске переносит данные из JSON базы"""
+        conn = self._conn()
+        conn.executescript(SQLITE_SCHEMA)
+        with conn:
+            for table, column, column_type in SQLITE_ADDED_COLUMNS:
+                if column not in {r['name'] for r in conn.execute(f"PRAGMA table_info({table})")}:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+            # Галстуки из базы без колонки position стояли в порядке rowid
+            conn.execute('UPDATE ties SET position = rowid WHERE position IS NULL')
+            # epoch в версиях, чтобы пересозданная база не повторила старые версии
+            conn.execute("INSERT OR IGNORE INTO sequences (name, value) VALUES ('epoch', ?)",
+                         (int.from_bytes(os.urandom(4), 'big'),))
+        # Начальные данные записываются один раз - это отмечает строка 'seeded'.
+        # Пустые таблицы признаком первого запуска не считаются: админ мог
+        # удалить все галстуки, и база не должна заполниться заново.
+        # BEGIN IMMEDIATE - чтобы воркеры, стартующие одновременно, не заполнили ее дважды
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if not conn.execute("SELECT 1 FROM sequences WHERE name = 'seeded'").fetchone():
+                # База без отметки, но с данными - создана до ее появления
+                if not any(conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone()
+                           for table in ('users', 'orders', 'ties')):
+                    self._seed(conn)
+                conn.execute("INSERT INTO sequences (name, value) VALUES ('seeded', 1)")
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _seed(self, conn):
+        """Заполняет пустую базу из JSON базы (если она есть) или значениями по умолчанию"""
+        if not (self.seed_path and JsonStore.exists(self.seed_path)):
+            self._insert_all(conn, self.default_factory())
+            return
+        logger.info(f"Importing {self.seed_path} into {self.path}")
+        seed = JsonStore(self.seed_path, self.default_factory)
+        try:
+            # Архивные заказы тоже переносятся, а счетчик продолжается с последнего
+            # выданного номера, иначе новые заказы получили бы номера архивных
+            self._insert_all(conn, seed.full_snapshot())
+            last_order_id = seed.last_order_id()
+        finally:
+            seed.close()
+        conn.execute("INSERT OR REPLACE INTO sequences (name, value) VALUES ('orders', ?)", (last_order_id,))
+
+    # --- Преобразование строк ---
+
+    # Строки без data записаны до появления этой колонки - собираем запись из колонок
+
+    @staticmethod
+    def _user(row):
+        if row is None:
+            return None
+        if row['data'] is not None:
+            return json.loads(row['data'])
+        # У пользователей разный набор полей (вход через сайт и через бота)
+        user = {k: row[k] for k in USER_COLUMNS if row[k] is not None}
+        if 'is_admin' in user:
+            user['is_admin'] = bool(user['is_admin'])
+        return user
+
+    @staticmethod
+    def _order(row):
+        if row is None:
+            return None
+        if row['data'] is not None:
+            return json.loads(row['data'])
+        order = {k: row[k] for k in ORDER_COLUMNS}
+        order['price'] = _number(order['price'])
+        return order
+
+    @staticmethod
+    def _tie(row):
+        if row is None:
+            return None
+        if row['data'] is not None:
+            return json.loads(row['data'])
+        tie = {k: row[k] for k in TIE_COLUMNS}
+        tie['active'] = bool(tie['active'])
+        tie['price'] = _number(tie['price'])
+        return tie
+
+    @staticmethod
+    def _values(columns, record):
+        return [record.get(c) for c in columns] + [json.dumps(record, ensure_ascii=False)]
+
+    def _upsert(self, conn, table, columns, record, **extra):
+        """INSERT OR REPLACE колонок columns и записи целиком в data; extra - служебные колонки"""
+        names = columns + ['data'] + list(extra)
+        placeholders = ', '.join('?' for _ in names)
+        conn.execute(f"INSERT OR REPLACE INTO {table} ({', '.join(names)}) VALUES ({placeholders})",
+                     self._values(columns, record) + list(extra.values()))
+
+    # --- Область запроса ---
+    # Каждый запрос к SQLite и так читает согласованный снимок без разбора
+    # файлов; держать транзакцию чтения на весь HTTP запрос нельзя - она
+    # мешала бы последующей записи (SQLITE_BUSY_SNAPSHOT в режиме WAL)
+
+    def begin_request(self):
+        pass
+
+    def end_request(self):
+        pass
+
+    def refresh(self, table):
+        pass
+
+    # --- Чтение ---
+
+    def snapshot(self):
+        """Материализует всю базу в формате JSON хранилища (для старого load_db)"""
+        conn = self._conn()
+        return {
+            'users': {str(r['id']): self._user(r) for r in conn.execute('SELECT * FROM users')},
+            'orders': {str(r['id']): self._order(r) for r in conn.execute('SELECT * FROM orders ORDER BY id')},
+            'ties': self.list_ties()
+        }
+
+    def get_user(self, user_id):
+        row = self._conn().execute('SELECT * FROM users WHERE id = ?', (int(user_id),)).fetchone()
+        return self._user(row)
+
+    def get_tie(self, tie_id):
+        row = self._conn().execute('SELECT * FROM ties WHERE id = ?', (tie_id,)).fetchone()
+        return self._tie(row)
+
+    def list_ties(self, active_only=False):
+        if active_only:
+            rows = self._conn().execute('SELECT * FROM ties WHERE active = 1 ORDER BY position, id')
+        else:
+            rows = self._conn().execute('SELECT * FROM ties ORDER BY position, id')
+        return [self._tie(r) for r in rows]
+
+    def catalog_stats(self):
+        row = self._conn().execute('SELECT COUNT(*), COALESCE(SUM(active), 0), COALESCE(SUM(price), 0) '
+                                   'FROM ties').fetchone()
+        total, active, price_sum = row[0], row[1], _number(row[2])
+        return {'total': total, 'active': active, 'price_sum': price_sum,
+                'avg_price': price_sum / total if total else 0}
+
+    def query_ties(self, status=None, min_price=None, max_price=None, sort='position', descending=False,
+                   offset=0, limit=None):
+        where, params = [], []
+        if status == 'active':
+            where.append('active = 1')
+        elif status == 'inactive':
+            where.append('active = 0')
+        if min_price is not None:
+            where.append('price >= ?')
+            params.append(min_price)
+        if max_price is not None:
+            where.append('price <= ?')
+            params.append(max_price)
+        clause = f" WHERE {' AND '.join(where)}" if where else ''
+        order = TIE_SORTS.get(sort, 'position')
+        direction = 'DESC' if descending else 'ASC'
+        conn = self._conn()
+        total = conn.execute(f"SELECT COUNT(*) FROM ties{clause}", params).fetchone()[0]
+        rows = conn.execute(f"SELECT * FROM ties{clause} ORDER BY {order} {direction}, id {direction} "
+                            f"LIMIT ? OFFSET ?", params + [-1 if limit is None else limit, offset])
+        return [self._tie(r) for r in rows], total
+
+    def get_order(self, order_id):
+        row = self._conn().execute('SELECT * FROM orders WHERE id = ?', (int(order_id),)).fetchone()
+        return self._order(row)
+
+    def list_orders(self):
+        return [self._order(r) for r in self._conn().execute('SELECT * FROM orders ORDER BY id')]
+
+    def count_orders(self):
+        return self._conn().execute('SELECT COUNT(*) FROM orders').fetchone()[0]
+
+    def recent_orders(self, limit):
+        rows = self._conn().execute('SELECT * FROM orders ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+        return [self._order(r) for r in reversed(rows)]
+
+    def orders_by_status(self, status):
+        rows = self._conn().execute('SELECT * FROM orders WHERE status = ? ORDER BY id', (status,))
+        return [self._order(r) for r in rows]
+
+    def count_orders_by_status(self, status):
+        return self._conn().execute('SELECT COUNT(*) FROM orders WHERE status = ?', (status,)).fetchone()[0]
+
+    def user_orders(self, user_id):
+        rows = self._conn().execute('SELECT * FROM orders WHERE user_id = ? ORDER BY id', (user_id,))
+        return [self._order(r) for r in rows]
+
+    def version(self, unit):
+        """Версия части базы ('catalog', 'users', 'orders') - для кэшей и ETag"""
+        rows = self._conn().execute("SELECT name, value FROM sequences WHERE name IN ('epoch', ?)",
+                                    (f"version.{unit}",))
+        values = {name: value for name, value in rows}
+        return f"{values.get('epoch', 0):x}.{values.get(f'version.{unit}', 0)}"
+
+    # --- Изменения ---
+
+    @staticmethod
+    def _bump_version(conn, unit):
+        """Увеличивает версию части в той же транзакции, что и изменение"""
+        name = f"version.{unit}"
+        conn.execute('INSERT OR IGNORE INTO sequences (name, value) VALUES (?, 0)', (name,))
+        conn.execute('UPDATE sequences SET value = value + 1 WHERE name = ?', (name,))
+
+    def next_order_id(self):
+        """Выдает новый номер заказа в транзакции BEGIN IMMEDIATE"""
+        conn = self._conn()
+        with web_metrics.timed('db.next_order_id'):
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute("SELECT value FROM sequences WHERE name = 'orders'").fetchone()
+                max_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM orders').fetchone()[0]
+                order_id = max(row[0] if row else 0, max_id) + 1
+                conn.execute("INSERT OR REPLACE INTO sequences (name, value) VALUES ('orders', ?)", (order_id,))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return order_id
+
+    def put_user(self, user):
+        with web_metrics.timed('db.write.users'), self._conn() as conn:
+            self._upsert(conn, 'users', USER_COLUMNS, user)
+            self._bump_version(conn, 'users')
+        return user
+
+    def put_tie(self, tie):
+        conn = self._conn()
+        with web_metrics.timed('db.write.ties'), conn:
+            # UPDATE не трогает position: измененный галстук остается на своем месте,
+            # новый встает в конец каталога
+            columns = TIE_COLUMNS[1:]
+            cur = conn.execute(f"UPDATE ties SET {', '.join(c + ' = ?' for c in columns + ['data'])} WHERE id = ?",
+                               self._values(columns, tie) + [tie['id']])
+            if cur.rowcount == 0:
+                position = conn.execute('SELECT COALESCE(MAX(position), 0) + 1 FROM ties').fetchone()[0]
+                self._upsert(conn, 'ties', TIE_COLUMNS, tie, position=position)
+            self._bump_version(conn, 'catalog')
+        return tie
+
+    def delete_tie(self, tie_id):
+        with web_metrics.timed('db.write.ties'), self._conn() as conn:
+            conn.execute('DELETE FROM ties WHERE id = ?', (tie_id,))
+            self._bump_version(conn, 'catalog')
+
+    def put_order(self, order):
+        with web_metrics.timed('db.write.orders'), self._conn() as conn:
+            self._upsert(conn, 'orders', ORDER_COLUMNS, order)
+            self._bump_version(conn, 'orders')
+        return order
+
+    def replace(self, data):
+        """Полная замена данных (старый интерфейс save_db)"""
+        with self._conn() as conn:
+            conn.execute('DELETE FROM users')
+            conn.execute('DELETE FROM orders')
+            conn.execute('DELETE FROM ties')
+            self._insert_all(conn, data)
+
+    def _insert_all(self, conn, data):
+        """Записывает все данные в текущей транзакции conn (таблицы уже пусты)"""
+        for user in data['users'].values():
+            self._upsert(conn, 'users', USER_COLUMNS, user)
+        for order in data['orders'].values():
+            self._upsert(conn, 'orders', ORDER_COLUMNS, order)
+        for position, tie in enumerate(data['ties'], 1):
+            self._upsert(conn, 'ties', TIE_COLUMNS, tie, position=position)
+        for unit in ('catalog', 'users', 'orders'):
+            self._bump_version(conn, unit)
+
+    def export(self, path, serializer='pretty'):
+        """Выгружает всю базу одним файлом в формате JSON хранилища"""
+        write_atomic(path, web_serializers.get_serializer(serializer).dumps(self.snapshot()))
+        logger.info(f"Database exported into {path}")
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def create_store(path, default_factory):
+    """Создает хранилище выбранного движка и регистрирует его закрытие при выходе"""
+    if STORAGE_BACKEND == 'sqlite':
+        store = SqliteStore(SQLITE_PATH, default_factory, seed_path=path)
+    elif STORAGE_BACKEND == 'json':
+        store = JsonStore(path, default_factory)
+    else:
+        raise ValueError(f"Unknown WEB_STORAGE_BACKEND: {STORAGE_BACKEND}")
+    logger.info(f"Using {STORAGE_BACKEND} storage backend")
+    atexit.register(store.close)
+    return store